@@ -0,0 +1,6 @@
+# -*- coding: utf-8 -*-
+
+"""Benchmark suite for the cms_ml parsers, transformations and aggregations.
+
+Run it with ``python -m benchmark``, see ``python -m benchmark --help``.
+"""
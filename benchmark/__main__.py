@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+
+"""Command line interface of the benchmark suite."""
+
+import argparse
+import logging
+import os
+import sys
+
+from benchmark.benchmark import (
+    CASES, DEFAULT_SIZES, compare, load_results, run_benchmark, save_results)
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), 'baseline.json')
+
+
+def _get_parser():
+    parser = argparse.ArgumentParser(description='Benchmark the cms_ml functions.')
+    parser.add_argument('-c', '--cases', nargs='+', choices=list(CASES),
+                        help='Cases to run. Defaults to all of them.')
+    parser.add_argument('-r', '--readings', type=int, default=DEFAULT_SIZES['readings'],
+                        help='Number of spectra.')
+    parser.add_argument('-l', '--length', type=int, default=DEFAULT_SIZES['length'],
+                        help='Number of values of each spectrum.')
+    parser.add_argument('-b', '--bands', type=int, default=DEFAULT_SIZES['bands'],
+                        help='Number of bands of the band aggregations.')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='Timed runs of each case. The fastest one is reported.')
+    parser.add_argument('-o', '--output', default='benchmark_results.json',
+                        help='Path of the results file.')
+    parser.add_argument('--baseline', default=BASELINE_PATH,
+                        help='Path of the baseline results to compare against.')
+    parser.add_argument('-t', '--tolerance', type=float, default=0.3,
+                        help='Relative change allowed before flagging a regression.')
+    parser.add_argument('--save-baseline', action='store_true',
+                        help='Store the results as the new baseline.')
+    parser.add_argument('-v', '--verbose', action='store_true')
+
+    return parser
+
+
+def main():
+    args = _get_parser().parse_args()
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING)
+
+    results = run_benchmark(args.cases, args.repeat, readings=args.readings,
+                            length=args.length, bands=args.bands)
+    save_results(results, args.output)
+    if args.save_baseline:
+        save_results(results, args.baseline)
+
+    print('Results stored in {}'.format(args.output))
+    for name, result in results['results'].items():
+        print('{:<20} {:>12.1f} spectra/s {:>10.2f} MB/s {:>10.2f} MB peak'.format(
+            name, result['spectra_per_second'], result['mb_per_second'],
+            result['peak_memory_mb']))
+
+    if args.save_baseline or not os.path.isfile(args.baseline):
+        return
+
+    comparison = compare(results, load_results(args.baseline), args.tolerance)
+    regressions = comparison[comparison['regression']]
+    if len(regressions):
+        print('\nRegressions against {}:'.format(args.baseline))
+        print(regressions.to_string(index=False))
+        sys.exit(1)
+
+    print('\nNo regressions against {}'.format(args.baseline))
+
+
+if __name__ == '__main__':
+    main()
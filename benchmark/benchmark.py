@@ -0,0 +1,307 @@
+# -*- coding: utf-8 -*-
+
+"""Time the cms_ml parsers, transformations and aggregations over synthetic data."""
+
+import json
+import logging
+import os
+import platform
+import tempfile
+import time
+import tracemalloc
+import warnings
+
+import numpy as np
+import pandas as pd
+
+import cms_ml
+from benchmark import synthetic
+from cms_ml.aggregations.amplitude import band
+from cms_ml.parsers.cms_jsons import extract_cms_jsons
+from cms_ml.parsers.cms_med_classes import MEDData
+from cms_ml.parsers.cms_text import parse_cms_txt
+from cms_ml.transformations.amplitude.order_track import shift_frequency
+from cms_ml.transformations.frequency.envelopespectrum import envelopespectrum
+from cms_ml.utils import load_fft_csv
+
+LOGGER = logging.getLogger(__name__)
+
+MB = 1024 ** 2
+DEFAULT_SIZES = {
+    'readings': 200,
+    'length': 2048,
+    'bands': 20,
+}
+METRICS = ('spectra_per_second', 'mb_per_second', 'peak_memory_mb')
+MEMORY_SLACK_MB = 1.
+
+
+def _size(path):
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+
+    return sum(
+        os.path.getsize(os.path.join(folder, filename))
+        for folder, _, filenames in os.walk(path)
+        for filename in filenames
+    )
+
+
+def _load_fft_csv(workdir, readings, length, bands):
+    path = os.path.join(workdir, 'fft.csv')
+    synthetic.write_fft_csv(path, readings, length)
+    return (lambda: load_fft_csv(path, cache=False)), readings, _size(path)
+
+
+def _load_fft_csv_batch(workdir, readings, length, bands):
+    path = os.path.join(workdir, 'fft.csv')
+    synthetic.write_fft_csv(path, readings, length)
+    return (lambda: load_fft_csv(path, batch=True, cache=False)), readings, _size(path)
+
+
+def _load_fft_csv_cached(workdir, readings, length, bands):
+    path = os.path.join(workdir, 'fft.csv')
+    synthetic.write_fft_csv(path, readings, length)
+    load_fft_csv(path, batch=True)
+    return (lambda: load_fft_csv(path, batch=True)), readings, _size(path)
+
+
+def _extract_cms_jsons(workdir, readings, length, bands):
+    path = os.path.join(workdir, 'jsons')
+    synthetic.write_cms_jsons(path, readings, length)
+    return (lambda: extract_cms_jsons(path)), readings, _size(path)
+
+
+def _parse_cms_txt(workdir, readings, length, bands):
+    path = os.path.join(workdir, 'cms.txt')
+    synthetic.write_cms_txt(path, readings, length)
+    return (lambda: parse_cms_txt(path)), readings, _size(path)
+
+
+def _med_data(workdir, readings, length, bands):
+    path = os.path.join(workdir, 'cms.med')
+    sensors = 2
+    synthetic.write_med(path, readings, length, sensors=sensors)
+    spectra = 3 * sensors * max(readings // sensors, 1)   # three FFT blocks per observation
+    return (lambda: MEDData(path).to_dataframe()), spectra, _size(path)
+
+
+def _band_function(function, side_bands=False):
+    def setup(workdir, readings, length, bands):
+        spectra = synthetic.get_spectra(readings, length)
+        frequency_values = synthetic.get_frequency_values(length)
+        band_edges = synthetic.get_bands(bands)
+        width = band_edges[0][1] - band_edges[0][0]
+        args = [
+            (low, high, [(low - width, low), (high, high + width)]) if side_bands else (low, high)
+            for low, high in band_edges
+        ]
+
+        def run():
+            for amplitude_values in spectra:
+                for band_args in args:
+                    function(amplitude_values, frequency_values, *band_args)
+
+        return run, readings, spectra.nbytes
+
+    return setup
+
+
+def _band_statistics(workdir, readings, length, bands):
+    spectra = synthetic.get_spectra(readings, length)
+    frequency_values = synthetic.get_frequency_values(length)
+    band_edges = synthetic.get_bands(bands)
+
+    def run():
+        band.band_statistics(spectra, frequency_values, band_edges)
+
+    return run, readings, spectra.nbytes
+
+
+def _shift_frequency(workdir, readings, length, bands):
+    spectra = synthetic.get_spectra(readings, length)
+    rpms = np.linspace(1000, 1800, readings)
+
+    def run():
+        for amplitude_values, rpm in zip(spectra, rpms):
+            shift_frequency(amplitude_values, 0.5, rpm, 1500)
+
+    return run, readings, spectra.nbytes
+
+
+def _envelopespectrum(workdir, readings, length, bands):
+    waveforms = synthetic.get_spectra(readings, length)
+
+    def run():
+        for amplitude_values in waveforms:
+            envelopespectrum(amplitude_values, 2000.)
+
+    return run, readings, waveforms.nbytes
+
+
+CASES = {
+    'load_fft_csv': _load_fft_csv,
+    'load_fft_csv_batch': _load_fft_csv_batch,
+    'load_fft_csv_cached': _load_fft_csv_cached,
+    'extract_cms_jsons': _extract_cms_jsons,
+    'parse_cms_txt': _parse_cms_txt,
+    'MEDData': _med_data,
+    'band_mean': _band_function(band.band_mean),
+    'band_max': _band_function(band.band_max),
+    'band_min': _band_function(band.band_min),
+    'band_rms': _band_function(band.band_rms),
+    'band_sum': _band_function(band.band_sum),
+    'band_sideband_rms': _band_function(band.band_sideband_rms, side_bands=True),
+    'band_sideband_pr': _band_function(band.band_sideband_pr, side_bands=True),
+    'band_statistics': _band_statistics,
+    'shift_frequency': _shift_frequency,
+    'envelopespectrum': _envelopespectrum,
+}
+
+
+def _measure(function, repeat):
+    """Get the best time out of ``repeat`` runs and the peak memory of one more run."""
+    times = list()
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    try:
+        function()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return min(times), peak
+
+
+def get_environment():
+    """Get the versions of the software the benchmark runs on."""
+    return {
+        'cms_ml': cms_ml.__version__,
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+        'platform': platform.platform(),
+        'processor': platform.processor() or platform.machine(),
+    }
+
+
+def run_benchmark(cases=None, repeat=3, **sizes):
+    """Run the benchmark cases over synthetic data.
+
+    Args:
+        cases (list, optional):
+            Names of the cases to run, from ``CASES``. If None, run all of them.
+            Default is None.
+        repeat (int):
+            Number of timed runs of each case. The fastest one is reported.
+            Defaults to 3.
+        **sizes:
+            ``readings``, the number of spectra, ``length``, the number of values of
+            each spectrum, and ``bands``, the number of bands of the band aggregations.
+            Missing sizes are taken from ``DEFAULT_SIZES``.
+
+    Returns:
+        dict:
+            The ``environment``, the ``sizes`` and the ``results`` of each case,
+            with its time in ``seconds``, ``spectra_per_second``, ``mb_per_second``
+            of input data and ``peak_memory_mb`` of memory allocated.
+    """
+    sizes = dict(DEFAULT_SIZES, **sizes)
+    cases = list(CASES) if cases is None else cases
+    unknown = set(cases) - set(CASES)
+    if unknown:
+        raise ValueError('Unknown benchmark cases {}'.format(sorted(unknown)))
+
+    results = dict()
+    with tempfile.TemporaryDirectory() as workdir, warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        for name in cases:
+            LOGGER.info('Running %s', name)
+            case_dir = os.path.join(workdir, name)
+            os.makedirs(case_dir)
+
+            function, spectra, size = CASES[name](case_dir, **sizes)
+            seconds, peak = _measure(function, repeat)
+            results[name] = {
+                'seconds': seconds,
+                'spectra_per_second': spectra / seconds,
+                'mb_per_second': size / MB / seconds,
+                'peak_memory_mb': peak / MB,
+            }
+
+    return {
+        'environment': get_environment(),
+        'sizes': sizes,
+        'results': results,
+    }
+
+
+def save_results(results, path):
+    """Store the benchmark results as a JSON file."""
+    with open(path, 'w') as results_file:
+        json.dump(results, results_file, indent=2, sort_keys=True)
+
+
+def load_results(path):
+    """Load benchmark results stored with ``save_results``."""
+    with open(path) as results_file:
+        return json.load(results_file)
+
+
+def compare(results, baseline, tolerance=0.3):
+    """Compare benchmark results against a baseline.
+
+    A case is flagged as a regression when its throughput drops, or its peak memory
+    grows, by more than ``tolerance`` relative to the baseline. Memory growths below
+    ``MEMORY_SLACK_MB`` are never flagged.
+
+    Args:
+        results (dict):
+            Output of ``run_benchmark``.
+        baseline (dict):
+            Output of ``run_benchmark`` to compare against.
+        tolerance (float):
+            Relative change allowed before flagging a regression. Defaults to 0.3.
+
+    Returns:
+        pd.DataFrame:
+            One row per case and metric found in both inputs, with the ``baseline``
+            and ``current`` values, the relative ``change`` and whether it is a
+            ``regression``.
+    """
+    if results['sizes'] != baseline['sizes']:
+        LOGGER.warning('The baseline was run with different sizes: %s', baseline['sizes'])
+
+    rows = list()
+    for case, current in results['results'].items():
+        reference = baseline['results'].get(case)
+        if reference is None:
+            continue
+
+        for metric in METRICS:
+            if reference[metric]:
+                change = current[metric] / reference[metric] - 1
+            else:
+                change = 0. if current[metric] == reference[metric] else np.inf
+
+            if metric == 'peak_memory_mb':
+                growth = current[metric] - reference[metric]
+                regression = change > tolerance and growth > MEMORY_SLACK_MB
+            else:
+                regression = change < -tolerance
+
+            rows.append({
+                'case': case,
+                'metric': metric,
+                'baseline': reference[metric],
+                'current': current[metric],
+                'change': change,
+                'regression': regression,
+            })
+
+    return pd.DataFrame(rows, columns=[
+        'case', 'metric', 'baseline', 'current', 'change', 'regression'])
@@ -0,0 +1,166 @@
+# -*- coding: utf-8 -*-
+
+"""Synthetic CMS data in the formats read by the cms_ml parsers."""
+
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+START = pd.Timestamp('2020-01-01')
+SIGNALS = ('Bearing', 'Gearbox', 'Generator', 'Shaft')
+
+
+def _timestamps(readings, freq='10min'):
+    return pd.date_range(START, periods=readings, freq=freq)
+
+
+def get_spectra(readings, length, random_state=0):
+    """Build a matrix of random spectra.
+
+    Args:
+        readings (int):
+            Number of spectra.
+        length (int):
+            Number of values in each spectrum.
+        random_state (int):
+            Seed of the random generator.
+
+    Returns:
+        np.ndarray:
+            Matrix of shape ``(readings, length)``.
+    """
+    random = np.random.RandomState(random_state)
+    return random.gamma(2., 0.5, size=(readings, length))
+
+
+def get_frequency_values(length, max_frequency=1000.):
+    """Build a regular frequency axis that ends at ``max_frequency``."""
+    return np.linspace(0, max_frequency, length)
+
+
+def get_bands(bands, max_frequency=1000.):
+    """Build ``bands`` overlapping bands that cover the frequency axis."""
+    width = max_frequency / bands
+    return [(index * width, (index + 1.5) * width) for index in range(bands)]
+
+
+def get_metadata(readings, turbines=2):
+    """Build the ``turbine_id``, ``signal_id`` and ``timestamp`` of each reading."""
+    return pd.DataFrame({
+        'turbine_id': ['T{:03d}'.format(index % turbines) for index in range(readings)],
+        'signal_id': [SIGNALS[index % len(SIGNALS)] for index in range(readings)],
+        'timestamp': _timestamps(readings),
+    })
+
+
+def write_fft_csv(path, readings, length):
+    """Write an FFT csv file as read by ``cms_ml.utils.load_fft_csv``."""
+    data = get_metadata(readings)
+    data['values'] = [json.dumps(row.tolist()) for row in get_spectra(readings, length)]
+    data.to_csv(path, index=False)
+
+
+def _json_entry(signal, timestamp, values):
+    return {
+        'details': {'name': signal, 'sensorName': 'Sensor'},
+        'location': {'turbineName': 'Turbine'},
+        'data': {
+            'context': {
+                'timeStamp': timestamp.isoformat() + '+00:00',
+                'extra': [{'name': 'Mask Status', 'value': ''}],
+                'binningParameters': [{'name': 'ActivePower', 'value': '1733.3'}],
+                'operationalValues': [{'name': 'Measured RPM', 'value': 1451.2}],
+                'condition': 'ActivePower 1657-1909',
+            },
+            'set': [{'yValueUnit': '1', 'yValues': values.tolist()}],
+        },
+    }
+
+
+def write_cms_jsons(path, readings, length, turbines=2, entries_per_file=50):
+    """Write a folder per turbine with CMS JSON files as read by ``extract_cms_jsons``."""
+    metadata = get_metadata(readings, turbines)
+    spectra = get_spectra(readings, length)
+    for turbine_id, group in metadata.groupby('turbine_id'):
+        folder = os.path.join(path, turbine_id)
+        os.makedirs(folder, exist_ok=True)
+        positions = group.index.to_numpy()
+        for start in range(0, len(positions), entries_per_file):
+            entries = [
+                _json_entry(metadata.at[position, 'signal_id'],
+                            metadata.at[position, 'timestamp'], spectra[position])
+                for position in positions[start:start + entries_per_file]
+            ]
+            filename = os.path.join(folder, 'cms_{:05d}.json'.format(start))
+            with open(filename, 'w') as json_file:
+                json.dump(entries, json_file)
+
+
+def write_cms_txt(path, readings, length):
+    """Write a CMS txt file with one channel per reading as read by ``parse_cms_txt``."""
+    metadata = get_metadata(readings, turbines=1)
+    spectra = get_spectra(readings, length)
+    with open(path, 'w') as txt_file:
+        for position, spectrum in enumerate(spectra):
+            timestamp = metadata.at[position, 'timestamp']
+            txt_file.write('[specchannel{}]\n'.format(position))
+            txt_file.write('szsystemid=T000\n')
+            txt_file.write('szlabel={}\n'.format(metadata.at[position, 'signal_id']))
+            txt_file.write('ianalysisid={}\n'.format(position % 3))
+            txt_file.write('starttime={}\n'.format(int(timestamp.timestamp())))
+            txt_file.write('rpm=1500\n')
+            txt_file.write('[specdata{}]\n'.format(position))
+            txt_file.write('\n'.join(repr(value) for value in spectrum))
+            txt_file.write('\n#--finish--\n')
+
+
+def _med_timestamp(timestamp):
+    return '#{}#'.format(timestamp.strftime('%Y-%m-%d %H:%M:%S')).encode()
+
+
+def _med_sensor(name, observations, spectra, timestamps):
+    """Build the block of a sensor.
+
+    Each observation has its metadata and RMS records, one line each, followed by the
+    three FFT blocks. Every FFT block is a ``count,category`` header, the binary
+    ``float32`` values and 4 padding bytes, and the next header or the timestamps of
+    the next observation come right after the padding.
+    """
+    start = _med_timestamp(timestamps[0])
+    lines = [
+        '"SENSOR {}",1'.format(name).encode(),
+        str(observations + 1).encode(),
+        b'0,' + start + b',' + start + b',0',
+    ]
+    body = b'\r\n'.join(lines)
+    for observation in range(observations):
+        records = [b'2', b'rpm,1500', b'kw,1800']
+        for category in ('4000', '100', 'env_400'):
+            records.extend([b'1', '0,1,2,{},0.5'.format(category).encode()])
+
+        body += b'\r\n' + b'\r\n'.join(records) + b'\r\n'
+        values = spectra[observation].astype('<f4').tobytes()
+        for category in ('4000', '100', '400'):
+            header = '{},{}'.format(len(spectra[observation]), category).encode()
+            body += header + b'\r\n' + values + b'\x00' * 4
+
+        following = _med_timestamp(timestamps[min(observation + 1, len(timestamps) - 1)])
+        body += b'0,' + following + b',' + following
+
+    return body + b'\r\nE'
+
+
+def write_med(path, readings, length, sensors=2):
+    """Write a MED file as read by ``cms_ml.parsers.cms_med_classes.MEDData``."""
+    observations = max(readings // sensors, 1)
+    spectra = get_spectra(observations, length)
+    timestamps = _timestamps(observations)
+
+    body = b'"Windfarm","Export"\r\n"T000","Synthetic"'
+    for sensor in range(sensors):
+        body += b'\r\n' + _med_sensor(sensor, observations, spectra, timestamps)
+
+    with open(path, 'wb') as med_file:
+        med_file.write(body)
@@ -1,23 +1,145 @@
+import hashlib
+import itertools
+import threading
+from collections import OrderedDict
+
 import numpy as np
 
+AXIS_CACHE_SIZE = 64
+AXIS_DIGEST_SIZE = 32
+BAND_PLAN_CACHE_SIZE = 4096
+
+_AXES = OrderedDict()
+_AXIS_IDS = itertools.count()
+_BAND_PLANS = OrderedDict()
+_CACHE_LOCK = threading.Lock()
+
+
+def _band_edges(bands):
+    """Convert a band plan into a ``(B, 2)`` array of band minimums and maximums.
+
+    The plan can be given as a list of ``(min_frequency, max_frequency)`` pairs or as
+    the list of primitives generated by ``cms_ml.pipe_constructor.band_gen``.
+    """
+    bands = list(bands)
+    if bands and isinstance(bands[0], dict):
+        bands = [
+            (band['init_params']['min_frequency'], band['init_params']['max_frequency'])
+            for band in bands
+        ]
+
+    return np.asarray(bands, dtype=float).reshape(-1, 2)
+
 
-def _in_range(frequency_values, min_frequency, max_frequency):
-    lower_frequency_than = frequency_values <= max_frequency
-    higher_frequency_than = frequency_values >= min_frequency
-    return np.ravel(higher_frequency_than & lower_frequency_than)
+def _sort_axis(frequency_values):
+    order = None
+    if np.any(frequency_values[1:] < frequency_values[:-1]):
+        order = np.argsort(frequency_values, kind='stable')
+        frequency_values = frequency_values[order]
+        order.flags.writeable = False
 
+    frequency_values.flags.writeable = False
+    return order, frequency_values
 
-def _filter_side_bands(frequency_values, side_bands):
-    side_bands_idx = np.array([])
 
-    for side_band in side_bands:
-        min_sb, max_sb = side_band
-        low_f = frequency_values <= max_sb
-        high_f = frequency_values >= min_sb
-        sb_idx = np.where(low_f & high_f)
-        side_bands_idx = np.concatenate((side_bands_idx, sb_idx), axis=None)
+def _get_axis(frequency_values):
+    """Find the frequency axis in the cache, or add it.
 
-    return side_bands_idx
+    Axes are looked up by their dtype, length and ``blake2b`` digest, so a cache hit
+    only hashes the values instead of comparing them with the cached axes. Regular axes
+    given as ``(offset, delta, length)`` are looked up by the tuple itself.
+
+    Returns:
+        tuple:
+            A unique id of the axis, the order that sorts it (or ``None``) and the
+            sorted axis.
+    """
+    if isinstance(frequency_values, tuple):
+        key = ('regular', ) + tuple(frequency_values)
+    else:
+        values = np.ascontiguousarray(np.ravel(frequency_values))
+        digest = hashlib.blake2b(values.tobytes(), digest_size=AXIS_DIGEST_SIZE).digest()
+        key = (values.dtype.str, len(values), digest)
+
+    with _CACHE_LOCK:
+        cached = _AXES.get(key)
+        if cached is not None:
+            _AXES.move_to_end(key)
+            return cached
+
+    if isinstance(frequency_values, tuple):
+        offset, delta, length = frequency_values
+        axis = offset + delta * np.arange(length)
+    else:
+        axis = values.copy()
+
+    order, sorted_axis = _sort_axis(axis)
+    cached = (next(_AXIS_IDS), order, sorted_axis)
+    with _CACHE_LOCK:
+        cached = _AXES.setdefault(key, cached)
+        while len(_AXES) > AXIS_CACHE_SIZE:
+            _AXES.popitem(last=False)
+
+    return cached
+
+
+def get_band_plan(frequency_values, bands):
+    """Resolve a band plan into slice boundaries of a frequency axis.
+
+    The result is cached, keyed by the frequency axis and the band edges, so the
+    bands are resolved only once for every distinct axis and reused for all the
+    spectra that share it. The least recently used axes and plans are evicted once
+    there are more than ``AXIS_CACHE_SIZE`` and ``BAND_PLAN_CACHE_SIZE`` of them.
+
+    Args:
+        frequency_values (np.ndarray or tuple):
+            A numpy array with the frequency values, or a regular axis described as
+            an ``(offset, delta, length)`` tuple, which avoids hashing the values.
+        bands (list or np.ndarray):
+            The band plan, as a list of ``(min_frequency, max_frequency)`` pairs or
+            the list of primitives generated by ``cms_ml.pipe_constructor.band_gen``.
+
+    Returns:
+        tuple:
+            The order that sorts the frequency axis, or ``None`` if it is already
+            sorted, and two arrays with the start and end positions of each band in
+            the sorted axis. The arrays are read-only.
+    """
+    axis_id, order, sorted_axis = _get_axis(frequency_values)
+    edges = _band_edges(bands)
+    key = (axis_id, edges.tobytes())
+    with _CACHE_LOCK:
+        plan = _BAND_PLANS.get(key)
+        if plan is not None:
+            _BAND_PLANS.move_to_end(key)
+            return plan
+
+    starts = np.searchsorted(sorted_axis, edges[:, 0], side='left')
+    ends = np.maximum(np.searchsorted(sorted_axis, edges[:, 1], side='right'), starts)
+    starts.flags.writeable = False
+    ends.flags.writeable = False
+
+    plan = (order, starts, ends)
+    with _CACHE_LOCK:
+        _BAND_PLANS[key] = plan
+        while len(_BAND_PLANS) > BAND_PLAN_CACHE_SIZE:
+            _BAND_PLANS.popitem(last=False)
+
+    return plan
+
+
+def _select_bands(amplitude_values, frequency_values, bands):
+    """Get the amplitude values of each band as a list of arrays."""
+    order, starts, ends = get_band_plan(frequency_values, bands)
+    amplitude_values = np.asarray(amplitude_values)
+    if order is not None:
+        amplitude_values = amplitude_values[order]
+
+    return [amplitude_values[start:end] for start, end in zip(starts, ends)]
+
+
+def _select_band(amplitude_values, frequency_values, min_frequency, max_frequency):
+    return _select_bands(amplitude_values, frequency_values, [(min_frequency, max_frequency)])[0]
 
 
 def band_mean(amplitude_values, frequency_values, min_frequency, max_frequency):
@@ -40,11 +162,8 @@ def band_mean(amplitude_values, frequency_values, min_frequency, max_frequency):
         float:
             Mean value for the given band.
     """
-    selected_idx = np.ravel(np.where(_in_range(frequency_values, min_frequency, max_frequency)))
-
-    selected_idx = [int(x) for x in selected_idx]
-
-    selected_values = np.array(amplitude_values)[selected_idx]
+    selected_values = _select_band(
+        amplitude_values, frequency_values, min_frequency, max_frequency)
 
     return np.mean(selected_values)
 
@@ -69,11 +188,8 @@ def band_max(amplitude_values, frequency_values, min_frequency, max_frequency):
         float:
             Max value for the given band.
     """
-    selected_idx = np.ravel(np.where(_in_range(frequency_values, min_frequency, max_frequency)))
-
-    selected_idx = [int(x) for x in selected_idx]
-
-    selected_values = np.array(amplitude_values)[selected_idx]
+    selected_values = _select_band(
+        amplitude_values, frequency_values, min_frequency, max_frequency)
 
     return np.max(selected_values)
 
@@ -98,11 +214,8 @@ def band_min(amplitude_values, frequency_values, min_frequency, max_frequency):
         float:
             Min value for the given band.
     """
-    selected_idx = np.ravel(np.where(_in_range(frequency_values, min_frequency, max_frequency)))
-
-    selected_idx = [int(x) for x in selected_idx]
-
-    selected_values = np.array(amplitude_values)[selected_idx]
+    selected_values = _select_band(
+        amplitude_values, frequency_values, min_frequency, max_frequency)
 
     return np.min(selected_values)
 
@@ -127,11 +240,8 @@ def band_rms(amplitude_values, frequency_values, min_frequency, max_frequency):
         float:
             rms value for the given band.
     """
-    selected_idx = np.ravel(np.where(_in_range(frequency_values, min_frequency, max_frequency)))
-
-    selected_idx = [int(x) for x in selected_idx]
-
-    selected_values = np.array(amplitude_values)[selected_idx]
+    selected_values = _select_band(
+        amplitude_values, frequency_values, min_frequency, max_frequency)
 
     return np.sqrt(np.mean(np.square(selected_values)))
 
@@ -161,12 +271,9 @@ def band_sideband_rms(amplitude_values,
         float:
             RMS value for the given band and associated sidebands.
     """
-    selected_idx = np.where(_in_range(frequency_values, min_frequency, max_frequency))
-    side_bands_idx = _filter_side_bands(frequency_values, side_bands)
-
-    final_idx = np.concatenate((selected_idx, side_bands_idx), axis=None)  # <-
+    selected_values = np.concatenate(_select_bands(
+        amplitude_values, frequency_values, [(min_frequency, max_frequency)] + list(side_bands)))
 
-    selected_values = np.array(amplitude_values)[final_idx.astype(dtype="int")]
     return np.sqrt(np.mean(np.square(selected_values)))
 
 
@@ -192,18 +299,23 @@ def band_sideband_pr(amplitude_values, frequency_values,
         float:
             Power ratio value for side bands vs a specific band.
     """
-    selected_idx = np.where(_in_range(frequency_values, min_frequency, max_frequency))
-    selected_values = np.array(amplitude_values)[selected_idx]
+    selected_values = _select_band(
+        amplitude_values, frequency_values, min_frequency, max_frequency)
 
     band_rms = np.sqrt(np.mean(np.square(selected_values)))
 
-    side_bands_idx = _filter_side_bands(frequency_values, side_bands)
+    side_bands = list(side_bands)
+    if side_bands:
+        selected_values = np.concatenate(
+            _select_bands(amplitude_values, frequency_values, side_bands))
+    else:
+        selected_values = np.array([])
 
-    selected_values = np.array(amplitude_values)[side_bands_idx.astype(dtype="int")]
     side_band_rms = np.sqrt(np.mean(np.square(selected_values)))
 
     return side_band_rms / band_rms
 
+
 def band_sum(amplitude_values, frequency_values, min_frequency, max_frequency):
     """Compute the sum values for a specific band.
 
@@ -224,10 +336,97 @@ def band_sum(amplitude_values, frequency_values, min_frequency, max_frequency):
         float:
             Sum value for the given band.
     """
-    selected_idx = np.ravel(np.where(_in_range(frequency_values, min_frequency, max_frequency)))
+    selected_values = _select_band(
+        amplitude_values, frequency_values, min_frequency, max_frequency)
+
+    return np.sum(selected_values)
+
+
+BAND_STATISTICS = ('sum', 'mean', 'rms', 'max', 'min')
+
+
+def _prefix_sums(values):
+    sums = np.zeros(values.shape[:-1] + (values.shape[-1] + 1, ))
+    np.cumsum(values, axis=-1, out=sums[..., 1:])
+    return sums
+
+
+def _segment_reduce(function, values, starts, ends):
+    """Reduce each ``values[..., start:end]`` segment, even if segments overlap.
+
+    ``reduceat`` is given the starts and ends interleaved, so every even result
+    covers exactly one segment. A padding value is added so ends can point past
+    the last element.
+    """
+    padded = np.concatenate([values, np.zeros(values.shape[:-1] + (1, ))], axis=-1)
+    indices = np.column_stack([starts, ends]).ravel()
+    return function.reduceat(padded, indices, axis=-1)[..., ::2]
 
-    selected_idx = [int(x) for x in selected_idx]
 
-    selected_values = np.array(amplitude_values)[selected_idx]
+def _segment_statistics(amplitude_values, starts, ends, statistics):
+    counts = ends - starts
+    empty = counts == 0
+
+    results = dict()
+    with np.errstate(invalid='ignore', divide='ignore'):
+        if 'sum' in statistics or 'mean' in statistics:
+            sums = _prefix_sums(amplitude_values)
+            sums = sums[..., ends] - sums[..., starts]
+            results['sum'] = sums
+            results['mean'] = sums / counts
+
+        if 'rms' in statistics:
+            squares = _prefix_sums(np.square(amplitude_values))
+            squares = np.maximum(squares[..., ends] - squares[..., starts], 0)
+            results['rms'] = np.sqrt(squares / counts)
+
+        for name, function in (('max', np.maximum), ('min', np.minimum)):
+            if name in statistics:
+                reduced = _segment_reduce(function, amplitude_values, starts, ends)
+                reduced[..., empty] = np.nan
+                results[name] = reduced
+
+    return {name: results[name] for name in statistics}
+
+
+def band_statistics(amplitude_values, frequency_values, bands,
+                    statistics=BAND_STATISTICS):
+    """Compute statistics for all the bands of a band plan at once.
+
+    Each band is resolved into a slice of the frequency axis with a binary search,
+    cached by ``get_band_plan``, and the statistics of all the bands are computed
+    from cumulative sums (``sum``, ``mean`` and ``rms``) or segment reductions
+    (``max`` and ``min``), so the cost is ``O(N + B)`` per spectrum instead of one
+    full pass per band. Bands are inclusive on both ends, like in the single band
+    functions.
+
+    Args:
+        amplitude_values (np.ndarray):
+            A numpy array with the signal values. It can also be a 2D array with one
+            spectrum per row, all of them sharing the same frequency values.
+        frequency_values (np.ndarray or tuple):
+            A numpy array with the frequency values, or an ``(offset, delta, length)``
+            tuple describing a regular axis.
+        bands (list or np.ndarray):
+            The band plan, as a list of ``(min_frequency, max_frequency)`` pairs or
+            the list of primitives generated by ``cms_ml.pipe_constructor.band_gen``.
+        statistics (tuple):
+            Statistics to compute, among ``sum``, ``mean``, ``rms``, ``max`` and ``min``.
+            Defaults to all of them.
+
+    Returns:
+        dict:
+            One array with the value of each band, keyed by statistic. For 2D inputs
+            the arrays have one row per spectrum. Empty bands have a ``sum`` of 0 and
+            ``nan`` for the other statistics.
+    """
+    unknown = set(statistics) - set(BAND_STATISTICS)
+    if unknown:
+        raise ValueError('Unknown statistics {}'.format(sorted(unknown)))
+
+    amplitude_values = np.asarray(amplitude_values, dtype=float)
+    order, starts, ends = get_band_plan(frequency_values, bands)
+    if order is not None:
+        amplitude_values = amplitude_values[..., order]
 
-    return np.sum(selected_values)
\ No newline at end of file
+    return _segment_statistics(amplitude_values, starts, ends, statistics)
@@ -0,0 +1,325 @@
+# -*- coding: utf-8 -*-
+
+"""cms_ml.archive module.
+
+Persistent archive of spectra that can be memory-mapped and queried by turbine, signal
+and time.
+
+An archive is a directory with:
+
+* ``values.f64``: the values of all the spectra, one after the other, as ``float64``.
+* ``index-<n>.npy``: one index table per append, with the turbine and signal codes,
+  timestamp, offset, length and frequency axis code of each spectrum.
+* ``manifest.json``: the distinct turbines, signals and frequency axes, the index
+  tables and the number of values that belong to the archive.
+
+The manifest is replaced atomically at the end of every append, so an interrupted
+append leaves the archive as it was before it. Only one process should append to an
+archive at a time.
+"""
+
+import json
+import logging
+import os
+from copy import deepcopy
+
+import numpy as np
+import pandas as pd
+
+from cms_ml.index import MetadataIndex
+from cms_ml.spectra import SpectrumBatch
+
+LOGGER = logging.getLogger(__name__)
+
+MANIFEST = 'manifest.json'
+VALUES = 'values.f64'
+INDEX_DTYPE = np.dtype([
+    ('turbine', '<i4'),
+    ('signal', '<i4'),
+    ('timestamp', '<i8'),
+    ('offset', '<i8'),
+    ('length', '<i8'),
+    ('axis', '<i4'),
+])
+AXIS_COLUMNS = ('frequency_start', 'frequency_step')
+
+
+def is_archive(path):
+    """Tell whether the given path is a spectrum archive."""
+    return os.path.isfile(os.path.join(path, MANIFEST))
+
+
+def _empty_manifest():
+    return {
+        'version': 1,
+        'values': 0,
+        'segments': list(),
+        'turbines': list(),
+        'signals': list(),
+        'axes': list(),
+    }
+
+
+def _write_manifest(path, manifest):
+    manifest_path = os.path.join(path, MANIFEST)
+    with open(manifest_path + '.tmp', 'w') as manifest_file:
+        json.dump(manifest, manifest_file)
+
+    os.replace(manifest_path + '.tmp', manifest_path)
+
+
+def _encode(values, categories):
+    """Get the codes of the values, adding the new ones to the categories."""
+    positions = {category: code for code, category in enumerate(categories)}
+    codes = np.empty(len(values), dtype=np.int32)
+    for row, value in enumerate(values):
+        if pd.isnull(value):
+            codes[row] = -1
+            continue
+
+        code = positions.get(value)
+        if code is None:
+            code = positions[value] = len(categories)
+            categories.append(value)
+
+        codes[row] = code
+
+    return codes
+
+
+def _decode(codes, categories):
+    lookup = np.empty(len(categories) + 1, dtype=object)
+    lookup[:-1] = categories
+    lookup[-1] = np.nan
+    return lookup[codes]   # code -1 points to the missing value at the end
+
+
+class SpectrumArchive:
+    """Spectra stored in an archive directory, see ``cms_ml.archive``.
+
+    Use ``open_archive`` to create instances.
+
+    Args:
+        path (str):
+            Path to the archive directory.
+        mode (str):
+            ``r`` to only read the archive or ``a`` to also append to it.
+    """
+
+    def __init__(self, path, mode='r'):
+        self.path = path
+        self.mode = mode
+        self._load()
+
+    def _load(self):
+        with open(os.path.join(self.path, MANIFEST)) as manifest_file:
+            self._manifest = json.load(manifest_file)
+
+        segments = [
+            np.load(os.path.join(self.path, segment), mmap_mode='r')
+            for segment in self._manifest['segments']
+        ]
+        self._table = np.concatenate(segments) if segments else np.empty(0, INDEX_DTYPE)
+
+        size = self._manifest['values']
+        values_path = os.path.join(self.path, VALUES)
+        if size:
+            self._values = np.memmap(values_path, dtype='<f8', mode='r', shape=(size, ))
+        else:
+            self._values = np.empty(0)
+
+        self._metadata = None
+        self._index = None
+
+    def __len__(self):
+        return len(self._table)
+
+    def __repr__(self):
+        return 'SpectrumArchive(path={!r}, spectra={})'.format(self.path, len(self))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        """Release the memory-mapped values."""
+        self._values = np.empty(0)
+        self._table = np.empty(0, INDEX_DTYPE)
+
+    @property
+    def metadata(self):
+        """pd.DataFrame: The index table with the turbine and signal names."""
+        if self._metadata is None:
+            table = self._table
+            axes = np.array(self._manifest['axes'] + [[np.nan, np.nan]], dtype=float)
+            self._metadata = pd.DataFrame({
+                'turbine_id': _decode(table['turbine'], self._manifest['turbines']),
+                'signal_id': _decode(table['signal'], self._manifest['signals']),
+                'timestamp': pd.to_datetime(table['timestamp'].astype('datetime64[ns]')),
+                'offset': table['offset'],
+                'length': table['length'],
+                AXIS_COLUMNS[0]: axes[table['axis'], 0],
+                AXIS_COLUMNS[1]: axes[table['axis'], 1],
+            })
+
+        return self._metadata
+
+    def get_index(self):
+        """Get the ``MetadataIndex`` of the archive, building it the first time."""
+        if self._index is None:
+            self._index = MetadataIndex(self.metadata)
+
+        return self._index
+
+    def take(self, positions):
+        """Get a batch with the spectra at the given positions.
+
+        If the spectra are stored one after the other, the batch values are a view
+        over the memory-mapped values. Otherwise, only the selected values are
+        read into a new buffer.
+
+        Args:
+            positions (array-like):
+                Integer positions of the spectra in the archive.
+
+        Returns:
+            SpectrumBatch:
+                The spectra, with the index table as metadata.
+        """
+        positions = np.asarray(positions, dtype=np.int64)
+        starts = self._table['offset'][positions]
+        lengths = self._table['length'][positions]
+
+        offsets = np.zeros(len(positions) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+
+        first = starts[0] if len(positions) else 0
+        if np.array_equal(starts - first, offsets[:-1]):
+            values = self._values[first:first + offsets[-1]]
+        else:
+            shifts = np.repeat(starts - offsets[:-1], lengths)
+            values = self._values[np.arange(offsets[-1]) + shifts]
+
+        metadata = self.metadata.iloc[positions].drop(columns=['offset', 'length'])
+        return SpectrumBatch(values, offsets, metadata)
+
+    def select(self, turbines=None, signals=None, start_time=None, end_time=None,
+               match='exact'):
+        """Get the spectra of some turbines and signals within a time range.
+
+        Args:
+            turbines (list, optional):
+                Turbines to select. If None, all the turbines are selected.
+                Default is None.
+            signals (list, optional):
+                Signals to select. If None, all the signals are selected.
+                Default is None.
+            start_time (str, datetime, optional):
+                The minimum timestamp, inclusive. Default is None.
+            end_time (str, datetime, optional):
+                The maximum timestamp, exclusive. Default is None.
+            match (str):
+                How ``signals`` and ``turbines`` are matched, ``exact`` or ``contains``.
+                See ``cms_ml.index.MetadataIndex.select``. Defaults to ``exact``.
+
+        Returns:
+            SpectrumBatch:
+                The selected spectra in the order they were appended, with the
+                ``turbine_id``, ``signal_id``, ``timestamp``, ``frequency_start`` and
+                ``frequency_step`` of each one as metadata.
+        """
+        positions = self.get_index().select(start_time, end_time, signals or None,
+                                            turbines or None, match)
+        LOGGER.info('Selected %s spectra from %s', len(positions), self.path)
+        return self.take(positions)
+
+    def _write_values(self, values):
+        offset = self._manifest['values']
+        with open(os.path.join(self.path, VALUES), 'ab') as values_file:
+            # drop anything left behind by an interrupted append
+            values_file.truncate(offset * 8)
+            values_file.write(np.ascontiguousarray(values, dtype='<f8').tobytes())
+            values_file.flush()
+            os.fsync(values_file.fileno())
+
+        return offset
+
+    def append(self, data, column='values'):
+        """Add spectra to the archive.
+
+        Args:
+            data (SpectrumBatch or pd.DataFrame):
+                Spectra with ``turbine_id``, ``signal_id`` and ``timestamp`` metadata.
+                If the metadata has ``frequency_start`` and ``frequency_step`` columns,
+                they are stored as the frequency axis of each spectrum.
+            column (str):
+                Name of the column that contains the spectra if ``data`` is a
+                ``pd.DataFrame``. Defaults to ``values``.
+        """
+        if self.mode != 'a':
+            raise ValueError('The archive was opened in read only mode')
+
+        if not isinstance(data, SpectrumBatch):
+            data = SpectrumBatch.from_dataframe(data, column=column)
+
+        metadata = data.metadata
+        manifest = deepcopy(self._manifest)   # only committed at the end
+
+        timestamps = pd.to_datetime(metadata['timestamp'])
+        if timestamps.dt.tz:
+            timestamps = timestamps.dt.tz_convert(None)
+
+        table = np.empty(len(data), dtype=INDEX_DTYPE)
+        table['turbine'] = _encode(metadata['turbine_id'], manifest['turbines'])
+        table['signal'] = _encode(metadata['signal_id'], manifest['signals'])
+        table['timestamp'] = timestamps.to_numpy().view(np.int64)
+        table['offset'] = self._write_values(data.values) + data.offsets[:-1]
+        table['length'] = data.lengths
+
+        if all(axis in metadata for axis in AXIS_COLUMNS):
+            axes = [tuple(axis) for axis in manifest['axes']]
+            descriptors = pd.Series(list(zip(
+                *(metadata[axis].astype(float) for axis in AXIS_COLUMNS))))
+            table['axis'] = _encode(descriptors.where(metadata[AXIS_COLUMNS[0]].notnull()),
+                                    axes)
+            manifest['axes'] = [list(axis) for axis in axes]
+        else:
+            table['axis'] = -1
+
+        segment = 'index-{:05d}.npy'.format(len(manifest['segments']))
+        np.save(os.path.join(self.path, segment), table)
+
+        manifest['segments'].append(segment)
+        manifest['values'] += len(data.values)
+        _write_manifest(self.path, manifest)
+
+        LOGGER.info('Appended %s spectra to %s', len(data), self.path)
+        self._load()
+
+
+def open_archive(path, mode='r'):
+    """Open a spectrum archive.
+
+    Args:
+        path (str):
+            Path to the archive directory.
+        mode (str):
+            ``r`` to read an existing archive, or ``a`` to append to it, creating it
+            if it does not exist. Defaults to ``r``.
+
+    Returns:
+        SpectrumArchive
+    """
+    if mode not in ('r', 'a'):
+        raise ValueError('Unknown mode {}. Use r or a'.format(mode))
+
+    if not is_archive(path):
+        if mode == 'r':
+            raise FileNotFoundError('{} is not a spectrum archive'.format(path))
+
+        os.makedirs(path, exist_ok=True)
+        _write_manifest(path, _empty_manifest())
+
+    return SpectrumArchive(path, mode)
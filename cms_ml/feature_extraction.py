@@ -4,10 +4,24 @@
 
 import logging
 import os
+from concurrent.futures import ProcessPoolExecutor
 
+import numpy as np
 import pandas as pd
 
+from cms_ml.archive import SpectrumArchive, is_archive, open_archive
+from cms_ml.parsers.streaming import REFERENCE_COLUMNS, load_spectra
+from cms_ml.spectra import SpectrumBatch, get_vectorized
+from cms_ml.storage import (
+    check_output_format, clear_partitioned, read_partitioned, write_partitioned)
 from cms_ml.utils import filter_values, load_fft_csv
+from cms_ml.watermarks import (
+    find_new, get_watermarks_path, load_watermarks, save_watermarks, update_watermarks)
+
+try:
+    from multiprocessing import shared_memory
+except ImportError:   # Python < 3.8
+    shared_memory = None
 
 LOGGER = logging.getLogger(__name__)
 
@@ -16,12 +30,14 @@ def aggregate_values(raw_df, name, aggregation, context_fields=True):
     """Aggregates the data values according to the specified aggregation.
 
     Args:
-        raw_df (pd.DataFrame):
-            The CMS dataframe to apply the aggregation to.
+        raw_df (pd.DataFrame or SpectrumBatch):
+            The CMS dataframe to apply the aggregation to. If a ``SpectrumBatch`` is
+            given, the aggregation is computed over whole groups of spectra at once.
         name (str):
             Name that will be appended to the signal name.
-        aggregation (function):
-            The aggregation function to apply.
+        aggregation (str or function):
+            The aggregation function to apply, or the name of a vectorized
+            aggregation from ``cms_ml.spectra.VECTORIZED_AGGREGATIONS``.
         context_fields (bool or list):
             If ``bool``, whether or not to return the context columns from the given data.
             If ``list`` parse only the columns specified. Defaults to ``True``.
@@ -33,13 +49,47 @@ def aggregate_values(raw_df, name, aggregation, context_fields=True):
     """
     LOGGER.info('Applying aggregation %s', name)
 
-    output = raw_df.copy()
-    if 'values' in output.columns:
-        output.rename(columns={'values': 'value'}, inplace=True)
+    if isinstance(raw_df, SpectrumBatch):
+        output = raw_df.metadata.copy()
+        output["value"] = raw_df.reduce(aggregation)
+    else:
+        output = raw_df.copy()
+        if 'values' in output.columns:
+            output.rename(columns={'values': 'value'}, inplace=True)
+
+        if get_vectorized(aggregation) is None:
+            output["value"] = output["value"].apply(aggregation)
+        else:
+            output["value"] = SpectrumBatch.from_values(output["value"]).reduce(aggregation)
 
-    output["value"] = output["value"].apply(aggregation)
     output["signal_id"] = (output.pop("signal_id").fillna("") + "_" + name).str.strip("_")
+    if isinstance(raw_df, SpectrumBatch):
+        output = _order_columns(output)
+
+    return _select_context(output, context_fields)
+
+
+def _order_columns(output, columns=None):
+    """Sort the output columns like the copy of the input made by ``aggregate_values``.
+
+    The value takes the place of the spectra and the signal_id goes at the end. If the
+    columns of the input are not known, or it has no spectra, the value goes right after
+    the timestamp, where the parsers store the spectra.
+    """
+    if columns is not None and ('values' in columns or 'value' in columns):
+        order = [
+            'value' if column in ('values', 'value') else column
+            for column in columns if column != 'signal_id'
+        ]
+    else:
+        order = [column for column in output.columns if column not in ('value', 'signal_id')]
+        position = order.index('timestamp') + 1 if 'timestamp' in order else len(order)
+        order.insert(position, 'value')
+
+    return output[order + ['signal_id']]
 
+
+def _select_context(output, context_fields):
     if isinstance(context_fields, list):
         return output[["turbine_id", "signal_id", "timestamp", "value"] + context_fields]
 
@@ -49,21 +99,333 @@ def aggregate_values(raw_df, name, aggregation, context_fields=True):
     return output[["turbine_id", "signal_id", "timestamp", "value"]]
 
 
+def _signal_names(signal_ids, names):
+    """Build the ``signal_id`` column for every aggregation at once.
+
+    The names are computed over the distinct signals only and then expanded
+    using the signal codes.
+    """
+    codes, uniques = pd.factorize(signal_ids.fillna(""))
+    uniques = pd.Series(uniques, dtype=object)
+    return np.concatenate([
+        (uniques + "_" + name).str.strip("_").to_numpy()[codes]
+        for name in names
+    ])
+
+
+def _partition(metadata, lengths, n_jobs):
+    """Split the spectra in up to ``n_jobs`` partitions of similar size.
+
+    Spectra are grouped by ``turbine_id`` and ``signal_id``. Groups bigger than
+    the target partition size are split, and the pieces are then distributed among
+    the partitions starting from the biggest one.
+    """
+    keys = [key for key in ('turbine_id', 'signal_id') if key in metadata.columns]
+    if keys:
+        codes = metadata.groupby(keys, sort=False, dropna=False).ngroup().to_numpy()
+    else:
+        codes = np.zeros(len(metadata), dtype=int)
+
+    order = np.argsort(codes, kind='stable')
+    groups = np.split(order, np.flatnonzero(np.diff(codes[order])) + 1)
+
+    target = max(lengths.sum() / n_jobs, 1)
+    pieces = list()
+    for group in groups:
+        splits = int(np.ceil(lengths[group].sum() / target))
+        pieces.extend(np.array_split(group, max(min(splits, len(group)), 1)))
+
+    sizes = np.zeros(n_jobs)
+    partitions = [list() for _ in range(n_jobs)]
+    for piece in sorted(pieces, key=lambda piece: lengths[piece].sum(), reverse=True):
+        smallest = int(np.argmin(sizes))
+        partitions[smallest].append(piece)
+        sizes[smallest] += lengths[piece].sum()
+
+    return [np.sort(np.concatenate(partition)) for partition in partitions if partition]
+
+
+def _reduce_partition(values, starts, lengths, aggregations):
+    """Gather the spectra of a partition from the shared buffer and aggregate them.
+
+    ``values`` is either the name, dtype and size of the shared memory block that
+    holds the values buffer, or the values buffer itself if shared memory is not
+    available.
+    """
+    shared = None
+    if isinstance(values, tuple):
+        name, dtype, size = values
+        shared = shared_memory.SharedMemory(name=name)
+        values = np.ndarray((size, ), dtype=dtype, buffer=shared.buf)
+
+    try:
+        offsets = np.zeros(len(lengths) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        positions = np.arange(offsets[-1]) + np.repeat(starts - offsets[:-1], lengths)
+        batch = SpectrumBatch(values[positions], offsets)
+    finally:
+        if shared is not None:
+            del values
+            shared.close()
+
+    return batch.reduce_all(aggregations)
+
+
+def _reduce_parallel(batch, aggregations, n_jobs):
+    """Compute the aggregations over partitions of the batch in a process pool.
+
+    The values buffer is copied once into shared memory so the workers can read it
+    without pickling the spectra. Each row is reduced independently, so the results
+    are identical to the ones computed serially.
+    """
+    partitions = _partition(batch.metadata, batch.lengths, n_jobs)
+    LOGGER.info('Applying aggregations over %s partitions', len(partitions))
+
+    shared = None
+    if shared_memory is not None:
+        shared = shared_memory.SharedMemory(create=True, size=max(batch.values.nbytes, 1))
+        buffer = np.ndarray(batch.values.shape, dtype=batch.values.dtype, buffer=shared.buf)
+        buffer[:] = batch.values
+        del buffer
+        values = (shared.name, batch.values.dtype.str, len(batch.values))
+    else:
+        values = batch.values
+
+    try:
+        with ProcessPoolExecutor(max_workers=len(partitions)) as executor:
+            futures = [
+                executor.submit(
+                    _reduce_partition,
+                    values,
+                    batch.offsets[positions],
+                    batch.lengths[positions],
+                    aggregations
+                )
+                for positions in partitions
+            ]
+            parts = [future.result() for future in futures]
+
+    finally:
+        if shared is not None:
+            shared.close()
+            shared.unlink()
+
+    results = dict()
+    for name in aggregations:
+        pieces = [part[name] for part in parts]
+        dtype = float if all(piece.dtype == float for piece in pieces) else object
+        results[name] = np.empty(len(batch), dtype=dtype)
+        for positions, piece in zip(partitions, pieces):
+            results[name][positions] = piece
+
+    return results
+
+
+def _to_batch(data):
+    if isinstance(data, SpectrumBatch):
+        return data
+
+    if REFERENCE_COLUMNS[0] in data.columns:
+        return load_spectra(data)
+
+    column = 'values' if 'values' in data.columns else 'value'
+    return SpectrumBatch.from_dataframe(data, column=column)
+
+
+def _reduce(batch, aggregations, n_jobs):
+    LOGGER.info('Applying aggregations %s', list(aggregations))
+    if n_jobs == -1:
+        n_jobs = os.cpu_count()
+
+    if n_jobs and n_jobs > 1 and len(batch) > 1:
+        return _reduce_parallel(batch, aggregations, n_jobs)
+
+    return batch.reduce_all(aggregations)
+
+
+def aggregate_features(data, aggregations, context_fields=True, n_jobs=None):
+    """Apply several aggregations to the data values at once.
+
+    All the aggregations are computed in a single sweep over the spectra and the
+    output is assembled with one allocation, instead of copying the input once per
+    aggregation and appending the results.
+
+    Args:
+        data (pd.DataFrame or SpectrumBatch):
+            The CMS data to apply the aggregations to.
+        aggregations (dict):
+            A dictionary keyed by aggregation function name
+            with the function itself, or the name of a vectorized aggregation,
+            as the value.
+        context_fields (bool or list):
+            If ``bool``, whether or not to return the context columns from the given data.
+            If ``list`` parse only the columns specified. Defaults to ``True``.
+        n_jobs (int, optional):
+            Number of processes used to compute the aggregations, splitting the data
+            by turbine and signal. ``-1`` means using all the processors. If ``None``
+            or ``1``, run in the current process. The aggregations must be picklable
+            to run in parallel. Default is None.
+
+    Returns:
+        pd.DataFrame:
+            Contains signal_id, timestamp and value columns, with the rows of each
+            aggregation one after the other. Depending on ``context_fields``
+            returns additional columns.
+    """
+    columns = data.columns if isinstance(data, pd.DataFrame) else None
+    data = _to_batch(data)
+    results = _reduce(data, aggregations, n_jobs)
+
+    metadata = data.metadata
+    positions = np.tile(np.arange(len(metadata)), len(aggregations))
+    output = metadata.drop(columns="signal_id").take(positions).reset_index(drop=True)
+    output["value"] = np.concatenate(list(results.values())) if results else []
+    output["signal_id"] = _signal_names(metadata["signal_id"], list(results))
+
+    return _select_context(_order_columns(output, columns), context_fields)
+
+
+def aggregate_features_wide(data, aggregations, n_jobs=None):
+    """Apply several aggregations and return them as a feature matrix.
+
+    The matrix has one row per reading, that is, per turbine and timestamp, and one
+    column per signal and aggregation, named like the ``signal_id`` values of
+    ``aggregate_features``. The results of each aggregation are written directly into
+    a preallocated matrix, without building the long format table and pivoting it.
+
+    Args:
+        data (pd.DataFrame or SpectrumBatch):
+            The CMS data to apply the aggregations to.
+        aggregations (dict):
+            A dictionary keyed by aggregation function name
+            with the function itself, or the name of a vectorized aggregation,
+            as the value. The aggregations must return scalars.
+        n_jobs (int, optional):
+            Number of processes used to compute the aggregations. ``-1`` means using
+            all the processors. If ``None`` or ``1``, run in the current process.
+            Default is None.
+
+    Returns:
+        pd.DataFrame:
+            Contains the turbine_id and timestamp columns followed by one ``float``
+            column per feature, sorted by signal and then in the order of
+            ``aggregations``. Features that were not measured in a reading are ``NaN``.
+            If a signal appears more than once in the same reading, the last value
+            is kept.
+    """
+    data = _to_batch(data)
+    results = _reduce(data, aggregations, n_jobs)
+    for name, values in results.items():
+        if values.dtype == object:
+            raise ValueError('Aggregation {} does not return scalars'.format(name))
+
+    metadata = data.metadata
+    readings = pd.MultiIndex.from_arrays([metadata['turbine_id'], metadata['timestamp']])
+    rows, readings = readings.factorize(sort=True)
+    signals, signal_ids = pd.factorize(metadata['signal_id'].fillna(''), sort=True)
+
+    names = list(results)
+    columns = _signal_names(pd.Series(signal_ids), names)
+    columns = columns.reshape(len(names), -1).T.ravel()
+
+    matrix = np.full((len(readings), len(columns)), np.nan)
+    for position, values in enumerate(results.values()):
+        matrix[rows, signals * len(names) + position] = values
+
+    output = pd.DataFrame(matrix, columns=columns)
+    output.insert(0, 'timestamp', readings.get_level_values(1))
+    output.insert(0, 'turbine_id', readings.get_level_values(0))
+
+    return output
+
+
+def _extract_features(data, aggregations, start_time, end_time, signals, turbines,
+                      context_fields, n_jobs, watermarks=None, wide=False, match='exact'):
+    data = filter_values(
+        data,
+        start_time=start_time,
+        end_time=end_time,
+        signals=signals,
+        turbines=turbines,
+        match=match,
+    )
+
+    if watermarks is not None:
+        if not isinstance(data, SpectrumBatch):
+            data = SpectrumBatch.from_dataframe(data)
+
+        masks = find_new(data.metadata, list(aggregations), watermarks)
+        selected = np.logical_or.reduce(list(masks.values()))
+        LOGGER.info('Selected %s entries newer than the watermarks', selected.sum())
+
+        if not selected.any():
+            columns = ['turbine_id', 'timestamp'] if wide else [
+                'turbine_id', 'signal_id', 'timestamp', 'value']
+            return pd.DataFrame(columns=columns)
+
+        data = data.take(selected)
+        masks = {name: mask[selected] for name, mask in masks.items()}
+
+    if wide:
+        results = aggregate_features_wide(data, aggregations, n_jobs=n_jobs)
+    else:
+        results = aggregate_features(data, aggregations, context_fields=context_fields,
+                                     n_jobs=n_jobs)
+
+    if watermarks is not None:
+        results = results[np.concatenate(list(masks.values()))].reset_index(drop=True)
+        update_watermarks(watermarks, data.metadata, masks)
+
+    if results['timestamp'].dt.tz:
+        results['timestamp'] = results['timestamp'].dt.tz_convert(None)
+
+    return results
+
+
+def _write_results(results, output_path, append=False, output_format='csv'):
+    if output_format == 'parquet':
+        if not append:
+            clear_partitioned(output_path)
+
+        if len(results):
+            write_partitioned(results, output_path, append=True)
+
+        return
+
+    if append and not len(results):
+        # nothing new since the previous run, the output is left as it is
+        return
+
+    LOGGER.info('Writing %s rows to %s', len(results), output_path)
+    if append and os.path.isfile(output_path):
+        results.to_csv(output_path, index=False, mode='a', header=False)
+    else:
+        results.to_csv(output_path, index=False)
+
+
 def extract_cms_features(data, aggregations, output_path=None, start_time=None,
-                         end_time=None, signals=None, turbines=None, context_fields=True):
+                         end_time=None, signals=None, turbines=None, context_fields=True,
+                         n_jobs=None, chunksize=None, incremental=False, output_format='csv',
+                         wide=False, match='exact'):
     """Extract features from CMS data.
 
     User function for applying the end-to-end CMS-ML workflow to
     extract cms features from the input data.
 
     Args:
-        data (pandas.DataFrame or str):
-            Instance of ``pandas.DataFrame`` or a path to a `csv` file with the accepted format.
+        data (pandas.DataFrame, SpectrumBatch or str):
+            Instance of ``pandas.DataFrame``, ``SpectrumBatch`` or ``SpectrumArchive``,
+            a path to a `csv` file with the accepted format, a path to a Parquet dataset
+            written by ``cms_ml.storage.write_partitioned`` or a path to a spectrum
+            archive. Files are loaded as a ``SpectrumBatch``. Only the selected
+            turbines and months are read from Parquet datasets, and only the selected
+            spectra are read from archives.
         aggregations (dict):
             A dictionary keyed by aggregation function name
-            with the function itself as the value.
+            with the function itself, or the name of a vectorized aggregation,
+            as the value.
         output_path (str, optional):
-            The path where the csvs will be stored.
+            The path where the csv file, or the Parquet dataset directory, will be stored.
         start_time (str, datetime, optional):
             The minimum timestamp, inclusive.
             If None, the timestamps have no minimum. Default is None.
@@ -79,10 +441,41 @@ def extract_cms_features(data, aggregations, output_path=None, start_time=None,
         context_fields (bool or list):
             If ``bool``, whether or not to return the context columns from the given data.
             If ``list`` parse only the columns specified. Defaults to ``True``.
+        n_jobs (int, optional):
+            Number of processes used to compute the aggregations. ``-1`` means using
+            all the processors. If ``None`` or ``1``, run in the current process.
+            The output is the same as the one obtained serially. Default is None.
+        chunksize (int, optional):
+            If given and ``data`` is a path, read the file in chunks of this many rows
+            and filter and aggregate each chunk on its own. If an output path is given
+            the features of each chunk are appended to it as soon as they are computed,
+            so the memory usage does not grow with the file size. The rows are ordered
+            by chunk first and then by aggregation. Default is None.
+        incremental (bool):
+            If ``True``, only process the readings that are newer than the latest
+            timestamp already written to ``output_path`` for the same turbine, signal
+            and aggregation, and append the new features to it. The latest timestamps
+            are stored next to the output in a ``.watermarks.json`` file. Readings
+            older than the stored timestamps are skipped. Requires an output path.
+            Defaults to ``False``.
+        output_format (str):
+            Format of the output, ``csv`` or ``parquet``. With ``parquet`` the features
+            are written as a dataset partitioned by turbine and month, see
+            ``cms_ml.storage.write_partitioned``. Defaults to ``csv``.
+        wide (bool):
+            If ``True``, output a feature matrix with one row per turbine and timestamp
+            and one column per signal and aggregation, built directly by
+            ``aggregate_features_wide``. The context fields are not included. Cannot
+            be combined with ``chunksize`` or ``incremental``. Defaults to ``False``.
+        match (str):
+            How ``signals`` and ``turbines`` are matched, ``exact`` or ``contains``.
+            See ``cms_ml.utils.filter_values``. Defaults to ``exact``.
 
     Returns:
         pd.DataFrame or None:
             The output will have three columns - signal_id, timestamp, value.
+            If ``wide``, the output has the turbine_id and timestamp columns followed
+            by one column per feature.
             If an output path is provided, return None. The result
             is written to csvs in the output path, per turbine.
             If an output path is not provided and there is only
@@ -90,35 +483,54 @@ def extract_cms_features(data, aggregations, output_path=None, start_time=None,
             If an output path is not provided and there are multiple turbines
             specified, a dictionary of dataframes keyed by the turbine is returned.
     """
+    if incremental and not output_path:
+        raise ValueError('An output_path is required to extract features incrementally')
 
-    if (isinstance(data, str) and os.path.isfile(data)):
-        data = load_fft_csv(data)
+    if wide and (incremental or chunksize):
+        raise ValueError('The wide output cannot be combined with chunksize or incremental')
 
-    results = pd.DataFrame()
-    data = filter_values(
-        data,
-        start_time=start_time,
-        end_time=end_time,
-        signals=signals,
-        turbines=turbines,
-    )
+    check_output_format(output_format)
 
-    for aggregation_name, aggregation in aggregations.items():
-        aggregated_df = aggregate_values(
-            data,
-            aggregation_name,
-            aggregation,
-            context_fields=context_fields
-        )
+    chunked = False
+    if (isinstance(data, str) and os.path.isfile(data)):
+        chunked = bool(chunksize)
+        data = load_fft_csv(data, batch=True, chunksize=chunksize)
+    elif (isinstance(data, str) and is_archive(data)):
+        data = open_archive(data)
+    elif (isinstance(data, str) and os.path.isdir(data)):
+        exact = match == 'exact'
+        data = read_partitioned(data, start_time=start_time or None, end_time=end_time or None,
+                                signals=(signals or None) if exact else None,
+                                turbines=(turbines or None) if exact else None, batch=True)
 
-        results = results.append(aggregated_df, ignore_index=True, sort=False)
+    if isinstance(data, SpectrumArchive):
+        data = data.select(turbines, signals, start_time, end_time, match=match)
 
-    if results['timestamp'].dt.tz:
-        results['timestamp'] = results['timestamp'].dt.tz_convert(None)
+    watermarks = None
+    if incremental:
+        watermarks_path = get_watermarks_path(output_path)
+        watermarks = load_watermarks(watermarks_path)
 
-    if output_path:
+    args = (aggregations, start_time, end_time, signals, turbines, context_fields, n_jobs,
+            watermarks, wide, match)
+    if not chunked:
+        results = _extract_features(data, *args)
+        if output_path:
+            os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+            _write_results(results, output_path, incremental, output_format)
+            if incremental:
+                save_watermarks(watermarks, watermarks_path)
+        else:
+            return results
+
+    elif output_path:
         os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
-        LOGGER.info('Writing %s rows to %s', len(results), output_path)
-        results.to_csv(output_path, index=False)
+        for position, chunk in enumerate(data):
+            results = _extract_features(chunk, *args)
+            _write_results(results, output_path, incremental or position > 0, output_format)
+            if incremental:
+                save_watermarks(watermarks, watermarks_path)
+
     else:
-        return results
+        results = [_extract_features(chunk, *args) for chunk in data]
+        return pd.concat(results, ignore_index=True) if results else pd.DataFrame()
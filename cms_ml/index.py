@@ -0,0 +1,197 @@
+# -*- coding: utf-8 -*-
+
+"""cms_ml.index module."""
+
+import logging
+import re
+
+import numpy as np
+import pandas as pd
+
+LOGGER = logging.getLogger(__name__)
+
+MATCH_MODES = ('exact', 'contains')
+_NAT = np.iinfo(np.int64).min
+
+
+def _to_nanoseconds(time):
+    time = pd.to_datetime(time)
+    if time.tz:
+        time = time.tz_convert(None)
+
+    return time.value
+
+
+def _factorize(metadata, column):
+    if column not in metadata:
+        return np.zeros(len(metadata), dtype=np.int64), pd.Index([], dtype=object)
+
+    codes, categories = pd.factorize(metadata[column])
+    codes[codes < 0] = len(categories)   # missing values get a code of their own
+    return codes, pd.Index(categories)
+
+
+class MetadataIndex:
+    """Index over the turbine, signal and timestamp of each row of CMS data.
+
+    The turbine and signal ids are stored as integer codes, and the rows are sorted by
+    turbine, signal and timestamp, so selections are resolved with code lookups and
+    binary searches over the timestamps of each selected turbine and signal instead of
+    scanning all the rows. Building the index once and reusing it makes repeated
+    selections over the same data cheap.
+
+    Args:
+        metadata (pd.DataFrame):
+            Data with ``timestamp`` and, optionally, ``turbine_id`` and ``signal_id``
+            columns.
+    """
+
+    def __init__(self, metadata):
+        timestamps = pd.to_datetime(metadata['timestamp'])
+        if timestamps.dt.tz:
+            timestamps = timestamps.dt.tz_convert(None)
+
+        self.turbine_codes, self.turbines = _factorize(metadata, 'turbine_id')
+        self.signal_codes, self.signals = _factorize(metadata, 'signal_id')
+        self._num_signals = len(self.signals) + 1
+
+        groups = self.turbine_codes * self._num_signals + self.signal_codes
+        times = timestamps.to_numpy().view(np.int64)
+
+        self._order = np.lexsort((times, groups))
+        self._groups = groups[self._order]
+        self._times = times[self._order]
+
+    def __len__(self):
+        return len(self._order)
+
+    @staticmethod
+    def _lookup(categories, values, match):
+        if values is None:
+            return np.arange(len(categories) + 1)
+
+        if match == 'exact':
+            codes = categories.get_indexer(list(values))
+            return np.unique(codes[codes >= 0])
+
+        pattern = '|'.join(values)
+        return np.flatnonzero(categories.str.contains(pattern, na=False, case=False))
+
+    def select(self, start_time=None, end_time=None, signals=None, turbines=None,
+               match='exact'):
+        """Find the rows within a time range for the given signals and turbines.
+
+        Args:
+            start_time (str, datetime, optional):
+                The minimum timestamp, inclusive. Default is None.
+            end_time (str, datetime, optional):
+                The maximum timestamp, exclusive. Default is None.
+            signals (list, optional):
+                Signals to select. If None, all the signals are selected.
+                Default is None.
+            turbines (list, optional):
+                Turbines to select. If None, all the turbines are selected.
+                Default is None.
+            match (str):
+                How ``signals`` and ``turbines`` are matched. ``exact`` selects the ids
+                that are equal to one of the given values. ``contains`` selects the ids
+                that contain any of the given values, as case insensitive regular
+                expressions. Defaults to ``exact``.
+
+        Returns:
+            np.ndarray:
+                Sorted positions of the selected rows.
+        """
+        if match not in MATCH_MODES:
+            raise ValueError('Unknown match mode {}. Use one of {}'.format(match, MATCH_MODES))
+
+        turbine_codes = self._lookup(self.turbines, turbines, match)
+        signal_codes = self._lookup(self.signals, signals, match)
+        groups = (turbine_codes[:, None] * self._num_signals + signal_codes).ravel()
+
+        starts = np.searchsorted(self._groups, groups, side='left')
+        ends = np.searchsorted(self._groups, groups, side='right')
+
+        if start_time or end_time:
+            # missing timestamps are sorted first and never match a time range
+            lower = _to_nanoseconds(start_time) if start_time else _NAT + 1
+            upper = _to_nanoseconds(end_time) if end_time else None
+            for position, (start, end) in enumerate(zip(starts, ends)):
+                times = self._times[start:end]
+                starts[position] = start + np.searchsorted(times, lower, side='left')
+                if upper is not None:
+                    ends[position] = start + np.searchsorted(times, upper, side='left')
+
+        lengths = np.maximum(ends - starts, 0)
+        selected = np.repeat(starts - np.cumsum(lengths) + lengths, lengths)
+        selected += np.arange(lengths.sum())
+
+        return np.sort(self._order[selected])
+
+    def mask(self, *args, **kwargs):
+        """Get the selection of ``select`` as a boolean mask over the rows."""
+        mask = np.zeros(len(self), dtype=bool)
+        mask[self.select(*args, **kwargs)] = True
+        return mask
+
+
+class RowFilter:
+    """Time range and signal predicates to check on single rows while they are parsed.
+
+    The rows are selected like ``MetadataIndex.select`` does, so the parsers can skip
+    the spectra of the rows that would be filtered out afterwards without decoding them.
+
+    Args:
+        start_time (str, datetime, optional):
+            The minimum timestamp, inclusive. Default is None.
+        end_time (str, datetime, optional):
+            The maximum timestamp, exclusive. Default is None.
+        signals (list, optional):
+            Signals to select. If None, all the signals are selected. Default is None.
+        match (str):
+            How ``signals`` are matched, ``exact`` or ``contains``. See
+            ``MetadataIndex.select``. Defaults to ``exact``.
+    """
+
+    def __init__(self, start_time=None, end_time=None, signals=None, match='exact'):
+        if match not in MATCH_MODES:
+            raise ValueError('Unknown match mode {}. Use one of {}'.format(match, MATCH_MODES))
+
+        self.start = _to_nanoseconds(start_time) if start_time else None
+        self.end = _to_nanoseconds(end_time) if end_time else None
+        self.signals = None
+        self.pattern = None
+        if signals and match == 'exact':
+            self.signals = set(signals)
+        elif signals:
+            self.pattern = re.compile('|'.join(signals), re.IGNORECASE)
+
+    def __bool__(self):
+        return any(value is not None for value in (self.start, self.end, self.signals,
+                                                   self.pattern))
+
+    def keep_signal(self, signal_id):
+        """Tell whether a signal is selected."""
+        if self.signals is not None:
+            return signal_id in self.signals
+
+        if self.pattern is not None:
+            return isinstance(signal_id, str) and bool(self.pattern.search(signal_id))
+
+        return True
+
+    def keep_time(self, timestamp):
+        """Tell whether a timestamp, given as a string or a datetime, is within the time range."""
+        if self.start is None and self.end is None:
+            return True
+
+        if timestamp is None or timestamp == '' or pd.isnull(timestamp):
+            return False
+
+        time = _to_nanoseconds(timestamp)
+        return ((self.start is None or time >= self.start) and
+                (self.end is None or time < self.end))
+
+    def __call__(self, signal_id, timestamp):
+        """Tell whether a row with the given signal and timestamp is selected."""
+        return self.keep_signal(signal_id) and self.keep_time(timestamp)
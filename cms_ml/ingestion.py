@@ -0,0 +1,233 @@
+# -*- coding: utf-8 -*-
+
+"""cms_ml.ingestion module.
+
+Incremental ingestion of raw CMS files.
+
+The ingestion manifest is stored next to an output and records every raw file that
+has been parsed into it: its size, modification time, content hash and number of rows
+produced. On the next run only the files that are new or have changed are parsed, and
+their rows are merged into the existing output.
+"""
+
+import json
+import logging
+import os
+
+import pandas as pd
+
+from cms_ml.sidecar import get_signature
+from cms_ml.storage import merge_partitioned, write_partitioned
+
+LOGGER = logging.getLogger(__name__)
+
+KEYS = ('turbine_id', 'signal_id', 'sensor', 'measurement', 'timestamp')
+
+
+def get_manifest_path(output_path):
+    """Get the path of the ingestion manifest that belongs to an output path."""
+    return output_path + '.manifest.json'
+
+
+def load_manifest(path):
+    """Load the ingestion manifest stored in the given path.
+
+    Args:
+        path (str):
+            Path to the manifest JSON file.
+
+    Returns:
+        dict:
+            The ``size``, ``mtime_ns``, ``hash`` and ``rows`` of each ingested file,
+            keyed by the path of the file relative to the input directory. Empty if
+            the file does not exist.
+    """
+    if not os.path.isfile(path):
+        return dict()
+
+    with open(path) as manifest_file:
+        records = json.load(manifest_file)
+
+    return {record.pop('path'): record for record in records}
+
+
+def save_manifest(manifest, path):
+    """Store the ingestion manifest in the given path.
+
+    The file is written next to its final location and then moved, so an
+    interrupted write never leaves a corrupt manifest behind.
+
+    Args:
+        manifest (dict):
+            The ``size``, ``mtime_ns``, ``hash`` and ``rows`` of each ingested file,
+            keyed by the path of the file relative to the input directory.
+        path (str):
+            Path to the manifest JSON file.
+    """
+    records = [dict(path=name, **record) for name, record in sorted(manifest.items())]
+
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as manifest_file:
+        json.dump(records, manifest_file, indent=1)
+
+    os.replace(tmp_path, path)
+    LOGGER.info('Stored %s ingested files in %s', len(records), path)
+
+
+def find_changed(paths, manifest, root):
+    """Find the files that are not in the manifest or have changed since they were ingested.
+
+    Files with the same size and modification time as the ones recorded are considered
+    unchanged without reading them. If only the modification time differs, the content
+    hash is compared instead, and the manifest is updated with the new modification
+    time if the contents are the same.
+
+    Args:
+        paths (list):
+            Paths of the raw files.
+        manifest (dict):
+            The ingestion manifest, updated in place.
+        root (str):
+            Input directory the manifest paths are relative to.
+
+    Returns:
+        dict:
+            Signature of each new or changed file, keyed by its path, in the order
+            of ``paths``.
+    """
+    changed = dict()
+    for path in paths:
+        record = manifest.get(os.path.relpath(path, root))
+        signature = get_signature(path, with_hash=False)
+        if record and record['size'] == signature['size']:
+            if record['mtime_ns'] == signature['mtime_ns']:
+                continue
+
+            signature = get_signature(path)
+            if record['hash'] == signature['hash']:
+                record['mtime_ns'] = signature['mtime_ns']
+                continue
+
+        changed[path] = signature
+
+    LOGGER.info('Found %s new or changed files out of %s', len(changed), len(paths))
+    return changed
+
+
+def update_manifest(manifest, path, root, signature, rows):
+    """Record a file as ingested.
+
+    Args:
+        manifest (dict):
+            The ingestion manifest, updated in place.
+        path (str):
+            Path of the raw file.
+        root (str):
+            Input directory the manifest paths are relative to.
+        signature (dict):
+            Signature of the file when it was parsed, as returned by ``find_changed``.
+        rows (int):
+            Number of rows parsed from the file.
+    """
+    if signature['hash'] is None:
+        signature = get_signature(path)
+
+    record = dict(signature, rows=int(rows))
+    manifest[os.path.relpath(path, root)] = record
+
+
+def merge_output(data, output_path, output_format='csv', keys=KEYS):
+    """Merge new rows into an existing output, replacing the rows with the same keys.
+
+    A csv output is read and written again as a whole on every call, so its cost grows
+    with the size of the output rather than with the new rows. A Parquet output only
+    rewrites the partitions of the new rows, see ``cms_ml.storage.merge_partitioned``.
+
+    Args:
+        data (pd.DataFrame):
+            The new rows.
+        output_path (str):
+            Path to the csv file or to the Parquet dataset directory.
+        output_format (str):
+            Format of the output, ``csv`` or ``parquet``. Defaults to ``csv``.
+        keys (tuple):
+            Columns that identify a row. The ones that are missing in ``data`` are
+            ignored. Defaults to ``turbine_id``, ``signal_id``, ``timestamp`` and the
+            ``sensor`` and ``measurement`` of the MED files.
+
+    Returns:
+        pd.DataFrame or None:
+            The merged output if it is a csv file, otherwise None. If there are no
+            new rows, the output is left as it is.
+    """
+    keys = [key for key in keys if key in data]
+    if output_format == 'parquet':
+        if len(data):
+            merge_partitioned(data, output_path, keys)
+
+        return None
+
+    if os.path.isfile(output_path):
+        # the keys are read as text so ids such as ``0012`` or ``1001`` are kept as they were
+        existing = pd.read_csv(output_path, dtype={key: str for key in keys if key != 'timestamp'})
+        if 'timestamp' in existing:
+            existing['timestamp'] = pd.to_datetime(existing['timestamp'])
+
+        if not len(data):
+            return existing
+
+        data = pd.concat([existing, data], ignore_index=True, sort=False)
+        # the keys of the new rows may be numbers, so both sides are compared as text
+        duplicated = data[keys].astype(str).duplicated(keep='last')
+        data = data[~duplicated].reset_index(drop=True)
+    else:
+        os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+
+    LOGGER.info('Writing %s rows to %s', len(data), output_path)
+    data.to_csv(output_path, index=False)
+    return data
+
+
+def append_output(data, output_path, output_format='csv'):
+    """Append new rows to an output, creating it if it does not exist.
+
+    The rows are appended to the end of a csv output, unless they have columns that
+    are not in its header. The csv is then written again with the new columns, which
+    are left empty in the existing rows.
+
+    Args:
+        data (pd.DataFrame):
+            The new rows. If there are none, the output is left as it is.
+        output_path (str):
+            Path to the csv file or to the Parquet dataset directory. The Parquet
+            dataset is partitioned by turbine and month, see
+            ``cms_ml.storage.write_partitioned``.
+        output_format (str):
+            Format of the output, ``csv`` or ``parquet``. Defaults to ``csv``.
+    """
+    if not len(data):
+        return
+
+    if output_format == 'parquet':
+        write_partitioned(data, output_path, append=True)
+        return
+
+    if not os.path.isfile(output_path):
+        os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+        LOGGER.info('Writing %s rows to %s', len(data), output_path)
+        data.to_csv(output_path, header=True, index=False)
+        return
+
+    # the rows are appended under the header of the existing csv
+    columns = pd.read_csv(output_path, nrows=0).columns.tolist()
+    new_columns = [column for column in data.columns if column not in columns]
+    if new_columns:
+        # the header is the first line, so the existing rows are written again, as they
+        # were read, under the new one
+        LOGGER.warning('Rewriting %s to add the columns %s', output_path, new_columns)
+        existing = pd.read_csv(output_path, dtype=str, keep_default_na=False)
+        columns = columns + new_columns
+        existing.reindex(columns=columns, fill_value='').to_csv(output_path, index=False)
+
+    LOGGER.info('Appending %s rows to %s', len(data), output_path)
+    data.reindex(columns=columns).to_csv(output_path, mode='a', header=False, index=False)
@@ -2,24 +2,37 @@ import gc
 import json
 import logging
 import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from itertools import groupby
 
 import pandas as pd
 
+from cms_ml.index import RowFilter
+from cms_ml.ingestion import (
+    find_changed, get_manifest_path, load_manifest, merge_output, save_manifest, update_manifest)
+from cms_ml.parsers.compression import ZIP_EXTENSION, list_members, open_input
+from cms_ml.parsers.streaming import ColumnBuffer, LazyReader, get_reference, iter_json_array
+from cms_ml.schema import compact_context, concat_compact
+from cms_ml.storage import check_output_format, clear_partitioned, write_partitioned
 from cms_ml.utils import filter_values
 
 LOGGER = logging.getLogger(__name__)
 
+ERRORS = ('raise', 'skip')
 
-def _get_cms_values(entry):
-    """Parse a CMS JSON entry into a pd.Series containing the CMS values.
+
+def _get_values_rows(entry):
+    """Parse a CMS JSON entry into a list of rows with its CMS values.
 
     Args:
         entry (dict):
             A raw JSON entry containing CMS data.
 
     Returns:
-        pd.DataFrame:
-            Containing name,timeStamp,yValues extracted from the entry.
+        list:
+            Dicts with the ``signal_id``, ``timeStamp`` string and ``yValues``
+            of each dataset in the entry.
     """
     data = entry['data']
     details = entry['details']
@@ -33,33 +46,44 @@ def _get_cms_values(entry):
     else:
         raise ValueError('More than 2 datasets found')
 
-    result = []
-    for dataset, suffix in zip(datasets, suffixes):
-        result.append({
+    return [
+        {
             'signal_id': '_'.join([details['sensorName'], details['name'], suffix]).strip('_'),
             'timestamp': data['context']['timeStamp'],
             'values': dataset['yValues']
-        })
+        }
+        for dataset, suffix in zip(datasets, suffixes)
+    ]
+
+
+def _get_cms_values(entry):
+    """Parse a CMS JSON entry into a pd.Series containing the CMS values.
+
+    Args:
+        entry (dict):
+            A raw JSON entry containing CMS data.
 
-    result = pd.DataFrame(result)
+    Returns:
+        pd.DataFrame:
+            Containing name,timeStamp,yValues extracted from the entry.
+    """
+    result = pd.DataFrame(_get_values_rows(entry))
     result['timestamp'] = pd.to_datetime(result['timestamp'])
 
     return result
 
 
-def _get_cms_context(entry, fields=None):
-    """Parse a CMS JSON entry into a pd.Series containing the desired CMS context.
+def _get_context_rows(entry):
+    """Parse a CMS JSON entry into a list with a row of CMS context.
 
     Args:
         entry (dict):
             A raw JSON entry containing CMS data.
-        fields (list, None, optional):
-            CMS context fields to select for. If None, return all
-            context fields (every field except yValues). Default is None.
 
     Returns:
-        pd.DataFrame:
-            Containing context values extracted from the entry.
+        list:
+            A single dict with the ``signal_id``, ``timeStamp`` string and every
+            context field of the entry except ``yValues``.
     """
     row = entry['details'].copy()
     row.update(entry['location'])
@@ -80,9 +104,63 @@ def _get_cms_context(entry, fields=None):
     del dataset["yValues"]
     row.update(dataset)
 
-    output = pd.DataFrame([row])
-    output.insert(0, 'timestamp', pd.to_datetime(output.pop('timeStamp')))
-    output.insert(0, 'signal_id', output.pop('name'))
+    output = {'signal_id': row.pop('name'), 'timestamp': row.pop('timeStamp')}
+    output.update(row)
+
+    return [output]
+
+
+def _get_cms_rows(entry, fields=None):
+    """Parse a CMS JSON entry into a list of rows with its CMS context and values.
+
+    Args:
+        entry (dict):
+            A raw JSON entry containing CMS data.
+        fields (list, None, optional):
+            CMS context fields to select for. If None, return all
+            context fields. Default is None.
+
+    Returns:
+        list:
+            One dict per dataset in the entry with the ``signal_id``, ``timeStamp``
+            string, the context fields of the entry and dataset and the ``yValues``.
+    """
+    context = _get_context_rows(entry)[0]
+    columns = None
+    if fields is not None:
+        columns = ['signal_id', 'timestamp'] + list(fields)
+
+    rows = list()
+    for dataset, values in zip(entry['data']['set'], _get_values_rows(entry)):
+        row = context.copy()
+        row.update(dataset)
+        del row['yValues']
+        row['signal_id'] = values['signal_id']
+        if columns is not None:
+            row = {column: row[column] for column in columns if column in row}
+
+        row['values'] = values['values']
+        rows.append(row)
+
+    return rows
+
+
+def _get_cms_context(entry, fields=None):
+    """Parse a CMS JSON entry into a pd.Series containing the desired CMS context.
+
+    Args:
+        entry (dict):
+            A raw JSON entry containing CMS data.
+        fields (list, None, optional):
+            CMS context fields to select for. If None, return all
+            context fields (every field except yValues). Default is None.
+
+    Returns:
+        pd.DataFrame:
+            Containing context values extracted from the entry.
+    """
+    output = pd.DataFrame(_get_context_rows(entry))
+    output['timestamp'] = pd.to_datetime(output['timestamp'])
     if fields is not None:
         if 'signal_id' in fields:
             fields.remove('signal_id')
@@ -104,42 +182,177 @@ def _parse_cms_jsons(jsons_path, parser, *args, **kwargs):
         jsons_path (str):
             The file path to a folder containing the jsons for one turbine.
         parser (function):
-            Function used to parse a JSON entry into a pandas Series.
-            An example is get_cms_context.
+            Function used to parse a JSON entry into a pandas DataFrame or a
+            list of dicts, one per row. An example is _get_context_rows.
         *args, **kwargs:
             Additional args and kwargs to pass to the parser function.
 
     Returns:
         pd.DataFrame:
-            Contains the data parsed from the JSON file(s).
+            Contains the data parsed from the JSON file(s). Spectra parsed into
+            the ``values`` column are returned as lists of floats.
     """
-    parsed = pd.DataFrame()
+    parsed = ColumnBuffer()
     LOGGER.info('Parsing JSON files from folder %s', jsons_path)
-    for filename in os.listdir(jsons_path):
+    for filename in sorted(os.listdir(jsons_path)):
         json_file = os.path.join(jsons_path, filename)
-
-        LOGGER.debug('Parsing JSON file %s', json_file)
-        with open(json_file) as f:
-            for entry in json.load(f):
-                parsed_entry = parser(entry, *args, **kwargs)
-                parsed = parsed.append(parsed_entry, ignore_index=True, sort=False)
+        parsed.extend(_parse_cms_json_file(json_file, parser, *args, **kwargs))
 
     LOGGER.info('%s entries loaded', len(parsed))
+    return parsed.to_dataframe()
+
+
+def _parse_lazy_entries(member, parser, lazy, row_filter, *args, **kwargs):
+    """Parse the rows of a JSON file without decoding the spectra of the rows left out."""
+    with open_input(member, 'rb') as f:
+        reader = LazyReader(f, keep=not lazy)
+        for position, entry in enumerate(iter_json_array(reader)):
+            rows = parser(entry, *args, **kwargs)
+            if isinstance(rows, pd.DataFrame):
+                rows = rows.to_dict('records')
+
+            indexes = [row['values'] for row in rows if isinstance(row['values'], int)]
+            for row in rows:
+                if row_filter and not row_filter(row['signal_id'], row['timestamp']):
+                    continue
+
+                if lazy:
+                    yield get_reference(row, member, position, reader.ranges)
+                else:
+                    if isinstance(row['values'], int):
+                        row['values'] = json.loads(reader.arrays[row['values']])
+
+                    yield row
+
+            if indexes and not lazy:
+                reader.release(max(indexes))
+
+
+def _parse_cms_json_file(json_file, parser, *args, lazy=False, row_filter=None, **kwargs):
+    """Parse the entries of a JSON file into a ``ColumnBuffer``.
+
+    Compressed files are decompressed while they are read, and every file inside a zip
+    archive is parsed, see ``cms_ml.parsers.compression``.
+
+    If ``lazy``, the ``yValues`` are not decoded and each row gets a reference to its
+    spectrum instead of the ``values``, see ``cms_ml.parsers.streaming.get_reference``.
+
+    If a ``cms_ml.index.RowFilter`` is given, the rows are checked against it right
+    after their signal and timestamp are parsed, and the spectra of the rows that do
+    not pass it are never decoded.
+    """
+    parsed = ColumnBuffer()
+    for member in list_members(json_file):
+        LOGGER.debug('Parsing JSON file %s', member)
+        if lazy or row_filter:
+            parsed.extend(_parse_lazy_entries(member, parser, lazy, row_filter, *args, **kwargs))
+            continue
+
+        with open_input(member) as f:
+            for entry in iter_json_array(f):
+                parsed.extend(parser(entry, *args, **kwargs))
+
     return parsed
 
 
+def _parse_task(task):
+    """Parse a file, returning the error instead of raising it so it only affects the file."""
+    _, json_file, parser, lazy, row_filter = task
+    try:
+        return _parse_cms_json_file(json_file, parser, lazy=lazy, row_filter=row_filter), None
+    except Exception as error:
+        return None, error
+
+
+def _list_json_files(jsons_path, turbines):
+    """List the JSON files of each selected turbine, sorted by turbine and name.
+
+    The files of a turbine are the ones in its folder, or the zip archive named after it.
+    """
+    files = list()
+    for name in os.listdir(jsons_path):
+        path = os.path.join(jsons_path, name)
+        if os.path.isdir(path):
+            json_files = [os.path.join(path, filename) for filename in os.listdir(path)]
+        elif name.lower().endswith(ZIP_EXTENSION):
+            name = name[:-len(ZIP_EXTENSION)]
+            json_files = [path]
+        else:
+            continue
+
+        if (not turbines) or (name in turbines):
+            files.extend((name, json_file) for json_file in json_files)
+
+    return sorted(files)
+
+
+def _parse_turbines(files, parser, n_jobs, errors, lazy=False, row_filter=None):
+    """Parse the JSON files of each turbine folder.
+
+    Every file is parsed on its own, in a process pool if ``n_jobs`` is greater than 1,
+    and the results are merged following the sorted turbine and file names, so the
+    output does not depend on the order in which the files are parsed.
+
+    Yields:
+        tuple:
+            The name of the turbine, a ``ColumnBuffer`` with its rows and the number
+            of rows parsed from each file, keyed by path. Files that could not be
+            parsed are left out.
+    """
+    tasks = [(name, json_file, parser, lazy, row_filter) for name, json_file in files]
+
+    if n_jobs == -1:
+        n_jobs = os.cpu_count()
+
+    executor = None
+    if n_jobs and n_jobs > 1 and len(tasks) > 1:
+        LOGGER.info('Parsing %s JSON files with %s processes', len(tasks), n_jobs)
+        executor = ProcessPoolExecutor(max_workers=n_jobs)
+        results = executor.map(_parse_task, tasks)
+    else:
+        results = map(_parse_task, tasks)
+
+    try:
+        for name, turbine_results in groupby(zip(tasks, results), key=lambda item: item[0][0]):
+            gc.collect()
+            parsed = ColumnBuffer()
+            rows = dict()
+            for (_, json_file, *_), (buffer, error) in turbine_results:
+                if error is None:
+                    parsed.extend(buffer)
+                    rows[json_file] = len(buffer)
+                elif errors == 'raise':
+                    raise error
+                else:
+                    LOGGER.warning('Skipping JSON file %s: %s', json_file, error)
+
+            yield name, parsed, rows
+
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+
 def extract_cms_jsons(jsons_path, output_path=None, start_time=None,
-                      end_time=None, signals=None, turbines=None, context_fields=True):
+                      end_time=None, signals=None, turbines=None, context_fields=True,
+                      output_format='csv', match='exact', n_jobs=None, errors='raise',
+                      incremental=False, context_schema=None, lazy=False):
     """Extract CMS data from JSONS.
 
     User function that loads and extracts FFT timeseries from JSON files.
 
+    The time range and signals are checked on the timestamp and signal of each entry
+    before its ``yValues`` are decoded, so the spectra of the entries left out are
+    skipped instead of parsed and then filtered.
+
     Args:
         jsons_path (str):
             The file path to the directory with turbines folders
-            containing JSON files.
+            containing JSON files. The JSON files can be compressed with gzip or
+            inside zip archives, and the folder of a turbine can be a zip archive
+            named after it, see ``cms_ml.parsers.compression``.
         output_path (str, optional):
-            The path where the csvs will be stored.
+            The path where the csv file, or the Parquet dataset directory, will be stored.
         start_time (str, datetime, optional):
             The minimum timestamp, inclusive.
             If None, the timestamps have no minimum. Default is None.
@@ -155,6 +368,39 @@ def extract_cms_jsons(jsons_path, output_path=None, start_time=None,
         context_fields (bool or list):
             If ``bool`` whether or not to parse the context columns from the jsons. If ` `list``
             parse only the given list of fields from the context. Defaults to ``True``.
+        output_format (str):
+            Format of the output, ``csv`` or ``parquet``. With ``parquet`` the spectra
+            are stored as list arrays in a dataset partitioned by turbine and month, see
+            ``cms_ml.storage.write_partitioned``. Defaults to ``csv``.
+        match (str):
+            How ``signals`` are matched, ``exact`` or ``contains``. See
+            ``cms_ml.utils.filter_values``. Defaults to ``exact``.
+        n_jobs (int, optional):
+            Number of processes used to parse the JSON files, one file at a time.
+            ``-1`` means using all the processors. If ``None`` or ``1``, run in the
+            current process. The output is the same either way. Default is None.
+        errors (str):
+            What to do when a JSON file cannot be parsed. ``raise`` raises the error
+            and ``skip`` logs it and leaves the entries of the file out of the output.
+            Defaults to ``raise``.
+        incremental (bool):
+            If ``True``, only parse the JSON files that are new or have changed since
+            the previous run and merge their rows into ``output_path``, replacing the
+            rows with the same turbine, signal and timestamp. The ingested files are
+            recorded next to the output in a ``.manifest.json`` file, see
+            ``cms_ml.ingestion``. Requires an output path and cannot be combined with
+            ``start_time``, ``end_time``, ``signals`` or ``lazy``. Defaults to ``False``.
+        context_schema (dict, optional):
+            Dtypes of the context columns, keyed by column name, such as ``float32``,
+            ``int32`` or ``category``. The dtypes of the context columns that are
+            not given are inferred across all the entries, see
+            ``cms_ml.schema.compact_context``. Default is None.
+        lazy (bool):
+            If ``True``, the spectra are not decoded. Instead of the ``values``, each
+            row gets the ``spectrum_file``, ``spectrum_entry``, ``spectrum_start`` and
+            ``spectrum_end`` of its spectrum, which ``aggregate_features`` and
+            ``cms_ml.parsers.streaming.load_spectra`` use to decode only the spectra
+            of the rows that are left. Defaults to ``False``.
 
     Returns:
         pd.DataFrame or None:
@@ -165,30 +411,75 @@ def extract_cms_jsons(jsons_path, output_path=None, start_time=None,
             If an output path is not provided and there are multiple turbines
             specified, a dictionary of dataframes keyed by the turbine is returned.
     """
-    # traversing the directories
-    results = pd.DataFrame()
-    for name in os.listdir(jsons_path):
-        path = os.path.join(jsons_path, name)
-        if os.path.isdir(path) and ((not turbines) or (name in turbines)):
-            gc.collect()
-            data = _parse_cms_jsons(path, _get_cms_values)
-            if context_fields:
-                parsed_context = _parse_cms_jsons(path, _get_cms_context)
-                if isinstance(context_fields, list):
-                    parsed_context = parsed_context[[context_fields]]
+    check_output_format(output_format)
+    if errors not in ERRORS:
+        raise ValueError('Unknown errors value {}. Use one of {}'.format(errors, ERRORS))
+
+    if incremental and not output_path:
+        raise ValueError('An output_path is required to extract the JSONs incrementally')
+
+    if incremental and (start_time is not None or end_time is not None or signals is not None):
+        # the manifest would record the files as ingested even though some rows were skipped
+        raise ValueError(
+            'The time range and signals cannot be filtered while extracting incrementally')
+
+    if incremental and lazy:
+        # the lazy rows only point to the spectra in the raw files, which later runs may change
+        raise ValueError('The spectra cannot be left undecoded while extracting incrementally')
+
+    files = _list_json_files(jsons_path, turbines)
+    if incremental:
+        manifest_path = get_manifest_path(output_path)
+        manifest = load_manifest(manifest_path)
+        changed = find_changed([json_file for _, json_file in files], manifest, jsons_path)
+        files = [(name, json_file) for name, json_file in files if json_file in changed]
+
+    parser = _get_values_rows
+    if context_fields:
+        fields = context_fields if isinstance(context_fields, list) else None
+        parser = partial(_get_cms_rows, fields=fields)
+
+    # the rows are filtered while they are parsed, before their spectra are decoded
+    row_filter = RowFilter(start_time, end_time, signals, match)
+
+    results = list()
+    ingested = dict()
+    for name, parsed, rows in _parse_turbines(files, parser, n_jobs, errors, lazy, row_filter):
+        ingested.update(rows)
+        if not len(parsed):
+            LOGGER.warning('No entries found for turbine %s', name)
+            continue
+
+        data = parsed.to_dataframe()
+        data['timestamp'] = pd.to_datetime(data['timestamp'])
+        filtered = filter_values(
+            data, start_time=start_time, end_time=end_time, signals=signals, match=match)
+
+        filtered.insert(0, 'turbine_id', name)
+        results.append(compact_context(filtered, context_schema))
+
+    if results:
+        # the dtypes inferred for each turbine may differ, so they are inferred again
+        results = compact_context(concat_compact(results), context_schema)
+    else:
+        results = pd.DataFrame()
 
-                data = parsed_context.merge(data)
+    if len(results) and results['timestamp'].dt.tz:
+        results['timestamp'] = results['timestamp'].dt.tz_convert(None)
 
-            filtered = filter_values(
-                data, start_time=start_time, end_time=end_time, signals=signals)
+    if incremental:
+        if len(results):
+            merge_output(results, output_path, output_format)
 
-            filtered.insert(0, 'turbine_id', name)
-            results = results.append(filtered, ignore_index=True, sort=False)
+        for json_file, rows in ingested.items():
+            update_manifest(manifest, json_file, jsons_path, changed[json_file], rows)
 
-    if results['timestamp'].dt.tz:
-        results['timestamp'] = results['timestamp'].dt.tz_convert(None)
+        save_manifest(manifest, manifest_path)
 
-    if output_path:
+    elif output_path and output_format == 'parquet':
+        clear_partitioned(output_path)
+        write_partitioned(results, output_path, append=True)
+    elif output_path:
         os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
         LOGGER.info('Writing %s rows to %s', len(results), output_path)
         results.to_csv(output_path, index=False)
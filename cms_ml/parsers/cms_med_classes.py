@@ -4,6 +4,8 @@ from copy import copy, deepcopy
 from datetime import datetime as dt
 import re
 
+from cms_ml.parsers.compression import open_input
+
 
 frequent_rms_categories = ['4000', '100', 'env_400']
 
@@ -47,7 +49,7 @@ class SensorData:
 
     """
 
-    def __init__(self, name, data, rms_categories):
+    def __init__(self, name, data, rms_categories, row_filter=None):
 
         self.name = name[:name.index(',')].lstrip('"').rstrip('"')
 
@@ -127,7 +129,11 @@ class SensorData:
             else:
                 timestamp = ''
 
-            self.observations.append(observation)
+            # Observations out of the time range of the filter are dropped before their rows are
+            # built
+            start = observation['timestamp'][0] if observation['timestamp'] else None
+            if row_filter is None or row_filter.keep_time(start):
+                self.observations.append(observation)
 
 
     def rms_data_as_df(self):
@@ -164,9 +170,12 @@ class SensorData:
 class MEDData:
     """
     This class contains sensor data read from a .med file. It parses the files and stores and classifies its data.
+
+    If a cms_ml.index.RowFilter is given, the sensors whose name does not pass it are skipped and
+    the observations out of its time range are dropped.
     """
 
-    def __init__(self, path, from_file=True, filename=None):
+    def __init__(self, path, from_file=True, filename=None, row_filter=None):
         if filename is None or not isinstance(filename, str):
             self.alias = ''
             self.filename = ''
@@ -183,6 +192,7 @@ class MEDData:
         # Remaining data contains the string of data that has not been parsed yet.
         self.remaining_data = None
         self.sensor_data = dict()
+        self.row_filter = row_filter
         self.parse_file(from_file=from_file)
         self.parse_sensor_data()
 
@@ -215,15 +225,18 @@ class MEDData:
                 sensor_data[current_sensor].append(el)
 
         for k, v in sensor_data.items():
+            # Sensors that are filtered out are skipped without parsing their data
+            if self.row_filter and not self.row_filter.keep_signal(k.split(',')[0].strip('"')):
+                continue
             try:
-                s_data = SensorData(k, v, ['4000', '100', 'env_400'])
+                s_data = SensorData(k, v, ['4000', '100', 'env_400'], row_filter=self.row_filter)
                 self.sensor_data.update({s_data.name: s_data})
             except Exception as e:
                 print('Error parsing {0}: {1}'.format(k, e))
 
     def parse_file(self, from_file=True):
         if from_file:
-            with open(self.file, 'rb') as file:
+            with open_input(self.file, 'rb') as file:
                 data = file.readlines()
 
             self.file_data = b"".join(data)
@@ -1,23 +1,35 @@
 from configparser import RawConfigParser, ConfigParser
+from cms_ml.index import RowFilter
 from cms_ml.parsers.cms_med_classes import MEDData
+from cms_ml.parsers.compression import open_input
+from cms_ml.parsers.directory import parse_directory
+from cms_ml.parsers.txt_blocks import iter_spec_channels
+from cms_ml.parsers.waveforms import CHUNK_LINES, RunningStats, WaveformWriter, decode_chunk
 import pandas as pd
 import os
 import re
-import numpy as np
 from io import StringIO
 from datetime import datetime as dt
-import glob
 
 
 # TODO: Add a column renaming dictionary. Default none.
 
-def parse_cms_txt(filedir, out=None, renamer=None):
+def parse_cms_txt(filedir, out=None, renamer=None, start_time=None, end_time=None, signals=None,
+                  match='exact'):
     """
     Parses txt file containing CMS data into a dataframe
-    :param str filedir: route to the file to be parsed
-    :param str out: if not None, out should be a valid directory into which the dataframe will be output as a CSV file.
-    Invalid directories will raise an Error.
+    :param str filedir: route to the file to be parsed. It can be compressed with gzip or inside a
+    zip archive, see cms_ml.parsers.compression
+    :param str out: if not None, out should be a valid directory into which the dataframe will be
+    output as a CSV file. Invalid directories will raise an Error.
     :param dict renamer: dict containing new names for the columns of the output dataframe.
+    :param str start_time: if not None, the channels that start before it are skipped without
+    parsing their data
+    :param str end_time: if not None, the channels that start at it or after it are skipped without
+    parsing their data
+    :param list signals: if not None, the channels whose signal_id is not one of the given signals
+    are skipped without parsing their data
+    :param str match: how the signals are matched, exact or contains. See cms_ml.index.RowFilter
     :return: pd.DataFrame containing the parsed information
     """
     filename = filedir.split('\\')[-1].split('/')[-1].split('.txt')[0]
@@ -31,53 +43,29 @@ def parse_cms_txt(filedir, out=None, renamer=None):
         if file_exists:
             raise Exception('File with name {}.csv already exists in given path'.format(filename))
 
-    with open(filedir, 'r') as file:
-        end_process_token = '#--finish--'
-        state = 0
-        ini_io = StringIO()
-        data_array = dict()
-        cur_data = ''
-        for line in file.readlines():
-            if state == 0:
-                if re.findall('^\[.*specchannel.*\]$', line):
-                    cur_data = line.split('[')[1].split(']')[0]
-                if re.findall('^\[.*specdata.*\]$', line):
-                    state = 1
-                    data_array.update({cur_data: StringIO()})
-                    continue
-                ini_io.write(line)
-            elif state == 1:
-                if line.strip() == end_process_token:
-                    ini_io.write(line)
-                    state = 0
-                    continue
-                data_array[cur_data].write(line)
-            else:
-                ini_io.write(line)
-        file.close()
-
-    ini_io.seek(0)
-    config_parser = RawConfigParser()
-    config_parser.read_file(ini_io)
+    row_filter = RowFilter(start_time, end_time, signals, match)
 
-    out_df = pd.DataFrame()
+    # Only the section headers are scanned, and the channels that are filtered out are skipped
+    # before their data is decoded
+    with open_input(filedir) as file:
+        text = file.read()
 
-    for k, el in data_array.items():
-        el.seek(0)
-        p = el.getvalue()
-        p = list(np.array(p.split('\n')[:-1]).astype('float64'))
-        metadata = {i: config_parser[k][i] for i in config_parser[k]}
+    rows = list()
+    for k, header, values in iter_spec_channels(text, row_filter):
+        metadata = {i: header[i] for i in header}
         dic = dict()
         dic['turbine_id'] = metadata['szsystemid']
         dic['signal_id'] = '_'.join([metadata['szlabel'], metadata['ianalysisid'], k])
         dic['timestamp'] = dt.fromtimestamp(int(metadata['starttime']))
-        dic.update({'values': p})
+        dic.update({'values': values.tolist()})
         metadata.pop('szsystemid')
         metadata.pop('szlabel')
         metadata.pop('ianalysisid', '')
         metadata.pop('starttime')
         dic.update(metadata)
-        out_df = out_df.append([dic])
+        rows.append(dic)
+
+    out_df = pd.DataFrame(rows)
 
     if renamer is not None:
         aux = dict()
@@ -91,13 +79,19 @@ def parse_cms_txt(filedir, out=None, renamer=None):
     return out_df
 
 
-def parse_adu_cms_txt(filedir, out=None, renamer=None):
+def parse_adu_cms_txt(filedir, out=None, renamer=None, dtype='float64', waveform_dir=None):
     """
     Parses txt file containing "adu format" CMS data into a dataframe
-    :param str filedir: route to the file to be parsed
-    :param str out: if not None, out should be a valid directory into which the dataframe will be output as a CSV file.
-    Invalid directories will raise an Error.
+    :param str filedir: route to the file to be parsed. It can be compressed with gzip or inside a
+    zip archive, see cms_ml.parsers.compression
+    :param str out: if not None, out should be a valid directory into which the dataframe will be
+    output as a CSV file. Invalid directories will raise an Error.
     :param dict renamer: dict containing new names for the columns of the output dataframe.
+    :param str dtype: dtype in which the raw waveforms are stored, float32 or float64
+    :param str waveform_dir: if not None, the raw waveforms are not kept in the output. Instead,
+    they are written to files in the given directory while they are decoded, and the path of the
+    file is stored in the "waveform_file" column. The files can be memory-mapped with
+    cms_ml.parsers.waveforms.load_waveform
     :return: pd.DataFrame containing the parsed information
     """
     filename = filedir.split('\\')[-1].split('/')[-1].split('.txt')[0]
@@ -110,16 +104,22 @@ def parse_adu_cms_txt(filedir, out=None, renamer=None):
         file_exists = os.path.isfile(os.path.join(out, '.'.join([filename, 'csv'])))
         if file_exists:
             raise Exception('File with name {}.csv already exists in given path'.format(filename))
+    if waveform_dir is not None and not os.path.isdir(waveform_dir):
+        raise Exception('{} is not a valid existing path'.format(waveform_dir))
 
-    with open(filedir, 'r') as file:
+    # The data lines are decoded in chunks while the file is read, so the text of a whole block is
+    # never kept
+    with open_input(filedir) as file:
         end_process_token = '#--finish--'
         state = 0
         ini_io = StringIO()
-        data_array = dict()
+        stats = dict()
+        raw_data = dict()
         cur_data = ''
         adu_chan = ''
-        raw_data = dict()
-        for line in file.readlines():
+        target = None
+        chunk = list()
+        for line in file:
             if state == 0:
                 if re.findall('^\[.*prescanopc.*\]$', line) and not re.findall('^\[.*data.*\]$', line):
                     cur_data = line.split('[')[1].split(']')[0]
@@ -127,58 +127,52 @@ def parse_adu_cms_txt(filedir, out=None, renamer=None):
                     adu_chan = line.split('[')[1].split(']')[0]
                 if re.findall('^\[.*data.*\]$', line) and not re.findall('^\[.*adudata.*\]$', line):
                     state = 1
-                    data_array.update({cur_data: StringIO()})
+                    target = stats[cur_data] = RunningStats()
                     continue
                 if re.findall('^\[.*adudata.*\]$', line):
                     state = 2
-                    raw_data.update({adu_chan: StringIO()})
+                    path = None
+                    if waveform_dir is not None:
+                        path = os.path.join(waveform_dir, '_'.join([filename, adu_chan]))
+                    target = raw_data[adu_chan] = WaveformWriter(dtype, path)
                 ini_io.write(line)
-            elif state == 1:
-                if line.strip() == end_process_token:
-                    ini_io.write(line)
-                    state = 0
-                    continue
-                data_array[cur_data].write(line.split()[1]+'\n')
-            elif state == 2:
-                if line.strip() == end_process_token:
-                    ini_io.write(line)
-                    state = 0
-                    continue
-                raw_data[adu_chan].write(line)
-            else:
+                continue
+            if line.strip() == end_process_token:
+                decode_chunk(target, chunk)
+                chunk = list()
                 ini_io.write(line)
-        file.close()
+                state = 0
+                continue
+            chunk.append(line)
+            if len(chunk) == CHUNK_LINES:
+                decode_chunk(target, chunk)
+                chunk = list()
+        if state != 0:
+            decode_chunk(target, chunk)
 
     ini_io.seek(0)
     config_parser = RawConfigParser()
     config_parser.read_file(ini_io)
 
-    out_df = pd.DataFrame()
     metrics = dict()
-    for k, el in data_array.items():
-        el.seek(0)
-        p = el.getvalue()
+    for k, el in stats.items():
         metadata = {i: config_parser[k][i] for i in config_parser[k]}
-        p = np.array(p.split('\n')[:-1]).astype('float64')
-        mean = p.mean()
-        maximum = np.max(p)
-        minimum = np.min(p)
-        std = p.std()
         starttime = dt.fromtimestamp(int(metadata['starttime']))
         label = metadata['szlabel']
-        row = {label+'_mean': mean,
-               label+'_min': minimum,
-               label+'_max': maximum,
-               label+'_std': std,
+        row = {label+'_mean': el.mean,
+               label+'_min': el.min,
+               label+'_max': el.max,
+               label+'_std': el.std,
                'timestamp': starttime}
         metrics.update(row)
 
     for k, v in raw_data.items():
-        v.seek(0)
-        p = v.getvalue()
-        p = np.array(p.split('\n')[:-1]).astype('float64')
-        metrics.update({'values': p})
-    out_df = out_df.append([metrics])
+        waveform = v.close()
+        if waveform_dir is None:
+            metrics.update({'values': waveform})
+        else:
+            metrics.update({'waveform_file': waveform})
+    out_df = pd.DataFrame([metrics])
 
     if renamer is not None:
         aux = dict()
@@ -192,50 +186,43 @@ def parse_adu_cms_txt(filedir, out=None, renamer=None):
     return out_df
 
 
-def parse_cms_directory(input_directory, parser, renamer=None, out=None, out_filename=None):
+def parse_cms_directory(input_directory, parser, renamer=None, out=None, out_filename=None,
+                        **kwargs):
     """
 
-    :param str input_directory: Directory through which the method will iterate
+    :param str input_directory: Directory through which the method will iterate. The .txt.gz files
+    and the .txt files inside .zip archives are parsed as well
     :param str parser: parser function to execute
     :param dict renamer: dict containing new names for the columns of the output dataframe.
     :param str out: Optional output directory for dataframe.
-    :param str out_filename: Optional filename for the output dataframe. Requires out to be not None. If given an output
-    directory but not a filename, the output filename will default to "parser_output.csv"
+    :param str out_filename: Optional filename for the output dataframe. Requires out to be not
+    None. If given an output directory but not a filename, the output filename will default to
+    "parser_output.csv"
+    :param kwargs: incremental parsing, filtering, parallelism, error handling, batching and output
+    format options, see cms_ml.parsers.directory.parse_directory
     :return: pd.DataFrame containing the parsed information.
     """
-    # Check output directory
-    if out is not None:
-        if out_filename is None:
-            out_filename = 'parser_output'
-        path_exists = os.path.isdir(out)
-        if not path_exists:
-            raise Exception('{} is not a valid existing path'.format(out))
-        file_exists = os.path.isfile(os.path.join(out, '.'.join([out_filename, 'csv'])))
-        if file_exists:
-            raise Exception('File with name {}.csv already exists in given path'.format(out_filename))
-
-    path_exists = os.path.isdir(input_directory)
-    if not path_exists:
-        raise Exception('{} is not a valid existing path'.format(input_directory))
-
-    out_df = pd.DataFrame()
-
-    for el in glob.glob(os.path.join(input_directory, '*.txt')):
-        out_df = out_df.append(parser(el, renamer=renamer))
-
-    if out is not None:
-        out_df.to_csv(os.path.join(out, '.'.join([out_filename, 'csv'])), header=True, index=False)
-    return out_df
+    return parse_directory(input_directory, parser, '*.txt', renamer=renamer, out=out,
+                           out_filename=out_filename, **kwargs)
 
 
-def parse_med_txt(filedir, turbine_id='', rms=False, out=None, renamer=None):
+def parse_med_txt(filedir, turbine_id='', rms=False, out=None, renamer=None, start_time=None,
+                  end_time=None, signals=None, match='exact'):
     """
 
-    :param str filedir: route to the file to be parsed
-    :param str turbine_id: id of the turbine to be parsed. If not specified, it will be retrieved from the .MED file
+    :param str filedir: route to the file to be parsed. It can be compressed with gzip or inside a
+    zip archive, see cms_ml.parsers.compression
+    :param str turbine_id: id of the turbine to be parsed. If not specified, it will be retrieved
+    from the .MED file
     :param bool rms: if true, adds rms data as raw lists to the dataframe. Otherwise, it skips it
-    :param str out: if not None, it should be a valid directory to which the dataframe is output as a csv
+    :param str out: if not None, it should be a valid directory to which the dataframe is output as
+    a csv
     :param dict renamer: dict containing new names for the columns of the output dataframe.
+    :param str start_time: if not None, the observations that start before it are dropped
+    :param str end_time: if not None, the observations that start at it or after it are dropped
+    :param list signals: if not None, the sensors that are not one of the given signals are skipped
+    without parsing their data
+    :param str match: how the signals are matched, exact or contains. See cms_ml.index.RowFilter
     :return: pd.DataFrame containing the parsed information. 
     """
     filename = filedir.split('\\')[-1].split('/')[-1].split('.med')[0]
@@ -248,7 +235,8 @@ def parse_med_txt(filedir, turbine_id='', rms=False, out=None, renamer=None):
         if file_exists:
             raise Exception('File with name {}.csv already exists in given path'.format(filename))
 
-    parser = MEDData(filedir, filename=filename)
+    row_filter = RowFilter(start_time, end_time, signals, match)
+    parser = MEDData(filedir, filename=filename, row_filter=row_filter)
     if turbine_id:
         parser.set_turbine(turbine=turbine_id)
     parsed = parser.to_dataframe(rms=rms)
@@ -0,0 +1,178 @@
+# -*- coding: utf-8 -*-
+
+"""cms_ml.parsers.compression module.
+
+Transparent reading of compressed raw CMS files.
+
+The raw files can be given as they are, compressed with gzip, such as ``a.json.gz``, or
+inside a zip archive. The files inside a zip archive are referred to by the path of the
+archive followed by their name, such as ``T001.zip/a.json``, and ``list_members``
+expands an archive into those paths. ``open_input`` opens any of them, decompressing
+the contents as they are read, so nothing is extracted to disk.
+"""
+
+import fnmatch
+import glob
+import gzip
+import io
+import logging
+import os
+import zipfile
+
+LOGGER = logging.getLogger(__name__)
+
+GZIP_EXTENSION = '.gz'
+ZIP_EXTENSION = '.zip'
+
+
+def split_archive(path):
+    """Split the path of a file inside a zip archive into the archive and member paths.
+
+    Args:
+        path (str):
+            Path to a file, or to a file inside a zip archive.
+
+    Returns:
+        tuple:
+            The path of the zip archive and the name of the file inside it, or the
+            given path and None if it does not point inside a zip archive.
+    """
+    position = path.lower().find(ZIP_EXTENSION)
+    while position >= 0:
+        end = position + len(ZIP_EXTENSION)
+        if path[end:end + 1] in ('/', os.sep) and os.path.isfile(path[:end]):
+            return path[:end], path[end + 1:].replace(os.sep, '/')
+
+        position = path.lower().find(ZIP_EXTENSION, end)
+
+    return path, None
+
+
+def _open_member(archive, member):
+    with zipfile.ZipFile(archive) as zip_file:
+        # the archive is only closed once the member is closed too
+        return zip_file.open(member)
+
+
+class _GzipMember(gzip.GzipFile):
+    """Gzip file inside a zip archive, which closes the archive member along with it."""
+
+    def __init__(self, member_file):
+        super().__init__(fileobj=member_file, mode='rb')
+        self._member_file = member_file
+
+    def close(self):
+        try:
+            super().close()
+        finally:
+            self._member_file.close()
+
+
+def _get_members(zip_file):
+    return sorted(info.filename for info in zip_file.infolist() if not info.is_dir())
+
+
+def open_input(path, mode='r'):
+    """Open a raw file, decompressing it while it is read.
+
+    Args:
+        path (str):
+            Path to a plain file, a gzip file, a zip archive with a single file, or a
+            file inside a zip archive, which can be a gzip file too, see ``list_members``.
+        mode (str):
+            ``r`` to read text or ``rb`` to read bytes. Defaults to ``r``.
+
+    Returns:
+        file:
+            A file object that reads the decompressed contents.
+
+    Raises:
+        ValueError:
+            If the path is a zip archive that does not contain exactly one file.
+    """
+    if mode not in ('r', 'rb'):
+        raise ValueError('Unknown mode {}. Use r or rb'.format(mode))
+
+    archive, member = split_archive(path)
+    if member is None and path.lower().endswith(ZIP_EXTENSION):
+        with zipfile.ZipFile(path) as zip_file:
+            members = _get_members(zip_file)
+
+        if len(members) != 1:
+            raise ValueError('{} contains {} files. Use list_members to read them'.format(
+                path, len(members)))
+
+        member = members[0]
+
+    if member is not None:
+        binary_file = _open_member(archive, member)
+        if member.lower().endswith(GZIP_EXTENSION):
+            # list_members also returns the gzip files inside the archive
+            binary_file = _GzipMember(binary_file)
+    elif path.lower().endswith(GZIP_EXTENSION):
+        binary_file = gzip.open(path, 'rb')
+    else:
+        return open(path, mode)
+
+    if mode == 'rb':
+        return binary_file
+
+    return io.TextIOWrapper(binary_file)
+
+
+def strip_compression(path):
+    """Remove the gzip extension from a path, if it has one."""
+    if path.lower().endswith(GZIP_EXTENSION):
+        return path[:-len(GZIP_EXTENSION)]
+
+    return path
+
+
+def list_members(path, pattern='*'):
+    """List the files to read from a raw file path.
+
+    Args:
+        path (str):
+            Path to a raw file or a zip archive.
+        pattern (str):
+            Shell pattern, such as ``*.txt``, that the names of the files inside a zip
+            archive must match, with or without a gzip extension. Defaults to ``*``.
+
+    Returns:
+        list:
+            The paths of the matching files inside the archive, sorted by name, if the
+            path is a zip archive. Otherwise, the given path.
+    """
+    if not path.lower().endswith(ZIP_EXTENSION):
+        return [path]
+
+    with zipfile.ZipFile(path) as zip_file:
+        members = _get_members(zip_file)
+
+    return [
+        os.path.join(path, member) for member in members
+        if fnmatch.fnmatch(strip_compression(member.split('/')[-1]), pattern)
+    ]
+
+
+def find_inputs(directory, pattern):
+    """Find the raw files in a directory, including the compressed ones.
+
+    Args:
+        directory (str):
+            The directory to search.
+        pattern (str):
+            Shell pattern, such as ``*.txt``, of the names of the raw files.
+
+    Returns:
+        list:
+            Sorted paths of the files that match the pattern, the gzip files that match
+            it once decompressed, and the zip archives, which may contain matching
+            files, see ``list_members``.
+    """
+    patterns = (pattern, pattern + GZIP_EXTENSION, '*' + ZIP_EXTENSION)
+    paths = set()
+    for name in patterns:
+        paths.update(glob.glob(os.path.join(directory, name)))
+
+    return sorted(paths)
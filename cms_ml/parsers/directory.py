@@ -0,0 +1,186 @@
+# -*- coding: utf-8 -*-
+
+"""cms_ml.parsers.directory module.
+
+Parsing of every raw file of a directory into a single output.
+
+The files, including the gzip files and the files inside zip archives, are parsed with
+``cms_ml.parsers.parallel.parse_files`` and merged in batches. The output can be
+returned, written to a csv file or a Parquet dataset as each batch is parsed, or merged
+incrementally into a previous output, see ``cms_ml.ingestion``.
+"""
+
+import logging
+import os
+
+from cms_ml.ingestion import (
+    append_output, find_changed, get_manifest_path, load_manifest, merge_output, save_manifest,
+    update_manifest)
+from cms_ml.parsers.compression import find_inputs
+from cms_ml.parsers.parallel import ERRORS, iter_batches, parse_files, save_report
+from cms_ml.storage import check_output_format
+
+LOGGER = logging.getLogger(__name__)
+
+DEFAULT_FILENAME = 'parser_output'
+
+
+def _get_filters(start_time, end_time, signals, match):
+    filters = {'start_time': start_time, 'end_time': end_time, 'signals': signals}
+    filters = {name: value for name, value in filters.items() if value is not None}
+    if signals is not None:
+        filters['match'] = match
+
+    return filters
+
+
+def _get_output_file(out, out_filename, output_format, incremental):
+    if not os.path.isdir(out):
+        raise Exception('{} is not a valid existing path'.format(out))
+
+    output_file = os.path.join(out, out_filename)
+    if output_format == 'csv':
+        output_file = '.'.join([output_file, 'csv'])
+
+    if os.path.exists(output_file) and not incremental:
+        raise Exception('File with name {} already exists in given path'.format(
+            os.path.basename(output_file)))
+
+    return output_file
+
+
+def parse_directory(input_directory, parser, pattern, renamer=None, out=None,
+                    out_filename=None, incremental=False, start_time=None, end_time=None,
+                    signals=None, match='exact', n_jobs=None, ordered=True, timeout=None,
+                    errors='raise', batch_size=None, output_format='csv'):
+    """Parse the raw files of a directory.
+
+    Args:
+        input_directory (str):
+            Directory with the files to parse. The gzip files and the files inside zip
+            archives that match ``pattern`` are parsed as well.
+        parser (function):
+            Function that parses a file path into a ``pd.DataFrame``.
+        pattern (str):
+            Shell pattern, such as ``*.txt``, of the names of the files to parse.
+        renamer (dict, optional):
+            New names for the columns of the output, passed to the parser.
+            Default is None.
+        out (str, optional):
+            Output directory. Default is None.
+        out_filename (str, optional):
+            Name of the output, without extension. Defaults to ``parser_output``.
+        incremental (bool):
+            If ``True``, only parse the files that are new or have changed since the
+            previous run and merge their rows into the output, replacing the rows with
+            the same turbine, signal or sensor and timestamp. The parsed files are
+            recorded next to the output in a ``.manifest.json`` file. Requires ``out``.
+            Defaults to ``False``.
+        start_time (str, datetime, optional):
+            Passed to the parser to skip the data that starts before it.
+            Default is None.
+        end_time (str, datetime, optional):
+            Passed to the parser to skip the data that starts at it or after it.
+            Default is None.
+        signals (list, optional):
+            Passed to the parser to skip the data of the other signals.
+            Default is None.
+        match (str):
+            How ``signals`` are matched, ``exact`` or ``contains``. Passed to the
+            parser if ``signals`` is given. Defaults to ``exact``.
+        n_jobs (int, optional):
+            Number of processes used to parse the files, one file at a time. ``-1``
+            means using all the processors. If ``None`` or ``1``, run in the current
+            process. Default is None.
+        ordered (bool):
+            Whether to merge the files in the order of their names, or as soon as
+            each one is parsed, which keeps fewer parsed files waiting in memory.
+            Defaults to ``True``.
+        timeout (float, optional):
+            The files that take more than the given seconds to parse fail with a
+            ``cms_ml.parsers.parallel.FileTimeoutError``. Default is None.
+        errors (str):
+            What to do when a file cannot be parsed. ``raise`` raises the error and
+            ``skip`` leaves the file out and lists it, along with the error, in the
+            ``failed_files`` entry of the attrs of the output. If ``out`` is given,
+            the list is also stored next to the output in a ``.failed.json`` file.
+            Defaults to ``raise``.
+        batch_size (int, optional):
+            If given, the files are parsed in batches of this number of files, so only
+            one batch is kept in memory at a time. Without ``out``, an iterator over
+            the ``pd.DataFrame`` of each batch is returned, with the files of the batch
+            that failed in the ``failed_files`` entry of its attrs. Otherwise, each
+            batch is written to the output as soon as it is parsed, and a csv output is
+            written again if a batch brings new columns, see
+            ``cms_ml.ingestion.append_output``. Default is None.
+        output_format (str):
+            Format of the output, ``csv`` or ``parquet``. With ``parquet``, the output
+            is a dataset directory partitioned by turbine and month, see
+            ``cms_ml.storage.write_partitioned``. Defaults to ``csv``.
+
+    Returns:
+        pd.DataFrame, iterator or None:
+            The parsed data, an iterator over its batches if ``batch_size`` is given
+            without ``out``, or None if ``batch_size`` is given with ``out``.
+    """
+    if incremental and out is None:
+        raise Exception('An output directory is required to parse incrementally')
+
+    if errors not in ERRORS:
+        raise ValueError('Unknown errors value {}. Use one of {}'.format(errors, ERRORS))
+
+    check_output_format(output_format)
+    filters = _get_filters(start_time, end_time, signals, match)
+    if incremental and filters:
+        # the manifest would record the files as parsed even though part of their data was skipped
+        raise Exception('The data cannot be filtered while parsing incrementally')
+
+    if out is not None:
+        out_filename = out_filename or DEFAULT_FILENAME
+        output_file = _get_output_file(out, out_filename, output_format, incremental)
+
+    if not os.path.isdir(input_directory):
+        raise Exception('{} is not a valid existing path'.format(input_directory))
+
+    files = find_inputs(input_directory, pattern)
+    if incremental:
+        manifest_path = get_manifest_path(output_file)
+        manifest = load_manifest(manifest_path)
+        changed = find_changed(files, manifest, input_directory)
+        files = list(changed)
+
+    results = parse_files(files, parser, pattern, n_jobs=n_jobs, ordered=ordered,
+                          timeout=timeout, renamer=renamer, **filters)
+    batches = iter_batches(results, batch_size, errors)
+    if batch_size and out is None:
+        return (data for data, _, _ in batches)
+
+    # without a batch_size, all the files are merged into a single batch
+    failed = list()
+    for data, rows, batch_failed in batches:
+        failed.extend(batch_failed)
+        if incremental:
+            merged = merge_output(data, output_file, output_format)
+            if merged is not None:
+                data = merged
+
+            for path, path_rows in rows.items():
+                update_manifest(manifest, path, input_directory, changed[path], path_rows)
+
+            # the manifest is stored after every batch, so a new run resumes from the last one
+            save_manifest(manifest, manifest_path)
+
+        elif out is not None:
+            append_output(data, output_file, output_format)
+
+    if out is not None:
+        save_report(failed, os.path.join(out, '.'.join([out_filename, 'failed', 'json'])))
+        if output_format == 'csv' and not os.path.isfile(output_file):
+            # no rows were parsed, but the output is still created
+            data.to_csv(output_file, header=True, index=False)
+
+    if batch_size:
+        return None
+
+    data.attrs['failed_files'] = failed
+    return data
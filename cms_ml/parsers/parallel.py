@@ -0,0 +1,220 @@
+# -*- coding: utf-8 -*-
+
+"""cms_ml.parsers.parallel module.
+
+Parsing of many raw files at once, in a process pool.
+
+Each file is parsed on its own, so an error or a timeout only affects the file that
+caused it: ``parse_files`` yields the error along with the path of the file instead
+of raising it, and the caller decides whether to stop or to report the file and go on.
+"""
+
+import json
+import logging
+import os
+import signal
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from itertools import islice
+
+import pandas as pd
+
+from cms_ml.parsers.compression import list_members
+
+LOGGER = logging.getLogger(__name__)
+
+ERRORS = ('raise', 'skip')
+_TIMEOUT_INTERVAL = 1
+_PREFETCH = 2
+_deadline = {'active': False}
+
+
+class FileTimeoutError(TimeoutError):
+    """Raised when parsing a file takes longer than the timeout."""
+
+
+def _on_alarm(signum, frame):
+    if _deadline['active']:
+        raise FileTimeoutError()
+
+
+def _parse_members(path, pattern, parser, kwargs):
+    return [parser(member, **kwargs) for member in list_members(path, pattern)]
+
+
+def _parse_file(task):
+    """Parse a file, returning the error instead of raising it so it only affects the file."""
+    path, pattern, parser, kwargs, timeout = task
+    if timeout:
+        # the alarm is repeated in case the parser catches the first one
+        previous = signal.signal(signal.SIGALRM, _on_alarm)
+        _deadline['active'] = True
+        signal.setitimer(signal.ITIMER_REAL, timeout, _TIMEOUT_INTERVAL)
+
+    try:
+        return path, _parse_members(path, pattern, parser, kwargs), None
+    except FileTimeoutError:
+        _deadline['active'] = False
+        return path, None, FileTimeoutError(
+            'Parsing {} took more than {} seconds'.format(path, timeout))
+    except Exception as error:
+        _deadline['active'] = False
+        return path, None, error
+    finally:
+        if timeout:
+            _deadline['active'] = False
+            signal.setitimer(signal.ITIMER_REAL, 0)
+            signal.signal(signal.SIGALRM, previous)
+
+
+def parse_files(paths, parser, pattern='*', n_jobs=None, ordered=True, timeout=None,
+                **kwargs):
+    """Parse raw files, each one on its own, in a process pool.
+
+    Args:
+        paths (list):
+            Paths of the raw files. Zip archives are expanded into the files inside
+            them that match ``pattern``, see ``cms_ml.parsers.compression``.
+        parser (function):
+            Function that parses a file path into a ``pd.DataFrame``. It must be
+            importable from a module so it can be sent to the processes.
+        pattern (str):
+            Shell pattern that the files inside a zip archive must match.
+            Defaults to ``*``.
+        n_jobs (int, optional):
+            Number of processes used to parse the files. ``-1`` means using all the
+            processors. If ``None`` or ``1``, run in the current process. At most
+            twice as many files as processes are parsed ahead of the ones yielded.
+            Default is None.
+        ordered (bool):
+            Whether to yield the files in the order of ``paths``, or as soon as they
+            are parsed. Defaults to ``True``.
+        timeout (float, optional):
+            Maximum number of seconds to spend in a file. The files that take longer
+            fail with a ``FileTimeoutError``. Only supported where ``signal.SIGALRM``
+            is available. Default is None.
+        **kwargs:
+            Additional keyword arguments to pass to the parser.
+
+    Yields:
+        tuple:
+            The path of each file, the frames parsed from it, one per file inside it
+            if it is a zip archive, and None, or the path, None and the error raised
+            while parsing it.
+    """
+    if timeout and not hasattr(signal, 'setitimer'):
+        raise ValueError('A timeout is not supported on this platform')
+
+    tasks = [(path, pattern, parser, kwargs, timeout) for path in paths]
+    if n_jobs == -1:
+        n_jobs = os.cpu_count()
+
+    if not (n_jobs and n_jobs > 1 and len(tasks) > 1):
+        yield from map(_parse_file, tasks)
+        return
+
+    LOGGER.info('Parsing %s files with %s processes', len(tasks), n_jobs)
+    executor = ProcessPoolExecutor(max_workers=n_jobs)
+    tasks = iter(tasks)
+    # only a few files are parsed ahead of the caller, so the parsed files waiting to be
+    # consumed do not grow with the number of files
+    pending = [executor.submit(_parse_file, task) for task in islice(tasks, n_jobs * _PREFETCH)]
+    try:
+        while pending:
+            if ordered:
+                future = pending.pop(0)
+                future.result()
+            else:
+                finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+                future = next(item for item in pending if item in finished)
+                pending.remove(future)
+
+            pending.extend(executor.submit(_parse_file, task) for task in islice(tasks, 1))
+            yield future.result()
+
+    finally:
+        # the files that are still pending are not parsed if the caller stops early
+        for future in pending:
+            future.cancel()
+
+        executor.shutdown()
+
+
+def _merge_batch(frames, failed):
+    data = pd.concat(frames, ignore_index=True, sort=False) if frames else pd.DataFrame()
+    data.attrs['failed_files'] = failed
+    return data
+
+
+def iter_batches(results, batch_size=None, errors='raise'):
+    """Merge the frames parsed by ``parse_files`` into batches of files.
+
+    Args:
+        results (iterable):
+            The tuples yielded by ``parse_files``.
+        batch_size (int, optional):
+            Number of files in each batch, including the files that failed. If None,
+            all the files are merged into a single batch. Default is None.
+        errors (str):
+            What to do when a file could not be parsed. ``raise`` raises its error
+            and ``skip`` logs it and leaves the file out. Defaults to ``raise``.
+
+    Yields:
+        tuple:
+            A ``pd.DataFrame`` with the rows of the files of the batch, the number of
+            rows parsed from each of them, keyed by path, and the files of the batch
+            that failed, as dicts with their ``path`` and ``error``, which are also
+            stored in the ``failed_files`` entry of the attrs of the dataframe. At
+            least one batch is yielded, even if there are no files.
+    """
+    if errors not in ERRORS:
+        raise ValueError('Unknown errors value {}. Use one of {}'.format(errors, ERRORS))
+
+    frames = list()
+    rows = dict()
+    failed = list()
+    files = 0
+    yielded = False
+    for path, parsed, error in results:
+        files += 1
+        if error is None:
+            frames.extend(parsed)
+            rows[path] = sum(len(frame) for frame in parsed)
+        elif errors == 'raise':
+            raise error
+        else:
+            LOGGER.warning('Skipping file %s: %s', path, error)
+            failed.append({'path': path, 'error': repr(error)})
+
+        if batch_size and files == batch_size:
+            yield _merge_batch(frames, failed), rows, failed
+            frames = list()
+            rows = dict()
+            failed = list()
+            files = 0
+            yielded = True
+
+    if files or not yielded:
+        yield _merge_batch(frames, failed), rows, failed
+
+
+def save_report(failed, path):
+    """Store the files that could not be parsed, and why, in a JSON file.
+
+    If no file failed, any previous report in the path is removed instead.
+
+    Args:
+        failed (list):
+            Dicts with the ``path`` of each file that failed and its ``error``.
+        path (str):
+            Path to the report JSON file.
+    """
+    if not failed:
+        if os.path.isfile(path):
+            os.remove(path)
+
+        return
+
+    with open(path, 'w') as report_file:
+        json.dump(failed, report_file, indent=1)
+
+    LOGGER.warning('%s files could not be parsed. See %s', len(failed), path)
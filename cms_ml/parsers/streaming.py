@@ -0,0 +1,357 @@
+# -*- coding: utf-8 -*-
+
+"""cms_ml.parsers.streaming module.
+
+Incremental reading of the JSON files exported by the CMS.
+
+Each file holds a single JSON array of entries. Instead of decoding the whole array at
+once, ``iter_json_array`` reads the file in blocks and decodes one entry at a time, so
+only the entry being parsed and the current block are kept in memory. The parsed rows
+are accumulated column by column in a ``ColumnBuffer``, with the spectra stored in a
+single flat ``float64`` buffer, and converted into a ``pd.DataFrame`` once at the end.
+
+To parse the entries without their spectra, ``LazyReader`` replaces every array of a
+given key with its position in the file, so the floats are never decoded, and keeps
+the byte range of each array. ``load_spectra`` decodes the referenced spectra later on.
+"""
+
+import codecs
+import json
+import logging
+import re
+from array import array
+
+import numpy as np
+import pandas as pd
+
+from cms_ml.parsers.compression import open_input
+from cms_ml.spectra import SpectrumBatch
+
+LOGGER = logging.getLogger(__name__)
+
+BLOCK_SIZE = 1024 ** 2
+REFERENCE_COLUMNS = ('spectrum_file', 'spectrum_entry', 'spectrum_start', 'spectrum_end')
+_MAX_KEY_SIZE = 256
+_WHITESPACE = re.compile(r'\s*')
+_SEPARATOR = re.compile(r'\s*,?\s*')
+
+
+def iter_json_array(json_file, block_size=BLOCK_SIZE):
+    """Iterate over the entries of a JSON array without loading it whole.
+
+    The file is read in blocks of ``block_size`` characters. When an entry does not
+    fit in what has been read so far, the read size is doubled until it does, so
+    entries of any size are supported.
+
+    Args:
+        json_file (file):
+            Text file that contains a JSON array.
+        block_size (int):
+            Number of characters to read at a time. Defaults to 1MB.
+
+    Yields:
+        object:
+            The decoded entries of the array, in order.
+
+    Raises:
+        ValueError:
+            If the file does not contain a valid JSON array.
+    """
+    decoder = json.JSONDecoder()
+    buffer = ''
+    position = 0
+    started = False
+    eof = False
+    while True:
+        position = (_SEPARATOR if started else _WHITESPACE).match(buffer, position).end()
+        if position < len(buffer):
+            if not started:
+                if buffer[position] != '[':
+                    raise ValueError('Expected a JSON array')
+
+                started = True
+                position += 1
+                continue
+
+            if buffer[position] == ']':
+                return
+
+            try:
+                entry, end = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+            else:
+                # a value that reaches the end of the buffer may continue in the file
+                if end < len(buffer) or eof:
+                    yield entry
+                    position = end
+                    continue
+
+        elif eof:
+            raise ValueError('Unexpected end of JSON array')
+
+        block = json_file.read(max(block_size, len(buffer) - position))
+        eof = not block
+        buffer = buffer[position:] + block
+        position = 0
+
+
+class ColumnBuffer:
+    """Accumulate parsed rows column by column.
+
+    Columns that are missing in some rows are filled with ``NaN``. The spectra, if any,
+    are appended to a flat ``float64`` buffer instead of being kept as lists.
+
+    Args:
+        column (str):
+            Name of the column that contains the spectra. Defaults to ``values``.
+    """
+
+    def __init__(self, column='values'):
+        self.column = column
+        self.columns = dict()
+        self._values = array('d')
+        self._offsets = array('q', [0])
+        self._length = 0
+        self._has_spectra = False
+
+    def __len__(self):
+        return self._length
+
+    def append(self, row):
+        """Add a row, given as a dict of column values."""
+        for name, value in row.items():
+            if name == self.column:
+                self._values.extend(value)
+                self._has_spectra = True
+                continue
+
+            column = self.columns.get(name)
+            if column is None:
+                column = self.columns[name] = [np.nan] * self._length
+
+            column.append(value)
+
+        self._length += 1
+        self._offsets.append(len(self._values))
+        for column in self.columns.values():
+            if len(column) < self._length:
+                column.append(np.nan)
+
+    def extend(self, rows):
+        """Add several rows, given as a list of dicts, a ``pd.DataFrame`` or another buffer."""
+        if isinstance(rows, ColumnBuffer):
+            self._merge(rows)
+            return
+
+        if isinstance(rows, pd.DataFrame):
+            rows = rows.to_dict('records')
+
+        for row in rows:
+            self.append(row)
+
+    def _merge(self, other):
+        for name, values in other.columns.items():
+            column = self.columns.get(name)
+            if column is None:
+                column = self.columns[name] = [np.nan] * self._length
+
+            column.extend(values)
+
+        offsets = np.frombuffer(other._offsets, dtype=np.int64)[1:] + len(self._values)
+        self._offsets.frombytes(offsets.tobytes())
+        self._values.extend(other._values)
+        self._has_spectra = self._has_spectra or other._has_spectra
+
+        self._length += len(other)
+        for column in self.columns.values():
+            if len(column) < self._length:
+                column.extend([np.nan] * (self._length - len(column)))
+
+    @property
+    def has_spectra(self):
+        """bool: Whether any of the rows had spectra."""
+        return self._has_spectra
+
+    def to_batch(self):
+        """Get the rows as a ``SpectrumBatch``, without copying the spectra."""
+        metadata = pd.DataFrame(self.columns, index=pd.RangeIndex(self._length))
+        values = np.frombuffer(self._values, dtype=np.float64)
+        offsets = np.frombuffer(self._offsets, dtype=np.int64)
+        return SpectrumBatch(values, offsets, metadata)
+
+    def to_dataframe(self):
+        """Get the rows as a ``pd.DataFrame``, with the spectra as lists of floats."""
+        if self.has_spectra:
+            return self.to_batch().to_dataframe(self.column)
+
+        return pd.DataFrame(self.columns, index=pd.RangeIndex(self._length))
+
+
+class LazyReader:
+    """Text reader over a JSON file that skips the arrays of a key.
+
+    Every array found under ``key`` is replaced by its position in ``ranges``, which
+    holds the byte range of the array in the file, brackets included. The arrays must
+    only contain numbers. Use it as the input of ``iter_json_array``.
+
+    If ``keep``, the raw bytes of each array are also stored in ``arrays``, keyed by
+    position, so the arrays can be decoded later on without reading the file again.
+    Use ``release`` to drop them once they are not needed.
+
+    Args:
+        binary_file (file):
+            JSON file opened in binary mode.
+        key (str):
+            Key of the arrays to skip. Defaults to ``yValues``.
+        block_size (int):
+            Number of bytes to read at a time. Defaults to 1MB.
+        keep (bool):
+            Whether to keep the raw bytes of the arrays. Defaults to ``False``.
+    """
+
+    def __init__(self, binary_file, key='yValues', block_size=BLOCK_SIZE, keep=False):
+        self.ranges = list()
+        self.arrays = dict() if keep else None
+        self._chunks = list()
+        self._file = binary_file
+        self._pattern = re.compile(rb'"' + re.escape(key.encode()) + rb'"\s*:\s*\[')
+        self._decoder = codecs.getincrementaldecoder('utf-8')()
+        self._block_size = block_size
+        self._pending = b''
+        self._offset = 0
+        self._array_start = None
+        self._eof = False
+
+    def _scan(self):
+        block = self._file.read(self._block_size)
+        self._eof = not block
+        data = self._pending + block
+        output = list()
+        position = 0
+        while position < len(data):
+            if self._array_start is not None:
+                end = data.find(b']', position)
+                if end < 0:
+                    if self.arrays is not None:
+                        self._chunks.append(data[position:])
+
+                    position = len(data)
+                    break
+
+                self.ranges.append((self._array_start, self._offset + end + 1))
+                if self.arrays is not None:
+                    self._chunks.append(data[position:end + 1])
+                    self.arrays[len(self.ranges) - 1] = b''.join(self._chunks)
+
+                output.append(str(len(self.ranges) - 1).encode())
+                self._array_start = None
+                position = end + 1
+                continue
+
+            match = self._pattern.search(data, position)
+            if match is None:
+                # the end of the block may hold the beginning of the next key
+                cut = len(data) if self._eof else max(position, len(data) - _MAX_KEY_SIZE)
+                output.append(data[position:cut])
+                position = cut
+                break
+
+            output.append(data[position:match.end() - 1])
+            self._array_start = self._offset + match.end() - 1
+            self._chunks = [b'[']
+            position = match.end()
+
+        self._pending = data[position:]
+        self._offset += position
+        return b''.join(output)
+
+    def read(self, size=-1):
+        """Read the next block of the file, with the arrays replaced."""
+        text = ''
+        while not text and not self._eof:
+            text = self._decoder.decode(self._scan(), final=self._eof)
+
+        return text
+
+    def release(self, position):
+        """Drop the kept bytes of the arrays up to the given position, included."""
+        for key in list(self.arrays):
+            if key > position:
+                break
+
+            del self.arrays[key]
+
+
+def get_reference(row, path, entry, ranges, column='values'):
+    """Replace the spectrum of a row parsed with a ``LazyReader`` by a reference to it.
+
+    Args:
+        row (dict):
+            A parsed row, with the position of the spectrum in ``ranges`` in ``column``.
+            Updated in place.
+        path (str):
+            Path of the JSON file.
+        entry (int):
+            Position of the entry in the JSON file.
+        ranges (list):
+            The ``ranges`` of the ``LazyReader``.
+        column (str):
+            Name of the column that contains the spectra. Defaults to ``values``.
+
+    Returns:
+        dict:
+            The row, with the ``spectrum_file``, ``spectrum_entry``, ``spectrum_start``
+            and ``spectrum_end`` of the spectrum instead of ``column``. Spectra that
+            were not an array get a range of ``-1``.
+    """
+    position = row.pop(column)
+    start, end = ranges[position] if isinstance(position, int) else (-1, -1)
+    row.update(zip(REFERENCE_COLUMNS, (path, entry, start, end)))
+    return row
+
+
+def load_spectra(data):
+    """Decode the spectra referenced by the rows of a lazily parsed frame.
+
+    The spectra of each file are read in the order they are stored, so compressed files
+    are decompressed only once.
+
+    Args:
+        data (pd.DataFrame):
+            Rows with the ``spectrum_file``, ``spectrum_entry``, ``spectrum_start`` and
+            ``spectrum_end`` columns added by ``get_reference``.
+
+    Returns:
+        SpectrumBatch:
+            The spectra, with the rest of the columns as metadata.
+    """
+    paths = data[REFERENCE_COLUMNS[0]].astype(str).to_numpy()
+    starts = data[REFERENCE_COLUMNS[2]].to_numpy(np.int64)
+    ends = data[REFERENCE_COLUMNS[3]].to_numpy(np.int64)
+
+    spectra = [np.empty(0)] * len(data)
+    json_file = None
+    path = None
+    try:
+        for position in np.lexsort((starts, paths)):
+            if path != paths[position]:
+                if json_file is not None:
+                    json_file.close()
+
+                path = paths[position]
+                json_file = open_input(path, 'rb')
+
+            if starts[position] >= 0:
+                json_file.seek(starts[position])
+                raw = json_file.read(ends[position] - starts[position])
+                spectra[position] = np.array(json.loads(raw), dtype=float)
+
+    finally:
+        if json_file is not None:
+            json_file.close()
+
+    LOGGER.info('Loaded %s spectra', len(data))
+    metadata = data.drop(columns=list(REFERENCE_COLUMNS))
+    return SpectrumBatch.from_values(spectra, metadata)
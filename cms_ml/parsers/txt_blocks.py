@@ -0,0 +1,184 @@
+# -*- coding: utf-8 -*-
+
+"""cms_ml.parsers.txt_blocks module.
+
+Block reading of the TXT files exported by the CMS.
+
+A TXT file is an INI file whose ``[...specdata...]`` sections hold one number per
+line instead of ``key=value`` pairs, and end with a ``#--finish--`` line. Almost all
+the lines of a file are data lines, so instead of checking every line, only the section
+headers are searched, with compiled patterns over the whole text, and each data block
+is decoded with ``decode_values``. ``iter_spec_channels`` skips the channels left out by
+a ``cms_ml.index.RowFilter`` before their data is decoded.
+"""
+
+import logging
+import re
+from configparser import RawConfigParser
+from datetime import datetime
+
+import numpy as np
+
+LOGGER = logging.getLogger(__name__)
+
+END_TOKEN = '#--finish--'
+_SECTION = re.compile(r'^\[(.*)\]$', re.MULTILINE)
+_END = re.compile(r'^[ \t]*' + re.escape(END_TOKEN) + r'[ \t]*$', re.MULTILINE)
+
+
+def _to_float(strings):
+    """Convert strings to a ``float64`` array, telling which line could not be converted."""
+    try:
+        return np.array(strings, dtype=np.float64)
+    except ValueError:
+        for number, string in enumerate(strings, 1):
+            try:
+                float(string)
+            except ValueError:
+                raise ValueError('Could not convert line {} of the data block to float'.format(
+                    number)) from None
+
+        raise
+
+
+def decode_values(block):
+    """Decode a block of numbers, one per line, into a ``float64`` array.
+
+    Args:
+        block (str):
+            Lines with a single number each.
+
+    Returns:
+        np.ndarray
+
+    Raises:
+        ValueError:
+            If any of the lines is not a single number.
+    """
+    return _to_float(block.splitlines())
+
+
+def decode_column(lines, column=1):
+    """Decode a column of lines with whitespace separated numbers into a ``float64`` array.
+
+    Args:
+        lines (list):
+            Lines with the same number of columns each.
+        column (int):
+            Position of the column to decode. Defaults to ``1``.
+
+    Returns:
+        np.ndarray
+
+    Raises:
+        ValueError:
+            If any of the lines has too few columns or the column is not a number.
+    """
+    strings = list()
+    for number, line in enumerate(lines, 1):
+        fields = line.split()
+        if len(fields) <= column:
+            raise ValueError('Line {} of the data block has no column {}'.format(number, column))
+
+        strings.append(fields[column])
+
+    return _to_float(strings)
+
+
+def read_spec_blocks(text, data_section='specdata', channel_section='specchannel'):
+    """Split the text of a TXT file into its INI sections and its data blocks.
+
+    Each data block belongs to the last ``channel_section`` header found before it.
+
+    Args:
+        text (str):
+            Contents of the TXT file.
+        data_section (str):
+            Text contained in the headers of the data sections. Defaults to ``specdata``.
+        channel_section (str):
+            Text contained in the headers of the channel sections. Defaults to
+            ``specchannel``.
+
+    Returns:
+        tuple:
+            A ``RawConfigParser`` with every section that is not a data section, and a
+            dict with the text of the data block of each channel, in order.
+    """
+    ini_parts = list()
+    blocks = dict()
+    channel = ''
+    ini_start = 0
+    position = 0
+    while True:
+        match = _SECTION.search(text, position)
+        if match is None:
+            break
+
+        name = match.group(1)
+        if channel_section in name:
+            channel = name.split(']')[0]
+
+        position = match.end()
+        if data_section in name:
+            ini_parts.append(text[ini_start:match.start()])
+            end = _END.search(text, position)
+            data_end = end.start() if end else len(text)
+            blocks[channel] = text[position + 1:data_end]
+
+            # the end line is kept in the INI text, where it is a comment
+            ini_start = position = data_end
+
+    ini_parts.append(text[ini_start:])
+    config_parser = RawConfigParser()
+    config_parser.read_string(''.join(ini_parts))
+    return config_parser, blocks
+
+
+def keep_channel(header, channel, row_filter=None):
+    """Check the signal and start time in the header of a channel against a ``RowFilter``.
+
+    Args:
+        header (mapping):
+            Fields of the channel.
+        channel (str):
+            Name of the channel section.
+        row_filter (RowFilter, optional):
+            Predicates to check. If None, every channel is kept. Default is None.
+
+    Returns:
+        bool:
+            Whether the channel has to be parsed. Channels with missing header fields
+            are kept.
+    """
+    if not row_filter:
+        return True
+
+    try:
+        signal_id = '_'.join([header['szlabel'], header['ianalysisid'], channel])
+        timestamp = datetime.fromtimestamp(int(header['starttime']))
+    except (KeyError, ValueError):
+        return True
+
+    return row_filter(signal_id, timestamp)
+
+
+def iter_spec_channels(text, row_filter=None):
+    """Decode the data blocks of the channels of a TXT file that pass a ``RowFilter``.
+
+    Args:
+        text (str):
+            Contents of the TXT file.
+        row_filter (RowFilter, optional):
+            Predicates that the signal and start time of a channel must pass. The
+            data of the channels left out is not decoded. Default is None.
+
+    Yields:
+        tuple:
+            The name of each channel, the section with its header fields and its
+            values as a ``float64`` array.
+    """
+    config_parser, blocks = read_spec_blocks(text)
+    for channel, block in blocks.items():
+        header = config_parser[channel]
+        if keep_channel(header, channel, row_filter):
+            yield channel, header, decode_values(block)
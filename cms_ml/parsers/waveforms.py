@@ -0,0 +1,169 @@
+# -*- coding: utf-8 -*-
+
+"""cms_ml.parsers.waveforms module.
+
+Handling of the raw time waveforms of the ADU TXT files.
+
+The waveforms are decoded in chunks of lines, so neither their text nor a ``float64``
+copy of them is ever held in memory at once. Each chunk is either kept in memory in the
+requested dtype or spilled to a raw binary file, named after the dtype, ``.f32`` or
+``.f64``, that ``load_waveform`` memory-maps. The statistics of the prescan blocks are
+also updated chunk by chunk with ``RunningStats``.
+"""
+
+import logging
+import os
+
+import numpy as np
+
+from cms_ml.parsers.txt_blocks import decode_column, decode_values
+
+LOGGER = logging.getLogger(__name__)
+
+DTYPES = {'float32': 'f32', 'float64': 'f64'}
+CHUNK_LINES = 65536
+
+
+def _check_dtype(dtype):
+    dtype = np.dtype(dtype)
+    if dtype.name not in DTYPES:
+        raise ValueError('Unknown waveform dtype {}. Use one of {}'.format(
+            dtype.name, tuple(DTYPES)))
+
+    return dtype
+
+
+class RunningStats:
+    """Mean, minimum, maximum and standard deviation of values given in chunks.
+
+    The chunks are merged with the parallel variance algorithm of Chan et al., so every
+    value is only visited once and the result matches ``np.std`` with ``ddof=0``.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.mean = np.nan
+        self.min = np.nan
+        self.max = np.nan
+        self._m2 = 0.0
+
+    def update(self, values):
+        """Add a chunk of values to the statistics."""
+        values = np.asarray(values, dtype=np.float64)
+        if not len(values):
+            return
+
+        count = len(values)
+        mean = values.mean()
+        m2 = np.square(values - mean).sum()
+        if not self.count:
+            self.mean, self._m2 = mean, m2
+            self.min, self.max = values.min(), values.max()
+        else:
+            total = self.count + count
+            delta = mean - self.mean
+            self.mean += delta * count / total
+            self._m2 += m2 + delta ** 2 * self.count * count / total
+            self.min = min(self.min, values.min())
+            self.max = max(self.max, values.max())
+
+        self.count += count
+
+    @property
+    def std(self):
+        """Population standard deviation of the values."""
+        if not self.count:
+            return np.nan
+
+        return np.sqrt(self._m2 / self.count)
+
+
+class WaveformWriter:
+    """Collect the values of a waveform, decoded in chunks, in memory or in a file.
+
+    Args:
+        dtype (str):
+            Dtype of the stored values, ``float32`` or ``float64``. Defaults to
+            ``float64``.
+        path (str, optional):
+            Path without extension of the file where the values are spilled. The
+            extension of the dtype is added to it. If None, the values are kept in
+            memory. Default is None.
+    """
+
+    def __init__(self, dtype='float64', path=None):
+        self.dtype = _check_dtype(dtype).newbyteorder('<')
+        self.length = 0
+        self.path = None
+        self._chunks = list()
+        self._file = None
+        if path is not None:
+            self.path = '.'.join([path, DTYPES[self.dtype.name]])
+            self._file = open(self.path, 'wb')
+
+    def write(self, values):
+        """Add a chunk of values to the waveform."""
+        values = np.asarray(values).astype(self.dtype, copy=False)
+        if self._file is not None:
+            self._file.write(values.tobytes())
+        else:
+            self._chunks.append(values)
+
+        self.length += len(values)
+
+    def close(self):
+        """Finish the waveform.
+
+        Returns:
+            np.ndarray or str:
+                The values, if they are kept in memory, or the path of the file
+                where they were spilled.
+        """
+        if self._file is None:
+            values = np.concatenate(self._chunks) if self._chunks else np.empty(0, self.dtype)
+            self._chunks = list()
+            return values
+
+        self._file.close()
+        LOGGER.debug('Spilled %s waveform values to %s', self.length, self.path)
+        return self.path
+
+
+def decode_chunk(target, chunk):
+    """Decode a chunk of data lines of an ADU TXT file.
+
+    Args:
+        target (RunningStats or WaveformWriter):
+            Statistics of a prescan block, which get the second column of the lines, or
+            writer of a raw waveform, which gets their single number.
+        chunk (list):
+            Lines to decode.
+    """
+    if isinstance(target, RunningStats):
+        target.update(decode_column(chunk, 1))
+    else:
+        target.write(decode_values(''.join(chunk)))
+
+
+def load_waveform(path):
+    """Memory-map a waveform spilled by ``WaveformWriter``.
+
+    Args:
+        path (str):
+            Path to the waveform file. Its extension tells the dtype of the values.
+
+    Returns:
+        np.ndarray:
+            Read-only ``np.memmap`` with the values of the waveform.
+    """
+    extension = os.path.splitext(path)[1][1:]
+    dtypes = {value: key for key, value in DTYPES.items()}
+    if extension not in dtypes:
+        raise ValueError('Unknown waveform file extension {}'.format(extension))
+
+    dtype = np.dtype(dtypes[extension]).newbyteorder('<')
+    if not os.path.getsize(path):
+        # empty files cannot be memory-mapped
+        return np.empty(0, dtype)
+
+    return np.memmap(path, dtype=dtype, mode='r')
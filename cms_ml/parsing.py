@@ -1,9 +1,11 @@
-import json
 import logging
 import os
 
 import pandas as pd
 
+from cms_ml.parsers.compression import list_members, open_input
+from cms_ml.parsers.streaming import ColumnBuffer, iter_json_array
+
 LOGGER = logging.getLogger(__name__)
 
 
@@ -101,7 +103,7 @@ def parse_cms_jsons(jsons_path, parser, *args, **kwargs):
         jsons_path (str):
             The file path to a folder containing the jsons for one turbine.
         parser (function):
-            Function used to parse a JSON entry into a pandas Series.
+            Function used to parse a JSON entry into a pandas DataFrame.
             An example is get_cms_context.
         *args, **kwargs:
             Additional args and kwargs to pass to the parser function.
@@ -110,19 +112,17 @@ def parse_cms_jsons(jsons_path, parser, *args, **kwargs):
         pd.DataFrame:
             Contains the data parsed from the JSON file(s).
     """
-    parsed = pd.DataFrame()
+    parsed = ColumnBuffer()
     LOGGER.info('Parsing JSON files from folder %s', jsons_path)
     for filename in os.listdir(jsons_path):
-        json_file = os.path.join(jsons_path, filename)
-
-        LOGGER.debug('Parsing JSON file %s', json_file)
-        with open(json_file) as f:
-            for entry in json.load(f):
-                parsed_entry = parser(entry, *args, **kwargs)
-                parsed = parsed.append(parsed_entry, ignore_index=True, sort=False)
+        for json_file in list_members(os.path.join(jsons_path, filename)):
+            LOGGER.debug('Parsing JSON file %s', json_file)
+            with open_input(json_file) as f:
+                for entry in iter_json_array(f):
+                    parsed.extend(parser(entry, *args, **kwargs))
 
     LOGGER.info('%s entries loaded', len(parsed))
-    return parsed
+    return parsed.to_dataframe()
 
 
 def filter_values(raw_df, start_time=None, end_time=None, signals=None, turbines=None):
@@ -0,0 +1,206 @@
+# -*- coding: utf-8 -*-
+
+"""cms_ml.schema module.
+
+Compact dtypes for the context columns of the parsed CMS data.
+
+The context fields of the raw CMS data are parsed as Python objects, so numbers are
+often kept as strings such as ``"1145.5"`` and repeated names are stored once per row.
+The functions in this module infer a dtype for every context column across all the
+entries, storing numeric fields as ``float32`` or integers and repeated strings as
+categoricals, and enforce it, so the context of the parsed data takes a fraction of
+the memory.
+"""
+
+import logging
+
+import numpy as np
+import pandas as pd
+from pandas.api.types import union_categoricals
+
+LOGGER = logging.getLogger(__name__)
+
+IDENTIFIERS = ('turbine_id', 'signal_id', 'timestamp', 'values')
+FLOAT_DTYPE = 'float32'
+MAX_CATEGORIES_RATIO = 0.5
+_INT32 = np.iinfo(np.int32)
+_FLOAT32 = np.finfo(np.float32)
+
+
+def _infer_numeric(numbers, has_missing):
+    if not has_missing and (numbers % 1 == 0).all():
+        if numbers.between(_INT32.min, _INT32.max).all():
+            return 'int32'
+
+        return 'int64'
+
+    if numbers.abs().max() <= _FLOAT32.max:
+        return FLOAT_DTYPE
+
+    return 'float64'
+
+
+def _round_trips(values, numbers):
+    """Whether the strings among the values are written the way their numbers are."""
+    is_string = values.map(type).eq(str)
+    strings = values[is_string]
+    numbers = numbers[is_string].astype(float)
+    written = numbers.astype(str)
+    integral = numbers % 1 == 0
+    written[integral] = numbers[integral].astype('int64').astype(str)
+    return (strings.eq(written) | strings.eq(numbers.astype(str))).all()
+
+
+def _infer_dtype(series):
+    if series.dtype.kind == 'b' or pd.api.types.is_categorical_dtype(series):
+        return series.dtype.name
+
+    values = series.dropna()
+    if not len(values):
+        return None
+
+    if series.dtype.kind in 'iuf':
+        return _infer_numeric(values, len(values) < len(series))
+
+    if values.map(type).isin([bool, np.bool_]).any():
+        return None
+
+    numbers = pd.to_numeric(values, errors='coerce')
+    # ids such as ``007`` are kept as strings, as converting them would drop the zeros
+    if numbers.notnull().all() and _round_trips(values, numbers):
+        return _infer_numeric(numbers, len(values) < len(series))
+
+    if not values.map(type).eq(str).all():
+        return None
+
+    if values.nunique() <= MAX_CATEGORIES_RATIO * len(series):
+        return 'category'
+
+    return None
+
+
+def infer_schema(data, exclude=IDENTIFIERS):
+    """Infer a compact dtype for each context column.
+
+    Columns whose values are all numbers, or strings that represent numbers, get an
+    integer dtype if they are all integral and there are no missing values, and
+    ``float32`` otherwise. Strings that would not be written back the same, such as
+    the zero padded ids ``007`` or ``0012``, are not considered numbers. Columns of strings with few distinct values become
+    categoricals. The rest of the columns are left out of the schema.
+
+    Args:
+        data (pd.DataFrame):
+            The parsed CMS data.
+        exclude (tuple):
+            Columns to leave out of the schema. Defaults to ``turbine_id``,
+            ``signal_id``, ``timestamp`` and ``values``.
+
+    Returns:
+        dict:
+            Name of the dtype of each context column, keyed by column name.
+    """
+    schema = dict()
+    for column in data.columns:
+        if column not in exclude:
+            dtype = _infer_dtype(data[column])
+            if dtype is not None:
+                schema[column] = dtype
+
+    return schema
+
+
+def _cast(series, dtype):
+    if dtype == 'category':
+        return series.astype('category')
+
+    if np.dtype(dtype).kind in 'iuf':
+        numbers = pd.to_numeric(series, errors='coerce')
+        invalid = numbers.isnull() & series.notnull()
+        if invalid.any():
+            LOGGER.warning('%s values of %s are not numeric', invalid.sum(), series.name)
+
+        if np.dtype(dtype).kind in 'iu' and numbers.isnull().any():
+            dtype = FLOAT_DTYPE   # integers cannot hold missing values
+
+        return numbers.astype(dtype)
+
+    return series.astype(dtype)
+
+
+def apply_schema(data, schema):
+    """Cast the context columns to the dtypes of a schema.
+
+    Values that cannot be converted to the dtype of a numeric column are replaced
+    with ``NaN``, and integer columns with missing values are stored as ``float32``.
+
+    Args:
+        data (pd.DataFrame):
+            The parsed CMS data.
+        schema (dict):
+            Name of the dtype of each column, keyed by column name. Columns that
+            are not in ``data`` are ignored.
+
+    Returns:
+        pd.DataFrame:
+            A copy of the data with the columns cast.
+    """
+    data = data.copy()
+    for column, dtype in schema.items():
+        # numpy cannot compare its dtypes with the name of the pandas ``category`` dtype
+        if column in data and not pd.api.types.is_dtype_equal(data[column].dtype, dtype):
+            data[column] = _cast(data[column], dtype)
+
+    return data
+
+
+def compact_context(data, schema=None, exclude=IDENTIFIERS):
+    """Store the context columns of the parsed CMS data with compact dtypes.
+
+    Args:
+        data (pd.DataFrame):
+            The parsed CMS data.
+        schema (dict, optional):
+            Dtypes to enforce, keyed by column name. The dtypes of the context
+            columns that are not in the schema are inferred with ``infer_schema``.
+            Default is None.
+        exclude (tuple):
+            Columns to leave as they are. Defaults to ``turbine_id``, ``signal_id``,
+            ``timestamp`` and ``values``.
+
+    Returns:
+        pd.DataFrame:
+            A copy of the data with the context columns cast.
+    """
+    inferred = infer_schema(data, exclude)
+    inferred.update(schema or dict())
+    return apply_schema(data, inferred)
+
+
+def concat_compact(frames):
+    """Concatenate frames, keeping the categorical columns categorical.
+
+    The categories of every categorical column are the union of the categories
+    it has in each frame.
+
+    Args:
+        frames (list):
+            The ``pd.DataFrame`` objects to concatenate.
+
+    Returns:
+        pd.DataFrame
+    """
+    frames = list(frames)
+    columns = {
+        column for frame in frames for column in frame.columns
+        if pd.api.types.is_categorical_dtype(frame[column])
+    }
+    for column in columns:
+        series = [frame[column] for frame in frames if column in frame]
+        if all(pd.api.types.is_categorical_dtype(values) for values in series):
+            dtype = pd.CategoricalDtype(union_categoricals(series).categories)
+            frames = [
+                frame.astype({column: dtype}) if column in frame else frame
+                for frame in frames
+            ]
+
+    return pd.concat(frames, ignore_index=True, sort=False)
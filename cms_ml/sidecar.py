@@ -0,0 +1,246 @@
+# -*- coding: utf-8 -*-
+
+"""cms_ml.sidecar module.
+
+Binary cache of the spectra parsed from an FFT csv file.
+
+The sidecar is a single file stored next to the csv file. It starts with a JSON header
+that describes the source file and the position of every array, followed by the
+spectra values, their offsets and the metadata columns, each one aligned so it can be
+memory-mapped without reading the file. Text columns are stored as integer codes with
+their distinct values in the header.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import struct
+
+import numpy as np
+import pandas as pd
+import pytz
+
+from cms_ml.spectra import SpectrumBatch
+
+LOGGER = logging.getLogger(__name__)
+
+MAGIC = b'CMSFFT01'
+ALIGNMENT = 64
+HASH_BLOCK_SIZE = 1024 ** 2
+
+
+def get_sidecar_path(path):
+    """Get the path of the sidecar file of a csv file."""
+    return path + '.cache'
+
+
+def get_signature(path, with_hash=True):
+    """Get the size, modification time and, optionally, the hash of a file.
+
+    Args:
+        path (str):
+            Path to the file.
+        with_hash (bool):
+            Whether to compute the ``blake2b`` hash of the file contents.
+            Defaults to ``True``.
+
+    Returns:
+        dict:
+            The ``size``, ``mtime_ns`` and ``hash`` of the file.
+    """
+    stat = os.stat(path)
+    signature = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'hash': None}
+    if with_hash:
+        digest = hashlib.blake2b()
+        with open(path, 'rb') as source_file:
+            for block in iter(lambda: source_file.read(HASH_BLOCK_SIZE), b''):
+                digest.update(block)
+
+        signature['hash'] = digest.hexdigest()
+
+    return signature
+
+
+def _encode_tz(tz):
+    if tz is None:
+        return None
+
+    zone = getattr(tz, 'zone', None)
+    if zone:
+        return zone
+
+    return int(tz.utcoffset(None).total_seconds() // 60)   # fixed offset in minutes
+
+
+def _decode_tz(tz):
+    return pytz.FixedOffset(tz) if isinstance(tz, int) else tz
+
+
+def _encode_column(series):
+    if series.dtype.kind == 'M':
+        column = {'kind': 'datetime', 'tz': _encode_tz(series.dt.tz)}
+        return column, series.to_numpy('i8')
+
+    if series.dtype.kind in 'biuf':
+        return {'kind': 'array'}, series.to_numpy()
+
+    codes, uniques = pd.factorize(series)
+    return {'kind': 'codes', 'uniques': uniques.tolist()}, codes.astype(np.int32)
+
+
+def _decode_column(column, array):
+    if column['kind'] == 'datetime':
+        values = pd.to_datetime(np.asarray(array).view('datetime64[ns]'))
+        if column['tz'] is None:
+            return values
+
+        return values.tz_localize('UTC').tz_convert(_decode_tz(column['tz']))
+
+    if column['kind'] == 'codes':
+        uniques = np.empty(len(column['uniques']) + 1, dtype=object)
+        uniques[:-1] = column['uniques']
+        uniques[-1] = np.nan
+        return uniques[array]   # code -1 points to the missing value at the end
+
+    return array
+
+
+def _pad(position):
+    return -position % ALIGNMENT
+
+
+def write_sidecar(batch, path, source_path):
+    """Store a batch of spectra in a sidecar file.
+
+    The file is written next to its final location and then moved, so readers never
+    find a half written sidecar.
+
+    Args:
+        batch (SpectrumBatch):
+            The spectra loaded from ``source_path``.
+        path (str):
+            Path to the sidecar file.
+        source_path (str):
+            Path to the csv file the spectra were loaded from.
+    """
+    arrays = [('values', batch.values), ('offsets', batch.offsets)]
+    columns = list()
+    for name in batch.metadata.columns:
+        column, array = _encode_column(batch.metadata[name])
+        column['name'] = name
+        columns.append(column)
+        arrays.append((name, array))
+
+    position = 0
+    layout = list()
+    for _, array in arrays:
+        array = np.ascontiguousarray(array)
+        layout.append({
+            'dtype': array.dtype.str,
+            'shape': len(array),
+            'offset': position,
+        })
+        position += array.nbytes + _pad(array.nbytes)
+
+    header = json.dumps({
+        'source': get_signature(source_path),
+        'arrays': layout,
+        'columns': columns,
+    }).encode()
+    start = len(MAGIC) + 8 + len(header)
+    start += _pad(start)
+
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as sidecar_file:
+        sidecar_file.write(MAGIC + struct.pack('<Q', len(header)) + header)
+        sidecar_file.write(b'\0' * (start - sidecar_file.tell()))
+        for _, array in arrays:
+            sidecar_file.write(np.ascontiguousarray(array).tobytes())
+            sidecar_file.write(b'\0' * _pad(sidecar_file.tell() - start))
+
+    os.replace(tmp_path, path)
+    LOGGER.info('Stored %s spectra in %s', len(batch), path)
+
+
+def _read_header(path):
+    with open(path, 'rb') as sidecar_file:
+        if sidecar_file.read(len(MAGIC)) != MAGIC:
+            raise ValueError('{} is not a sidecar file'.format(path))
+
+        length, = struct.unpack('<Q', sidecar_file.read(8))
+        header = json.loads(sidecar_file.read(length).decode())
+
+    start = len(MAGIC) + 8 + length
+    return header, start + _pad(start)
+
+
+def _get_status(header, source_path):
+    expected = header['source']
+    signature = get_signature(source_path, with_hash=False)
+    if signature['size'] != expected['size']:
+        return 'outdated'
+
+    if signature['mtime_ns'] == expected['mtime_ns']:
+        return 'valid'
+
+    # The file was touched or copied: it is still valid if the contents are the same.
+    if get_signature(source_path)['hash'] == expected['hash']:
+        return 'touched'
+
+    return 'outdated'
+
+
+def read_sidecar(path, source_path):
+    """Load the spectra stored in a sidecar file, if it is up to date.
+
+    The sidecar is valid if the csv file has the same size and modification time it
+    had when the sidecar was written. If only the modification time differs, the hash
+    of the csv file contents is compared instead, and the sidecar is written again with
+    the new modification time if they match. The spectra values are memory-mapped, so
+    they are only read from disk when they are used.
+
+    Args:
+        path (str):
+            Path to the sidecar file.
+        source_path (str):
+            Path to the csv file the spectra were loaded from.
+
+    Returns:
+        SpectrumBatch or None:
+            The cached spectra, or ``None`` if there is no sidecar or it is outdated.
+    """
+    if not os.path.isfile(path):
+        return None
+
+    try:
+        header, start = _read_header(path)
+        status = _get_status(header, source_path)
+        if status == 'outdated':
+            LOGGER.info('Sidecar %s is outdated', path)
+            return None
+
+        arrays = [
+            np.memmap(path, dtype=item['dtype'], mode='c', offset=start + item['offset'],
+                      shape=(item['shape'], )) if item['shape'] else
+            np.empty(0, dtype=item['dtype'])
+            for item in header['arrays']
+        ]
+    except (OSError, ValueError, KeyError) as error:
+        LOGGER.warning('Could not read sidecar %s: %s', path, error)
+        return None
+
+    metadata = pd.DataFrame({
+        column['name']: _decode_column(column, array)
+        for column, array in zip(header['columns'], arrays[2:])
+    }, index=pd.RangeIndex(len(arrays[1]) - 1))
+
+    LOGGER.info('Loaded %s spectra from %s', len(metadata), path)
+    batch = SpectrumBatch(arrays[0], arrays[1], metadata)
+    if status == 'touched':
+        try:
+            write_sidecar(batch, path, source_path)
+        except OSError as error:
+            LOGGER.warning('Could not update sidecar %s: %s', path, error)
+
+    return batch
@@ -0,0 +1,351 @@
+# -*- coding: utf-8 -*-
+
+"""cms_ml.spectra module."""
+
+import logging
+
+import numpy as np
+import pandas as pd
+
+from cms_ml.index import MetadataIndex
+
+LOGGER = logging.getLogger(__name__)
+
+
+def _rms(matrix):
+    return np.sqrt(np.mean(np.square(matrix), axis=1))
+
+
+VECTORIZED_AGGREGATIONS = {
+    'mean': lambda matrix: np.mean(matrix, axis=1),
+    'std': lambda matrix: np.std(matrix, axis=1),
+    'sum': lambda matrix: np.sum(matrix, axis=1),
+    'max': lambda matrix: np.max(matrix, axis=1),
+    'min': lambda matrix: np.min(matrix, axis=1),
+    'median': lambda matrix: np.median(matrix, axis=1),
+    'rms': _rms,
+}
+
+_NUMPY_AGGREGATIONS = {
+    np.mean: 'mean',
+    np.std: 'std',
+    np.sum: 'sum',
+    np.max: 'max',
+    np.amax: 'max',
+    np.min: 'min',
+    np.amin: 'min',
+    np.median: 'median',
+}
+
+
+def get_vectorized(aggregation):
+    """Get the vectorized version of an aggregation, if there is one.
+
+    Aggregations can be given either by name (``mean``, ``std``, ``sum``, ``max``,
+    ``min``, ``median`` or ``rms``) or as the equivalent ``numpy`` function.
+
+    Args:
+        aggregation (str or function):
+            The aggregation to look up.
+
+    Returns:
+        function or None:
+            A function that reduces a 2D array along its rows, or ``None`` if the
+            aggregation has no vectorized version.
+    """
+    if isinstance(aggregation, str):
+        try:
+            return VECTORIZED_AGGREGATIONS[aggregation]
+        except KeyError:
+            raise ValueError('Unknown aggregation {}'.format(aggregation)) from None
+
+    try:
+        name = _NUMPY_AGGREGATIONS.get(aggregation)
+    except TypeError:   # unhashable callable
+        name = None
+
+    return VECTORIZED_AGGREGATIONS.get(name)
+
+
+def _collect(results):
+    """Convert a list of per-spectrum results into a 1D array.
+
+    Scalar results are returned as a float array. Anything else, like the spectrum
+    itself, is stored as a list inside an object array.
+    """
+    if all(np.ndim(result) == 0 for result in results):
+        return np.array(results, dtype=float)
+
+    output = np.empty(len(results), dtype=object)
+    for position, result in enumerate(results):
+        output[position] = result.tolist() if isinstance(result, np.ndarray) else result
+
+    return output
+
+
+class SpectrumBatch:
+    """Batch of spectra stored in a single contiguous buffer.
+
+    The values of all the spectra are concatenated in one ``float`` array and the
+    ``offsets`` array marks where each one starts and ends: spectrum ``i`` is
+    ``values[offsets[i]:offsets[i + 1]]``. Spectra with the same length can be
+    viewed as a 2D array so reductions run over whole groups at once instead of
+    row by row.
+
+    Args:
+        values (np.ndarray):
+            1D array with the values of all the spectra, one after the other.
+            Floating point arrays are used as they are, without copying them.
+        offsets (np.ndarray):
+            1D array of length ``n + 1`` with the position where each spectrum starts,
+            followed by the total length of ``values``.
+        metadata (pd.DataFrame, optional):
+            One row per spectrum with the ``turbine_id``, ``signal_id``, ``timestamp``
+            and context columns. If not given, an empty frame is used.
+    """
+
+    def __init__(self, values, offsets, metadata=None):
+        self.values = np.asarray(values)
+        if self.values.dtype.kind != 'f':
+            self.values = self.values.astype(float)
+
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+
+        if self.values.ndim != 1 or self.offsets.ndim != 1 or not len(self.offsets):
+            raise ValueError('values and offsets must be non empty 1D arrays')
+
+        if self.offsets[0] != 0 or self.offsets[-1] != len(self.values):
+            raise ValueError('offsets must start at 0 and end at the length of values')
+
+        if metadata is None:
+            metadata = pd.DataFrame(index=pd.RangeIndex(len(self.offsets) - 1))
+        elif len(metadata) != len(self.offsets) - 1:
+            raise ValueError('metadata must have one row per spectrum')
+
+        self.metadata = metadata.reset_index(drop=True)
+        self._lengths = None
+        self._index = None
+
+    @classmethod
+    def from_values(cls, values, metadata=None):
+        """Build a batch from a sequence of spectra.
+
+        Args:
+            values (iterable):
+                Sequence of lists or arrays, one per spectrum.
+            metadata (pd.DataFrame, optional):
+                One row per spectrum.
+
+        Returns:
+            SpectrumBatch
+        """
+        arrays = [np.asarray(spectrum, dtype=float).ravel() for spectrum in values]
+        offsets = np.zeros(len(arrays) + 1, dtype=np.int64)
+        np.cumsum([len(array) for array in arrays], out=offsets[1:])
+        buffer = np.concatenate(arrays) if arrays else np.empty(0)
+
+        return cls(buffer, offsets, metadata)
+
+    @classmethod
+    def from_dataframe(cls, data, column='values'):
+        """Build a batch from a CMS dataframe.
+
+        Args:
+            data (pd.DataFrame):
+                The CMS dataframe, with the spectra stored as lists in ``column``.
+            column (str):
+                Name of the column that contains the spectra. Defaults to ``values``.
+
+        Returns:
+            SpectrumBatch
+        """
+        return cls.from_values(data[column], data.drop(columns=column))
+
+    def to_dataframe(self, column='values'):
+        """Convert the batch back into a CMS dataframe with list values.
+
+        Args:
+            column (str):
+                Name of the column where the spectra are stored. Defaults to ``values``.
+
+        Returns:
+            pd.DataFrame
+        """
+        output = self.metadata.copy()
+        output[column] = [spectrum.tolist() for spectrum in self]
+        return output
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, position):
+        return self.values[self.offsets[position]:self.offsets[position + 1]]
+
+    def __iter__(self):
+        for start, end in zip(self.offsets[:-1], self.offsets[1:]):
+            yield self.values[start:end]
+
+    def __repr__(self):
+        return 'SpectrumBatch(spectra={}, values={})'.format(len(self), len(self.values))
+
+    @property
+    def lengths(self):
+        """np.ndarray: Length of each spectrum."""
+        if self._lengths is None:
+            self._lengths = np.diff(self.offsets)
+
+        return self._lengths
+
+    @property
+    def is_uniform(self):
+        """bool: Whether all the spectra have the same length."""
+        lengths = self.lengths
+        return bool(len(lengths)) and bool((lengths == lengths[0]).all())
+
+    @property
+    def nbytes(self):
+        """int: Bytes used by the values and offsets buffers."""
+        return self.values.nbytes + self.offsets.nbytes
+
+    def get_index(self):
+        """Get the ``MetadataIndex`` of the batch, building it the first time.
+
+        Returns:
+            MetadataIndex
+        """
+        if self._index is None:
+            self._index = MetadataIndex(self.metadata)
+
+        return self._index
+
+    def as_matrix(self):
+        """Get the spectra as a 2D array without copying them.
+
+        Returns:
+            np.ndarray:
+                View of ``values`` with one row per spectrum.
+
+        Raises:
+            ValueError:
+                If the spectra do not all have the same length.
+        """
+        if not self.is_uniform:
+            raise ValueError('Spectra have different lengths')
+
+        return self.values.reshape(len(self), self.lengths[0])
+
+    def groups(self):
+        """Iterate over the spectra grouped by length.
+
+        Each group is returned as a 2D array with one row per spectrum, which is a view
+        over the buffer whenever the spectra of the group are stored contiguously.
+
+        Yields:
+            tuple:
+                The positions of the spectra in the batch and the 2D array with their
+                values.
+        """
+        if self.is_uniform:
+            yield np.arange(len(self)), self.as_matrix()
+            return
+
+        lengths = self.lengths
+        for length in np.unique(lengths):
+            positions = np.flatnonzero(lengths == length)
+            start = self.offsets[positions[0]]
+            end = self.offsets[positions[-1] + 1]
+            if end - start == length * len(positions):
+                matrix = self.values[start:end].reshape(len(positions), length)
+            else:
+                columns = np.arange(length)
+                matrix = self.values[self.offsets[positions][:, None] + columns]
+
+            yield positions, matrix
+
+    def take(self, positions):
+        """Select a subset of the spectra.
+
+        Args:
+            positions (array-like):
+                Integer positions or boolean mask of the spectra to select.
+
+        Returns:
+            SpectrumBatch:
+                A new batch with its own compact buffer.
+        """
+        positions = np.asarray(positions)
+        if positions.dtype == bool:
+            positions = np.flatnonzero(positions)
+
+        lengths = self.lengths[positions]
+        offsets = np.zeros(len(positions) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+
+        if self.is_uniform:
+            values = self.as_matrix()[positions].ravel()
+        else:
+            shifts = np.repeat(self.offsets[positions] - offsets[:-1], lengths)
+            values = self.values[np.arange(offsets[-1]) + shifts]
+
+        return SpectrumBatch(values, offsets, self.metadata.iloc[positions])
+
+    def reduce(self, aggregation):
+        """Apply an aggregation to each spectrum.
+
+        Aggregations with a vectorized version are computed over whole groups of
+        spectra. Any other function is called once per spectrum with a ``np.ndarray``
+        view of its values.
+
+        Args:
+            aggregation (str or function):
+                Name of a vectorized aggregation or function to apply.
+
+        Returns:
+            np.ndarray:
+                One result per spectrum. ``float`` if all the results are scalars,
+                ``object`` otherwise.
+        """
+        return self.reduce_all({'value': aggregation})['value']
+
+    def reduce_all(self, aggregations):
+        """Apply several aggregations to each spectrum in a single sweep.
+
+        Each group of spectra is gathered only once and every vectorized aggregation
+        is computed over it. The remaining functions are all applied during the same
+        pass over the spectra.
+
+        Args:
+            aggregations (dict):
+                Aggregations to apply keyed by name. Values can be the name of a
+                vectorized aggregation or a function.
+
+        Returns:
+            dict:
+                One array of results per aggregation, keyed by name, in the same
+                order as ``aggregations``.
+        """
+        vectorized = dict()
+        functions = dict()
+        for name, aggregation in aggregations.items():
+            function = get_vectorized(aggregation)
+            if function is None:
+                functions[name] = aggregation
+            else:
+                vectorized[name] = function
+
+        results = {name: np.empty(len(self), dtype=float) for name in vectorized}
+        if vectorized:
+            for positions, matrix in self.groups():
+                for name, function in vectorized.items():
+                    results[name][positions] = function(matrix)
+
+        if functions:
+            rows = {name: list() for name in functions}
+            for spectrum in self:
+                for name, function in functions.items():
+                    rows[name].append(function(spectrum))
+
+            for name, values in rows.items():
+                results[name] = _collect(values)
+
+        return {name: results[name] for name in aggregations}
@@ -0,0 +1,332 @@
+# -*- coding: utf-8 -*-
+
+"""cms_ml.storage module.
+
+Columnar storage of CMS data as Parquet datasets partitioned by turbine and month.
+
+The datasets follow the hive layout, ``<path>/turbine_id=<id>/month=<YYYY-MM>/*.parquet``,
+so readers can skip whole turbines and months without opening their files. Spectra are
+stored as list arrays of ``float64`` values instead of strings, and the remaining
+columns keep their types, except the timezone aware timestamps, which are stored as
+naive UTC timestamps.
+
+Requires ``pyarrow``, which can be installed with ``pip install cms-ml[parquet]``.
+"""
+
+import glob
+import logging
+import os
+import shutil
+import uuid
+
+import numpy as np
+import pandas as pd
+
+from cms_ml.spectra import SpectrumBatch
+
+try:
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+except ImportError:
+    pa = None
+    ds = None
+
+LOGGER = logging.getLogger(__name__)
+
+PARTITION_COLUMNS = ('turbine_id', 'month')
+OUTPUT_FORMATS = ('csv', 'parquet')
+
+
+def _check_pyarrow():
+    if pa is None:
+        raise ImportError(
+            'pyarrow is required to use the parquet format. '
+            'Install it with `pip install cms-ml[parquet]`'
+        )
+
+
+def check_output_format(output_format):
+    """Validate the name of an output format.
+
+    Args:
+        output_format (str):
+            Either ``csv`` or ``parquet``.
+
+    Raises:
+        ValueError:
+            If the format is not supported.
+        ImportError:
+            If the format is ``parquet`` and ``pyarrow`` is not installed.
+    """
+    if output_format not in OUTPUT_FORMATS:
+        raise ValueError('Unknown output format {}. Use one of {}'.format(
+            output_format, OUTPUT_FORMATS))
+
+    if output_format == 'parquet':
+        _check_pyarrow()
+
+
+def _partitioning():
+    schema = pa.schema([(name, pa.string()) for name in PARTITION_COLUMNS])
+    return ds.partitioning(schema, flavor='hive')
+
+
+def _get_months(timestamps):
+    timestamps = pd.to_datetime(timestamps)
+    if timestamps.dt.tz:
+        timestamps = timestamps.dt.tz_convert(None)
+
+    months = timestamps.to_numpy().astype('datetime64[M]')
+    return np.datetime_as_string(months, unit='M')
+
+
+def _list_array(values, offsets, fixed_size=False):
+    values = pa.array(values, type=pa.float64())
+    if fixed_size:
+        size = offsets[1] - offsets[0] if len(offsets) > 1 else 0
+        return pa.FixedSizeListArray.from_arrays(values, int(size))
+
+    return pa.LargeListArray.from_arrays(pa.array(offsets, type=pa.int64()), values)
+
+
+def _set_column(table, name, array):
+    position = table.schema.get_field_index(name)
+    if position < 0:
+        return table.append_column(name, array)
+
+    return table.set_column(position, name, array)
+
+
+def _to_table(data, column, fixed_size):
+    if isinstance(data, SpectrumBatch):
+        fixed_size = fixed_size and data.is_uniform
+        table = pa.Table.from_pandas(data.metadata, preserve_index=False)
+        table = _set_column(table, column, _list_array(data.values, data.offsets, fixed_size))
+        metadata = data.metadata
+    else:
+        table = pa.Table.from_pandas(data, preserve_index=False)
+        if column in data and pa.types.is_list(table.schema.field(column).type):
+            values = table.column(column).cast(pa.large_list(pa.float64()))
+            table = _set_column(table, column, values)
+
+        metadata = data
+
+    for field in table.schema:
+        if pa.types.is_dictionary(field.type):
+            # the index type depends on the number of categories, so it is fixed to
+            # keep the schema of every file of the dataset the same
+            dictionary = pa.dictionary(pa.int32(), field.type.value_type)
+            table = _set_column(table, field.name, table.column(field.name).cast(dictionary))
+
+    timestamp = table.schema.field('timestamp').type
+    if pa.types.is_timestamp(timestamp) and timestamp.tz is not None:
+        # the timestamps are stored as naive UTC, which is what the time filters compare with
+        naive = pa.timestamp(timestamp.unit)
+        table = _set_column(table, 'timestamp', table.column('timestamp').cast(naive))
+
+    table = _set_column(table, 'turbine_id', table.column('turbine_id').cast(pa.string()))
+    return _set_column(table, 'month', pa.array(_get_months(metadata['timestamp'])))
+
+
+def write_partitioned(data, path, append=False, compression='snappy', column='values',
+                      fixed_size=False):
+    """Write CMS data as a Parquet dataset partitioned by turbine and month.
+
+    Args:
+        data (pd.DataFrame or SpectrumBatch):
+            Data to write. It must have the ``turbine_id`` and ``timestamp`` columns.
+            Spectra, either as lists in ``column`` or as a ``SpectrumBatch``, are
+            stored as list arrays of ``float64`` values.
+        path (str):
+            Directory where the dataset is stored.
+        append (bool):
+            If ``True``, add new files to the partitions that already exist. Otherwise,
+            the partitions written replace the existing ones, while the partitions of
+            other turbines and months are left untouched. Defaults to ``False``.
+        compression (str):
+            Parquet compression codec. Defaults to ``snappy``.
+        column (str):
+            Name of the column that contains the spectra. Defaults to ``values``.
+        fixed_size (bool):
+            Whether to store the spectra of a ``SpectrumBatch`` as fixed size lists
+            when they all have the same length. All the files of a dataset must use
+            the same list type. Defaults to ``False``.
+    """
+    _check_pyarrow()
+
+    table = _to_table(data, column, fixed_size)
+    LOGGER.info('Writing %s rows to %s', table.num_rows, path)
+    ds.write_dataset(
+        table,
+        path,
+        format='parquet',
+        partitioning=_partitioning(),
+        basename_template='part-{}-{{i}}.parquet'.format(uuid.uuid4().hex),
+        existing_data_behavior='overwrite_or_ignore' if append else 'delete_matching',
+        file_options=ds.ParquetFileFormat().make_write_options(compression=compression),
+    )
+
+
+def clear_partitioned(path):
+    """Remove the partitions of a Parquet dataset written by ``write_partitioned``.
+
+    Only the ``turbine_id=*`` directories are removed, any other file in ``path``
+    is left untouched.
+
+    Args:
+        path (str):
+            Directory where the dataset is stored.
+    """
+    partitions = glob.glob(os.path.join(glob.escape(path), PARTITION_COLUMNS[0] + '=*'))
+    for partition in partitions:
+        shutil.rmtree(partition)
+
+    if partitions:
+        LOGGER.info('Removed %s partitions from %s', len(partitions), path)
+
+
+def _get_partitions_filter(turbines, months):
+    partitions = pd.DataFrame({'turbine_id': turbines, 'month': months}).drop_duplicates()
+    expression = None
+    for turbine, turbine_months in partitions.groupby('turbine_id')['month']:
+        item = (ds.field('turbine_id') == turbine) & ds.field('month').isin(list(turbine_months))
+        expression = item if expression is None else expression | item
+
+    return expression
+
+
+def _read_table(path, columns, expression):
+    dataset = ds.dataset(path, format='parquet', partitioning=_partitioning())
+    if columns is None:
+        columns = ['turbine_id'] + [
+            name for name in dataset.schema.names if name not in PARTITION_COLUMNS]
+
+    table = dataset.to_table(columns=list(columns), filter=expression)
+    LOGGER.info('Read %s rows from %s', table.num_rows, path)
+    return table
+
+
+def merge_partitioned(data, path, keys, column='values'):
+    """Merge rows into a Parquet dataset, replacing the existing rows with the same keys.
+
+    Only the partitions of the turbine and month pairs found in ``data`` are read and
+    written again, the rest of the dataset, including the other months of the same
+    turbines, is left untouched.
+
+    Args:
+        data (pd.DataFrame):
+            Rows to merge. It must have the ``turbine_id`` and ``timestamp`` columns.
+        path (str):
+            Directory where the dataset is stored.
+        keys (list):
+            Columns that identify a row.
+        column (str):
+            Name of the column that contains the spectra. Defaults to ``values``.
+    """
+    _check_pyarrow()
+
+    if len(data) and glob.glob(os.path.join(glob.escape(path), PARTITION_COLUMNS[0] + '=*')):
+        timestamps = pd.to_datetime(data['timestamp'])
+        if timestamps.dt.tz:
+            # the existing timestamps are read as naive UTC
+            data = data.assign(timestamp=timestamps.dt.tz_convert(None))
+
+        expression = _get_partitions_filter(
+            data['turbine_id'].astype(str).to_numpy(), _get_months(data['timestamp']))
+        existing = _read_table(path, None, expression).to_pandas()
+        if len(existing):
+            data = pd.concat([existing, data], ignore_index=True, sort=False)
+            data = data.drop_duplicates(keys, keep='last', ignore_index=True)
+
+    write_partitioned(data, path, column=column)
+
+
+def _to_naive(time):
+    time = pd.Timestamp(time)
+    return time.tz_convert(None) if time.tz else time
+
+
+def _get_filter(turbines, signals, start_time, end_time):
+    month = ds.field('month')
+    timestamp = ds.field('timestamp')
+
+    expressions = list()
+    if turbines is not None:
+        expressions.append(ds.field('turbine_id').isin(list(turbines)))
+
+    if signals is not None:
+        expressions.append(ds.field('signal_id').isin(list(signals)))
+
+    if start_time is not None:
+        start_time = _to_naive(start_time)
+        expressions.append(month >= start_time.strftime('%Y-%m'))
+        expressions.append(timestamp >= start_time)
+
+    if end_time is not None:
+        end_time = _to_naive(end_time)
+        expressions.append(month <= end_time.strftime('%Y-%m'))
+        expressions.append(timestamp < end_time)
+
+    expression = None
+    for item in expressions:
+        expression = item if expression is None else expression & item
+
+    return expression
+
+
+def _to_batch(table, column):
+    values = table.column(column).combine_chunks()
+    metadata = table.drop([column]).to_pandas()
+    if pa.types.is_fixed_size_list(values.type):
+        offsets = np.arange(len(values) + 1, dtype=np.int64) * values.type.list_size
+    else:
+        offsets = values.offsets.to_numpy().astype(np.int64)
+        offsets -= offsets[0]
+
+    flat = values.flatten().to_numpy(zero_copy_only=False)
+    return SpectrumBatch(flat, offsets, metadata)
+
+
+def read_partitioned(path, columns=None, turbines=None, signals=None, start_time=None,
+                     end_time=None, batch=False, column='values'):
+    """Read a Parquet dataset written by ``write_partitioned``.
+
+    Only the requested columns are read, and the turbine and time filters are
+    applied to the partition directories first so the files of other turbines and
+    months are never opened.
+
+    Args:
+        path (str):
+            Directory where the dataset is stored.
+        columns (list, optional):
+            Columns to read. If None, all the columns are read. Default is None.
+        turbines (list, optional):
+            Turbines to read. If None, all the turbines are read. Default is None.
+        signals (list, optional):
+            Exact names of the signals to read. If None, all the signals are read.
+            Default is None.
+        start_time (str, datetime, optional):
+            The minimum timestamp, inclusive. Default is None.
+        end_time (str, datetime, optional):
+            The maximum timestamp, exclusive. Default is None.
+        batch (bool):
+            If ``True``, return a ``SpectrumBatch`` built from the spectra in
+            ``column`` without converting them to lists. Defaults to ``False``.
+        column (str):
+            Name of the column that contains the spectra. Defaults to ``values``.
+
+    Returns:
+        pd.DataFrame or SpectrumBatch:
+            The data read. Spectra are returned as ``np.ndarray`` values.
+    """
+    _check_pyarrow()
+
+    if columns is not None and batch and column not in columns:
+        columns = list(columns) + [column]
+
+    table = _read_table(path, columns, _get_filter(turbines, signals, start_time, end_time))
+
+    if batch:
+        return _to_batch(table, column)
+
+    return table.to_pandas()
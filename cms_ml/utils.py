@@ -1,26 +1,107 @@
 import json
 import logging
 
+import numpy as np
 import pandas as pd
 
+from cms_ml.index import MetadataIndex
+from cms_ml.sidecar import get_sidecar_path, read_sidecar, write_sidecar
+from cms_ml.spectra import SpectrumBatch
+
 LOGGER = logging.getLogger(__name__)
 
 
-def load_fft_csv(path):
-    df = pd.read_csv(path, parse_dates=['timestamp'])
+def _parse_fft_values(df, batch):
+    if batch:
+        values = [json.loads(value) for value in df.pop('values')]
+        return SpectrumBatch.from_values(values, df)
+
     df["values"] = df["values"].apply(json.loads).apply(list)
     return df
 
 
-def filter_values(raw_df, start_time=None, end_time=None, signals=None, turbines=None):
+def _load_fft_chunks(path, batch, chunksize):
+    for chunk in pd.read_csv(path, parse_dates=['timestamp'], chunksize=chunksize):
+        yield _parse_fft_values(chunk.reset_index(drop=True), batch)
+
+
+def _iter_chunks(batch, chunksize, as_batch):
+    for start in range(0, len(batch), chunksize):
+        chunk = batch.take(np.arange(start, min(start + chunksize, len(batch))))
+        yield chunk if as_batch else chunk.to_dataframe()
+
+
+def _load_cached(path, cache):
+    sidecar_path = get_sidecar_path(path)
+    cached = read_sidecar(sidecar_path, path) if cache else None
+    if cached is None:
+        df = pd.read_csv(path, parse_dates=['timestamp'])
+        cached = _parse_fft_values(df, batch=True)
+        if cache:
+            try:
+                write_sidecar(cached, sidecar_path, path)
+            except (OSError, TypeError, ValueError) as error:
+                LOGGER.warning('Could not write sidecar %s: %s', sidecar_path, error)
+
+    return cached
+
+
+def load_fft_csv(path, batch=False, chunksize=None, cache=True):
+    """Load a CSV file with FFT values stored as JSON lists.
+
+    The first time a file is loaded, the parsed spectra are stored in a binary sidecar
+    file next to it, see ``cms_ml.sidecar``. Later loads memory-map the sidecar instead
+    of parsing the file again, as long as the file has not changed.
+
+    Args:
+        path (str):
+            Path to the CSV file.
+        batch (bool):
+            If ``True``, return the spectra as a ``SpectrumBatch`` instead of a
+            ``pandas.DataFrame`` with a list per row. Defaults to ``False``.
+        chunksize (int, optional):
+            If given, read the file in chunks of this many rows and return an
+            iterator over them, so only one chunk is held in memory at a time.
+            Default is None.
+        cache (bool):
+            Whether to use the sidecar file of ``path``, named after it with the
+            ``.cache`` extension, see ``cms_ml.sidecar.get_sidecar_path``. If the CSV
+            file changed since the sidecar was written, the sidecar is detected as
+            stale, and the file is parsed again and the sidecar rebuilt. With a
+            ``chunksize``, an up to date sidecar is read, but a missing or stale one is
+            not rebuilt. If ``False``, the file is always parsed and no sidecar is read
+            or written. Defaults to ``True``.
+
+    Returns:
+        pd.DataFrame, SpectrumBatch or iterator:
+            The loaded data, or an iterator over the loaded chunks if ``chunksize``
+            is given.
+    """
+    if chunksize:
+        cached = read_sidecar(get_sidecar_path(path), path) if cache else None
+        if cached is not None:
+            return _iter_chunks(cached, chunksize, batch)
+
+        return _load_fft_chunks(path, batch, chunksize)
+
+    data = _load_cached(path, cache)
+    return data if batch else data.to_dataframe()
+
+
+def filter_values(raw_df, start_time=None, end_time=None, signals=None, turbines=None,
+                  match='exact', index=None):
     """Filters the dataframe based on timestamp and signal.
 
     The timestamp of a row must be within the specified time range
     and be a signal within the selected signals.
 
+    The rows are selected through a ``cms_ml.index.MetadataIndex``. The index of a
+    ``SpectrumBatch`` is built the first time it is filtered and reused afterwards.
+
     Args:
-        raw_df (pd.DataFrame):
-            The CMS dataframe to filter.
+        raw_df (pd.DataFrame or SpectrumBatch):
+            The CMS dataframe to filter. If a ``SpectrumBatch`` is given, its
+            metadata is used to filter and a new batch is returned.
         start_time (str, datetime, optional):
             The minimum timestamp, inclusive.
             If None, the timestamps have no minimum. Default is None.
@@ -33,40 +114,35 @@ def filter_values(raw_df, start_time=None, end_time=None, signals=None, turbines
         turbines (list, optional):
             Names of the turbines to process. If None,
             all turbines in the extracted data are included. Default is None.
+        match (str):
+            ``exact`` to select the signals and turbines whose names are in the given
+            lists, or ``contains`` to select the ones that contain any of the given
+            names, as case insensitive regular expressions. Defaults to ``exact``.
+        index (MetadataIndex, optional):
+            Index built over ``raw_df`` to use instead of building a new one, so
+            repeated selections over the same dataframe are cheap. Default is None.
     Returns:
-        pd.DataFrame:
+        pd.DataFrame or SpectrumBatch:
             Values filtered as specified above.
     """
-    timestamps = pd.to_datetime(raw_df['timestamp'])
-    if timestamps.dt.tz:
-        timestamps = timestamps.dt.tz_convert(None)
-
-    mask = [True] * len(raw_df)
+    is_batch = isinstance(raw_df, SpectrumBatch)
     if start_time:
         LOGGER.info('Filtering by start time %s', start_time)
-        start_time = pd.to_datetime(start_time)
-        if start_time.tz:
-            start_time = start_time.tz_convert(None)
-
-        mask &= timestamps >= start_time
-
     if end_time:
         LOGGER.info('Filtering by end time %s', end_time)
-        end_time = pd.to_datetime(end_time)
-        if end_time.tz:
-            end_time = end_time.tz_convert(None)
-
-        mask &= timestamps < end_time
-
     if signals:
         LOGGER.info('Filtering by signals %s', signals)
-        mask &= raw_df['signal_id'].str.contains('|'.join(signals), na=False, case=False)
-
     if turbines:
         LOGGER.info('Filtering by turbines %s', turbines)
-        mask &= raw_df['turbine_id'].str.contains('|'.join(turbines), na=False, case=False)
 
-    final_df = raw_df[mask]
-    LOGGER.info('Selected %s entries after filtering', len(final_df))
+    if not (start_time or end_time or signals or turbines or match != 'exact'):
+        return raw_df if is_batch else raw_df.copy()
+
+    if index is None:
+        index = raw_df.get_index() if is_batch else MetadataIndex(raw_df)
+
+    positions = index.select(start_time, end_time, signals or None, turbines or None, match)
+    final = raw_df.take(positions)
+    LOGGER.info('Selected %s entries after filtering', len(final))
 
-    return final_df
+    return final
@@ -0,0 +1,154 @@
+# -*- coding: utf-8 -*-
+
+"""cms_ml.watermarks module."""
+
+import json
+import logging
+import os
+
+import numpy as np
+import pandas as pd
+
+LOGGER = logging.getLogger(__name__)
+
+
+def get_watermarks_path(output_path):
+    """Get the path of the watermarks file that belongs to an output path.
+
+    The watermarks keep track of the latest timestamp written to the output for
+    each turbine, signal and aggregation.
+    """
+    return output_path + '.watermarks.json'
+
+
+def load_watermarks(path):
+    """Load the watermarks stored in the given path.
+
+    Args:
+        path (str):
+            Path to the watermarks JSON file.
+
+    Returns:
+        dict:
+            Latest processed ``pd.Timestamp`` keyed by ``(turbine_id, signal_id,
+            aggregation)``. Empty if the file does not exist.
+    """
+    if not os.path.isfile(path):
+        return dict()
+
+    with open(path) as watermarks_file:
+        records = json.load(watermarks_file)
+
+    return {
+        (record['turbine_id'], record['signal_id'], record['aggregation']):
+        pd.Timestamp(record['timestamp'])
+        for record in records
+    }
+
+
+def save_watermarks(watermarks, path):
+    """Store the watermarks in the given path.
+
+    The file is written next to its final location and then moved, so an
+    interrupted write never leaves a corrupt watermarks file behind.
+
+    Args:
+        watermarks (dict):
+            Latest processed ``pd.Timestamp`` keyed by ``(turbine_id, signal_id,
+            aggregation)``.
+        path (str):
+            Path to the watermarks JSON file.
+    """
+    records = [
+        {
+            'turbine_id': turbine_id,
+            'signal_id': signal_id,
+            'aggregation': aggregation,
+            'timestamp': timestamp.isoformat(),
+        }
+        for (turbine_id, signal_id, aggregation), timestamp in sorted(watermarks.items())
+    ]
+
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as watermarks_file:
+        json.dump(records, watermarks_file, indent=1)
+
+    os.replace(tmp_path, path)
+    LOGGER.info('Stored %s watermarks in %s', len(records), path)
+
+
+def _factorize(metadata):
+    if not len(metadata):
+        # an empty MultiIndex cannot be factorized
+        return np.empty(0, dtype='datetime64[ns]'), np.empty(0, dtype=np.int64), list()
+
+    timestamps = pd.to_datetime(metadata['timestamp'])
+    if timestamps.dt.tz:
+        timestamps = timestamps.dt.tz_convert(None)
+
+    pairs = pd.MultiIndex.from_arrays([
+        metadata['turbine_id'].fillna(''),
+        metadata['signal_id'].fillna(''),
+    ])
+    codes, uniques = pairs.factorize()
+
+    return timestamps.to_numpy(), codes, list(uniques)
+
+
+def find_new(metadata, aggregations, watermarks):
+    """Find the rows that are newer than the watermark of each aggregation.
+
+    Args:
+        metadata (pd.DataFrame):
+            Data with ``turbine_id``, ``signal_id`` and ``timestamp`` columns.
+        aggregations (list):
+            Names of the aggregations.
+        watermarks (dict):
+            Latest processed ``pd.Timestamp`` keyed by ``(turbine_id, signal_id,
+            aggregation)``.
+
+    Returns:
+        dict:
+            Boolean mask of the rows that have not been processed yet, keyed by
+            aggregation name.
+    """
+    timestamps, codes, pairs = _factorize(metadata)
+
+    masks = dict()
+    for aggregation in aggregations:
+        limits = pd.DatetimeIndex([
+            watermarks.get((turbine_id, signal_id, aggregation), pd.NaT)
+            for turbine_id, signal_id in pairs
+        ]).to_numpy()[codes]
+
+        masks[aggregation] = np.isnat(limits) | (timestamps > limits)
+
+    return masks
+
+
+def update_watermarks(watermarks, metadata, masks):
+    """Move the watermarks forward to the latest processed timestamps.
+
+    Args:
+        watermarks (dict):
+            Latest processed ``pd.Timestamp`` keyed by ``(turbine_id, signal_id,
+            aggregation)``. Updated in place.
+        metadata (pd.DataFrame):
+            Data with ``turbine_id``, ``signal_id`` and ``timestamp`` columns.
+        masks (dict):
+            Boolean mask of the rows processed for each aggregation, keyed by
+            aggregation name. If no row was processed, the watermarks are left as
+            they are.
+    """
+    if not len(metadata) or not any(mask.any() for mask in masks.values()):
+        return
+
+    timestamps, codes, pairs = _factorize(metadata)
+
+    for aggregation, mask in masks.items():
+        latest = pd.Series(timestamps[mask]).groupby(codes[mask]).max()
+        for code, timestamp in latest.items():
+            key = pairs[code] + (aggregation, )
+            current = watermarks.get(key)
+            if current is None or timestamp > current:
+                watermarks[key] = timestamp
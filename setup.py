@@ -23,6 +23,10 @@ install_requires = [
     'numpy>=1.17.4,<1.19.0',
 ]
 
+parquet_requires = [
+    'pyarrow>=6,<17',
+]
+
 setup_requires = [
     'pytest-runner>=2.11.1',
 ]
@@ -32,7 +36,7 @@ tests_require = [
     'pytest-cov>=2.6.0',
     'jupyter>=1.0.0,<2',
     'rundoc>=0.4.3,<0.5',
-]
+] + parquet_requires
 
 development_requires = [
     # general
@@ -92,6 +96,7 @@ setup(
         ],
     },
     extras_require={
+        'parquet': parquet_requires,
         'test': tests_require,
         'dev': development_requires + tests_require,
     },
@@ -90,3 +90,8 @@ def rmdir(c, path):
         shutil.rmtree(path, onerror=remove_readonly)
     except PermissionError:
         pass
+
+
+@task
+def benchmark(c):
+    c.run('python -m benchmark')
@@ -2,10 +2,16 @@
 """
 test for envelope spectrum function
 """
+from unittest.mock import patch
+
 import numpy as np
+import pytest
 
+from cms_ml.aggregations.amplitude import band
 from cms_ml.aggregations.amplitude.band import (
-    band_max, band_mean, band_min, band_rms, band_sideband_pr, band_sideband_rms)
+    band_max, band_mean, band_min, band_rms, band_sideband_pr, band_sideband_rms, band_statistics,
+    band_sum, get_band_plan)
+from cms_ml.pipe_constructor import band_gen
 
 AMPLITUDE_VALUES = np.arange(-10, 15, 0.5)
 FREQUENCY_VALUES = np.arange(10, 510, 10)
@@ -53,3 +59,121 @@ def test_band_sideband_pr():
                               max_frequency=100, side_bands=[(400, 500), (10, 30), (200, 350)])
 
     np.testing.assert_almost_equal(actual, expected)
+
+
+def test_band_statistics():
+    bands = [(100, 400), (30, 100), (30, 350), (100, 150)]
+
+    actual = band_statistics(AMPLITUDE_VALUES, FREQUENCY_VALUES, bands)
+
+    for name, function in (('sum', band_sum), ('mean', band_mean), ('rms', band_rms),
+                           ('max', band_max), ('min', band_min)):
+        expected = [function(AMPLITUDE_VALUES, FREQUENCY_VALUES, *band) for band in bands]
+        np.testing.assert_almost_equal(actual[name], expected)
+
+
+def test_band_statistics_band_gen():
+    bands = band_gen(10, 500, 50)
+
+    actual = band_statistics(AMPLITUDE_VALUES, FREQUENCY_VALUES, bands, statistics=('rms', ))
+
+    expected = [
+        band_rms(AMPLITUDE_VALUES, FREQUENCY_VALUES, **band['init_params'])
+        for band in bands
+    ]
+    assert list(actual) == ['rms']
+    np.testing.assert_almost_equal(actual['rms'], expected)
+
+
+def test_band_statistics_empty_band():
+    actual = band_statistics(AMPLITUDE_VALUES, FREQUENCY_VALUES, [(11, 19), (600, 700)])
+
+    np.testing.assert_array_equal(actual['sum'], [0, 0])
+    for name in ('mean', 'rms', 'max', 'min'):
+        assert np.isnan(actual[name]).all()
+
+
+def test_band_statistics_unsorted_2d():
+    order = np.random.permutation(len(FREQUENCY_VALUES))
+    amplitude_values = np.vstack([AMPLITUDE_VALUES, -AMPLITUDE_VALUES])[:, order]
+
+    actual = band_statistics(amplitude_values, FREQUENCY_VALUES[order], [(30, 100)])
+
+    np.testing.assert_almost_equal(actual['max'], [[-5.5], [9.0]])
+    np.testing.assert_almost_equal(actual['mean'], [[-7.25], [7.25]])
+
+
+def test_band_statistics_unknown():
+    with pytest.raises(ValueError):
+        band_statistics(AMPLITUDE_VALUES, FREQUENCY_VALUES, [(30, 100)], statistics=('std', ))
+
+
+def test_band_sideband_pr_no_side_bands():
+    actual = band_sideband_pr(AMPLITUDE_VALUES, FREQUENCY_VALUES, min_frequency=30,
+                              max_frequency=100, side_bands=[])
+
+    assert np.isnan(actual)
+
+
+def test_get_band_plan_cached():
+    band._AXES.clear()
+    band._BAND_PLANS.clear()
+
+    plan = get_band_plan(FREQUENCY_VALUES, [(30, 100), (100, 400)])
+    cached = get_band_plan(FREQUENCY_VALUES.copy(), [(30, 100), (100, 400)])
+
+    assert plan is cached
+    assert plan[0] is None
+    np.testing.assert_array_equal(plan[1], [2, 9])
+    np.testing.assert_array_equal(plan[2], [10, 40])
+
+
+def test_get_band_plan_unsorted():
+    order = np.random.permutation(len(FREQUENCY_VALUES))
+
+    plan_order, starts, ends = get_band_plan(FREQUENCY_VALUES[order], [(30, 100)])
+
+    np.testing.assert_array_equal(FREQUENCY_VALUES[order][plan_order], FREQUENCY_VALUES)
+    np.testing.assert_array_equal(starts, [2])
+    np.testing.assert_array_equal(ends, [10])
+
+
+def test_get_band_plan_regular_axis():
+    band._AXES.clear()
+    band._BAND_PLANS.clear()
+
+    plan = get_band_plan((10, 10, 50), [(30, 100)])
+
+    np.testing.assert_array_equal(plan[1], [2])
+    np.testing.assert_array_equal(plan[2], [10])
+
+
+@patch('cms_ml.aggregations.amplitude.band.BAND_PLAN_CACHE_SIZE', 2)
+def test_get_band_plan_eviction():
+    band._AXES.clear()
+    band._BAND_PLANS.clear()
+
+    first = get_band_plan(FREQUENCY_VALUES, [(30, 100)])
+    get_band_plan(FREQUENCY_VALUES, [(30, 200)])
+    get_band_plan(FREQUENCY_VALUES, [(30, 100)])
+    get_band_plan(FREQUENCY_VALUES, [(30, 300)])
+
+    assert len(band._BAND_PLANS) == 2
+    assert len(band._AXES) == 1
+    assert get_band_plan(FREQUENCY_VALUES, [(30, 100)]) is first
+
+
+@patch('cms_ml.aggregations.amplitude.band.AXIS_CACHE_SIZE', 2)
+def test_get_band_plan_axis_eviction():
+    band._AXES.clear()
+    band._BAND_PLANS.clear()
+
+    plans = list()
+    for shift in range(5):
+        # same first, middle and last values, but a different band start
+        frequency_values = FREQUENCY_VALUES.astype(float)
+        frequency_values[2] += shift
+        plans.append(get_band_plan(frequency_values, [(31, 100)]))
+
+    assert len(band._AXES) == 2
+    assert [plan[1].tolist() for plan in plans] == [[3], [2], [2], [2], [2]]
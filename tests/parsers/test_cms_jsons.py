@@ -2,6 +2,12 @@
 # -*- coding: utf-8 -*-
 
 """Tests for cms_ml.parsing."""
+import gzip
+import json
+import os
+import shutil
+import tempfile
+import zipfile
 from copy import deepcopy
 from datetime import datetime
 from unittest import TestCase
@@ -12,8 +18,11 @@ import pandas as pd
 import pytest
 from pandas.util.testing import assert_frame_equal
 
+from cms_ml.ingestion import load_manifest
 from cms_ml.parsers.cms_jsons import (
-    _get_cms_context, _get_cms_values, _parse_cms_jsons, filter_values)
+    _get_cms_context, _get_cms_values, _get_values_rows, _parse_cms_jsons, _parse_task,
+    extract_cms_jsons, filter_values)
+from cms_ml.parsers.streaming import load_spectra
 
 
 class TestCMSParseEntry(TestCase):
@@ -89,13 +98,13 @@ class TestCMSParseEntry(TestCase):
 
 
 class TestParseCMSJsons(TestCase):
-    @patch('cms_ml.parsers.cms_jsons.json')
-    @patch('cms_ml.parsers.cms_jsons.open')
+    @patch('cms_ml.parsers.cms_jsons.iter_json_array')
+    @patch('cms_ml.parsers.cms_jsons.open_input')
     @patch('cms_ml.parsers.cms_jsons.os.listdir')
-    def test__parse_cms_jsons_single_file_value(self, listdir_mock, open_mock, json_mock):
+    def test__parse_cms_jsons_single_file_value(self, listdir_mock, open_mock, iter_mock):
         # setup
         listdir_mock.return_value = ['a.json']
-        json_mock.load.return_value = [{'a': 'json'}]
+        iter_mock.return_value = [{'a': 'json'}]
         parser = Mock()
         parser.return_value = pd.DataFrame([{
             'signal_id': 'a_json',
@@ -120,13 +129,13 @@ class TestParseCMSJsons(TestCase):
 
         parser.called_once_with({'a': 'json'})
 
-    @patch('cms_ml.parsers.cms_jsons.json')
-    @patch('cms_ml.parsers.cms_jsons.open')
+    @patch('cms_ml.parsers.cms_jsons.iter_json_array')
+    @patch('cms_ml.parsers.cms_jsons.open_input')
     @patch('cms_ml.parsers.cms_jsons.os.listdir')
-    def test__parse_cms_jsons_multiple_value(self, listdir_mock, open_mock, json_mock):
+    def test__parse_cms_jsons_multiple_value(self, listdir_mock, open_mock, iter_mock):
         # setup
         listdir_mock.return_value = ['a.json', 'another.json']
-        json_mock.load.side_effect = [
+        iter_mock.side_effect = [
             [{
                 'a': 'json'
             }],
@@ -174,13 +183,13 @@ class TestParseCMSJsons(TestCase):
         ]
         self.assertListEqual(parser_calls, parser.call_args_list)
 
-    @patch('cms_ml.parsers.cms_jsons.json')
-    @patch('cms_ml.parsers.cms_jsons.open')
+    @patch('cms_ml.parsers.cms_jsons.iter_json_array')
+    @patch('cms_ml.parsers.cms_jsons.open_input')
     @patch('cms_ml.parsers.cms_jsons.os.listdir')
-    def test__parse_cms_jsons_multiple_value_XY(self, listdir_mock, open_mock, json_mock):
+    def test__parse_cms_jsons_multiple_value_XY(self, listdir_mock, open_mock, iter_mock):
         # setup
         listdir_mock.return_value = ['a.json', 'another.json']
-        json_mock.load.side_effect = [
+        iter_mock.side_effect = [
             [{
                 'a': 'json'
             }],
@@ -231,13 +240,13 @@ class TestParseCMSJsons(TestCase):
         ]
         self.assertListEqual(parser_calls, parser.call_args_list)
 
-    @patch('cms_ml.parsers.cms_jsons.json')
-    @patch('cms_ml.parsers.cms_jsons.open')
+    @patch('cms_ml.parsers.cms_jsons.iter_json_array')
+    @patch('cms_ml.parsers.cms_jsons.open_input')
     @patch('cms_ml.parsers.cms_jsons.os.listdir')
-    def test__parse_cms_jsons_multiple_context(self, listdir_mock, open_mock, json_mock):
+    def test__parse_cms_jsons_multiple_context(self, listdir_mock, open_mock, iter_mock):
         # setup
         listdir_mock.return_value = ['a.json', 'another.json']
-        json_mock.load.side_effect = [
+        iter_mock.side_effect = [
             [{
                 'a': 'json'
             }],
@@ -301,6 +310,167 @@ class TestParseCMSJsons(TestCase):
         self.assertListEqual(parser_calls, parser.call_args_list)
 
 
+class TestExtractCMSJsons(TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        os.makedirs(os.path.join(self.tmp_dir.name, 'T001'))
+        entry = {'details': {'name': 'Signal_1', 'sensorName': 'Sensor_1'},
+                 'location': {'turbineName': 'T001-93'},
+                 'data': {'context': {'timeStamp': '2019-11-19T13:27:18+00:00',
+                                      'operationalValues': [{'name': 'Measured RPM',
+                                                             'value': 1451.202}]},
+                          'set': [{'yValueUnit': '1', 'yValues': [1, 2, 3]}]}}
+        entries = [deepcopy(entry) for _ in range(3)]
+        entries[1]['data']['context']['timeStamp'] = '2019-11-20T13:27:18+00:00'
+        entries[2]['details']['name'] = 'Signal_2'
+        entries[2]['data']['set'] = [{'yValueUnit': '1', 'yValues': [4, 5]},
+                                     {'yValueUnit': '1', 'yValues': [6]}]
+        with open(os.path.join(self.tmp_dir.name, 'T001', 'a.json'), 'w') as json_file:
+            json.dump(entries, json_file, indent=2)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test__parse_cms_jsons_values(self):
+        returned = _parse_cms_jsons(os.path.join(self.tmp_dir.name, 'T001'), _get_values_rows)
+
+        assert returned['signal_id'].tolist() == [
+            'Sensor_1_Signal_1', 'Sensor_1_Signal_1',
+            'Sensor_1_Signal_2_X', 'Sensor_1_Signal_2_Y'
+        ]
+        assert returned['values'].tolist() == [[1., 2., 3.], [1., 2., 3.], [4., 5.], [6.]]
+
+    def test_extract_cms_jsons(self):
+        returned = extract_cms_jsons(self.tmp_dir.name, end_time='2019-11-20')
+
+        assert returned['turbine_id'].tolist() == ['T001'] * 3
+        assert returned['signal_id'].tolist() == [
+            'Sensor_1_Signal_1', 'Sensor_1_Signal_2_X', 'Sensor_1_Signal_2_Y'
+        ]
+        assert returned['timestamp'].tolist() == [pd.Timestamp('2019-11-19 13:27:18')] * 3
+        np.testing.assert_allclose(returned['Measured RPM'], [1451.202] * 3)
+        assert returned['Measured RPM'].dtype == np.float32
+        assert returned['turbineName'].dtype == 'category'
+        assert returned['values'].tolist() == [[1., 2., 3.], [4., 5.], [6.]]
+
+    def test_extract_cms_jsons_pushdown(self):
+        with patch('cms_ml.parsers.cms_jsons.json.loads', wraps=json.loads) as loads_mock:
+            returned = extract_cms_jsons(self.tmp_dir.name, start_time='2019-11-20',
+                                         signals=['Sensor_1_Signal_1'])
+
+        assert returned['timestamp'].tolist() == [pd.Timestamp('2019-11-20 13:27:18')]
+        assert returned['values'].tolist() == [[1., 2., 3.]]
+        assert loads_mock.call_count == 1
+
+    def test_extract_cms_jsons_context_fields(self):
+        returned = extract_cms_jsons(self.tmp_dir.name, context_fields=['Measured RPM'])
+
+        assert list(returned.columns) == [
+            'turbine_id', 'signal_id', 'timestamp', 'Measured RPM', 'values'
+        ]
+        assert len(returned) == 4
+
+    def test_extract_cms_jsons_n_jobs(self):
+        os.makedirs(os.path.join(self.tmp_dir.name, 'T002'))
+        shutil.copy(os.path.join(self.tmp_dir.name, 'T001', 'a.json'),
+                    os.path.join(self.tmp_dir.name, 'T002', 'a.json'))
+
+        returned = extract_cms_jsons(self.tmp_dir.name, n_jobs=2)
+
+        expected = extract_cms_jsons(self.tmp_dir.name)
+        assert_frame_equal(expected, returned)
+        assert returned['turbine_id'].tolist() == ['T001'] * 4 + ['T002'] * 4
+
+    def test_extract_cms_jsons_context_schema(self):
+        returned = extract_cms_jsons(self.tmp_dir.name, context_schema={'yValueUnit': 'object'})
+
+        assert returned['yValueUnit'].tolist() == ['1'] * 4
+
+    def test_extract_cms_jsons_incremental(self):
+        output_path = os.path.join(self.tmp_dir.name, 'output.csv')
+        extract_cms_jsons(self.tmp_dir.name, output_path, turbines=['T001'], incremental=True)
+
+        with open(os.path.join(self.tmp_dir.name, 'T001', 'a.json')) as json_file:
+            entries = json.load(json_file)
+
+        entries[0]['data']['set'][0]['yValues'] = [7, 8]
+        with open(os.path.join(self.tmp_dir.name, 'T001', 'b.json'), 'w') as json_file:
+            json.dump(entries[:1], json_file)
+
+        with patch('cms_ml.parsers.cms_jsons._parse_task', wraps=_parse_task) as parse_mock:
+            extract_cms_jsons(self.tmp_dir.name, output_path, turbines=['T001'],
+                              incremental=True)
+
+        assert [args[0][1] for args, _ in parse_mock.call_args_list] == [
+            os.path.join(self.tmp_dir.name, 'T001', 'b.json')]
+
+        returned = pd.read_csv(output_path)
+        assert returned['values'].tolist() == [
+            '[1.0, 2.0, 3.0]', '[4.0, 5.0]', '[6.0]', '[7.0, 8.0]']
+
+        manifest = load_manifest(output_path + '.manifest.json')
+        assert manifest[os.path.join('T001', 'a.json')]['rows'] == 4
+        assert manifest[os.path.join('T001', 'b.json')]['rows'] == 1
+
+    def test_extract_cms_jsons_incremental_filters(self):
+        output_path = os.path.join(self.tmp_dir.name, 'output.csv')
+
+        with pytest.raises(ValueError):
+            extract_cms_jsons(self.tmp_dir.name, output_path, end_time='2019-11-20',
+                              incremental=True)
+
+        with pytest.raises(ValueError):
+            extract_cms_jsons(self.tmp_dir.name, output_path, signals=['Signal_1'],
+                              incremental=True)
+
+        with pytest.raises(ValueError):
+            extract_cms_jsons(self.tmp_dir.name, output_path, lazy=True, incremental=True)
+
+        assert not os.path.exists(output_path + '.manifest.json')
+
+    def test_extract_cms_jsons_lazy(self):
+        returned = extract_cms_jsons(self.tmp_dir.name, end_time='2019-11-20', lazy=True)
+
+        assert 'values' not in returned
+        assert returned['spectrum_entry'].tolist() == [0, 2, 2]
+
+        batch = load_spectra(returned)
+        expected = extract_cms_jsons(self.tmp_dir.name, end_time='2019-11-20')
+        assert_frame_equal(batch.to_dataframe(), expected)
+
+    def test_extract_cms_jsons_compressed(self):
+        expected = extract_cms_jsons(self.tmp_dir.name)
+        json_path = os.path.join(self.tmp_dir.name, 'T001', 'a.json')
+        with open(json_path, 'rb') as json_file:
+            raw = json_file.read()
+
+        os.remove(json_path)
+        with gzip.open(json_path + '.gz', 'wb') as gzip_file:
+            gzip_file.write(raw)
+
+        with zipfile.ZipFile(os.path.join(self.tmp_dir.name, 'T002.zip'), 'w') as zip_file:
+            zip_file.writestr('a.json', raw)
+
+        returned = extract_cms_jsons(self.tmp_dir.name)
+
+        assert returned['turbine_id'].tolist() == ['T001'] * 4 + ['T002'] * 4
+        assert_frame_equal(returned.iloc[:4], expected)
+
+        lazy = extract_cms_jsons(self.tmp_dir.name, lazy=True)
+        assert_frame_equal(load_spectra(lazy).to_dataframe(), returned)
+
+    def test_extract_cms_jsons_errors(self):
+        with open(os.path.join(self.tmp_dir.name, 'T001', 'b.json'), 'w') as json_file:
+            json_file.write('[{"details": ')
+
+        with pytest.raises(ValueError):
+            extract_cms_jsons(self.tmp_dir.name)
+
+        returned = extract_cms_jsons(self.tmp_dir.name, errors='skip')
+
+        assert returned['values'].tolist() == [[1., 2., 3.], [1., 2., 3.], [4., 5.], [6.]]
+
+
 class TestFilterValues(TestCase):
     @classmethod
     def setUpClass(cls):
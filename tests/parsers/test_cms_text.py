@@ -0,0 +1,224 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for cms_ml.parsers.cms_text."""
+import gzip
+import json
+import os
+import tempfile
+import zipfile
+from datetime import datetime
+from unittest import TestCase
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from cms_ml.parsers.cms_text import parse_adu_cms_txt, parse_cms_directory, parse_cms_txt
+from cms_ml.parsers.waveforms import load_waveform
+
+TXT = """[specchannel0]
+szsystemid=T001
+szlabel=Bearing
+ianalysisid={analysis}
+starttime=1577836800
+rpm=1500
+[specdata0]
+1.5
+2.5
+#--finish--
+"""
+
+ADU_TXT = """[prescanopc0]
+szlabel=Speed
+starttime=1577836800
+[prescanopcdata0]
+0 1.0
+1 2.0
+2 6.0
+#--finish--
+[aduchannel0]
+rate=25600
+[adudata0]
+0.5
+-0.25
+1.5
+#--finish--
+"""
+
+
+class TestParseCMSDirectory(TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.input_dir = os.path.join(self.tmp_dir.name, 'input')
+        self.out = os.path.join(self.tmp_dir.name, 'output')
+        os.makedirs(self.input_dir)
+        os.makedirs(self.out)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def _write(self, name, analysis):
+        with open(os.path.join(self.input_dir, name), 'w') as txt_file:
+            txt_file.write(TXT.format(analysis=analysis))
+
+    def test_parse_cms_directory_incremental(self):
+        self._write('a.txt', 0)
+        parse_cms_directory(self.input_dir, parse_cms_txt, out=self.out, incremental=True)
+
+        self._write('b.txt', 1)
+        returned = parse_cms_directory(self.input_dir, parse_cms_txt, out=self.out,
+                                       incremental=True)
+
+        assert returned['signal_id'].tolist() == [
+            'Bearing_0_specchannel0', 'Bearing_1_specchannel0']
+        written = pd.read_csv(os.path.join(self.out, 'parser_output.csv'))
+        assert written['signal_id'].tolist() == returned['signal_id'].tolist()
+
+    def test_parse_cms_directory_incremental_unchanged(self):
+        self._write('a.txt', 0)
+        parse_cms_directory(self.input_dir, parse_cms_txt, out=self.out, incremental=True)
+
+        returned = parse_cms_directory(self.input_dir, parse_cms_txt, out=self.out,
+                                       incremental=True)
+
+        assert returned['signal_id'].tolist() == ['Bearing_0_specchannel0']
+
+    def test_parse_cms_directory_compressed(self):
+        self._write('a.txt', 0)
+        with gzip.open(os.path.join(self.input_dir, 'b.txt.gz'), 'wt') as txt_file:
+            txt_file.write(TXT.format(analysis=1))
+
+        with zipfile.ZipFile(os.path.join(self.input_dir, 'c.zip'), 'w') as zip_file:
+            zip_file.writestr('c.txt', TXT.format(analysis=2))
+            zip_file.writestr('c.csv', 'not a txt file')
+
+        returned = parse_cms_directory(self.input_dir, parse_cms_txt)
+
+        assert returned['signal_id'].tolist() == [
+            'Bearing_0_specchannel0', 'Bearing_1_specchannel0', 'Bearing_2_specchannel0']
+
+    def test_parse_cms_directory_filters(self):
+        self._write('a.txt', 0)
+        self._write('b.txt', 1)
+
+        returned = parse_cms_directory(self.input_dir, parse_cms_txt,
+                                       signals=['Bearing_1_specchannel0'])
+
+        assert returned['signal_id'].tolist() == ['Bearing_1_specchannel0']
+        assert returned['values'].tolist() == [[1.5, 2.5]]
+
+    def test_parse_cms_directory_errors(self):
+        self._write('a.txt', 0)
+        with open(os.path.join(self.input_dir, 'b.txt'), 'w') as txt_file:
+            txt_file.write(TXT.format(analysis=1).replace('2.5', 'corrupt'))
+
+        with pytest.raises(ValueError):
+            parse_cms_directory(self.input_dir, parse_cms_txt)
+
+        returned = parse_cms_directory(self.input_dir, parse_cms_txt, out=self.out, errors='skip')
+
+        assert returned['signal_id'].tolist() == ['Bearing_0_specchannel0']
+        assert [failed['path'] for failed in returned.attrs['failed_files']] == [
+            os.path.join(self.input_dir, 'b.txt')]
+        with open(os.path.join(self.out, 'parser_output.failed.json')) as report_file:
+            assert json.load(report_file) == returned.attrs['failed_files']
+
+    def test_parse_cms_directory_n_jobs(self):
+        for analysis in range(4):
+            self._write('{}.txt'.format(analysis), analysis)
+
+        returned = parse_cms_directory(self.input_dir, parse_cms_txt, n_jobs=2)
+
+        expected = parse_cms_directory(self.input_dir, parse_cms_txt)
+        pd.testing.assert_frame_equal(expected, returned)
+
+        unordered = parse_cms_directory(self.input_dir, parse_cms_txt, n_jobs=2, ordered=False)
+        assert sorted(unordered['signal_id']) == expected['signal_id'].tolist()
+
+    def test_parse_cms_directory_batch_size(self):
+        for analysis in range(3):
+            self._write('{}.txt'.format(analysis), analysis)
+
+        batches = parse_cms_directory(self.input_dir, parse_cms_txt, batch_size=2)
+
+        assert [batch['signal_id'].tolist() for batch in batches] == [
+            ['Bearing_0_specchannel0', 'Bearing_1_specchannel0'], ['Bearing_2_specchannel0']]
+
+    def test_parse_cms_directory_batch_size_out(self):
+        for analysis in range(3):
+            self._write('{}.txt'.format(analysis), analysis)
+
+        returned = parse_cms_directory(self.input_dir, parse_cms_txt, out=self.out, batch_size=2)
+
+        assert returned is None
+        written = pd.read_csv(os.path.join(self.out, 'parser_output.csv'))
+        expected = parse_cms_directory(self.input_dir, parse_cms_txt)
+        assert written['signal_id'].tolist() == expected['signal_id'].tolist()
+
+
+class TestParseCMSTxt(TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp_dir.name, 'a.txt')
+        with open(self.path, 'w') as txt_file:
+            txt_file.write(TXT.format(analysis=0))
+            txt_file.write(TXT.format(analysis=1).replace('0]', '1]').replace(
+                '1577836800', '1577923200'))
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_parse_cms_txt(self):
+        returned = parse_cms_txt(self.path)
+
+        assert returned['signal_id'].tolist() == [
+            'Bearing_0_specchannel0', 'Bearing_1_specchannel1']
+
+    def test_parse_cms_txt_time_range(self):
+        start_time = datetime.fromtimestamp(1577923200)
+
+        returned = parse_cms_txt(self.path, start_time=start_time)
+
+        assert returned['signal_id'].tolist() == ['Bearing_1_specchannel1']
+        assert returned['timestamp'].tolist() == [start_time]
+
+    def test_parse_cms_txt_signals(self):
+        returned = parse_cms_txt(self.path, signals=['bearing_0'], match='contains')
+
+        assert returned['signal_id'].tolist() == ['Bearing_0_specchannel0']
+        assert returned['values'].tolist() == [[1.5, 2.5]]
+
+
+class TestParseADUCMSTxt(TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp_dir.name, 'a.txt')
+        with open(self.path, 'w') as txt_file:
+            txt_file.write(ADU_TXT)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_parse_adu_cms_txt(self):
+        returned = parse_adu_cms_txt(self.path)
+
+        row = returned.iloc[0]
+        assert (row['Speed_mean'], row['Speed_min'], row['Speed_max']) == (3.0, 1.0, 6.0)
+        assert row['Speed_std'] == pytest.approx(np.std([1.0, 2.0, 6.0]))
+        assert row['timestamp'] == datetime.fromtimestamp(1577836800)
+        assert row['values'].dtype == np.float64
+        np.testing.assert_array_equal(row['values'], [0.5, -0.25, 1.5])
+
+    def test_parse_adu_cms_txt_float32(self):
+        returned = parse_adu_cms_txt(self.path, dtype='float32')
+
+        assert returned.iloc[0]['values'].dtype == np.float32
+
+    def test_parse_adu_cms_txt_waveform_dir(self):
+        returned = parse_adu_cms_txt(self.path, dtype='float32', waveform_dir=self.tmp_dir.name)
+
+        assert 'values' not in returned
+        path = returned.iloc[0]['waveform_file']
+        assert path == os.path.join(self.tmp_dir.name, 'a_aduchannel0.f32')
+        np.testing.assert_array_equal(load_waveform(path), [0.5, -0.25, 1.5])
@@ -0,0 +1,38 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for cms_ml.parsers.cms_texts."""
+import os
+import tempfile
+from unittest import TestCase
+
+import numpy as np
+
+from cms_ml.parsers.cms_texts import parse_cms_txt
+
+TXT = """[specchannel0]
+szsystemid=T001
+szlabel=Bearing
+ianalysisid=0
+starttime=1577836800
+rpm=1500
+[specdata0]
+1.5
+2.5
+#--finish--
+"""
+
+
+class TestParseCMSTxt(TestCase):
+    def test_parse_cms_txt(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, 'a.txt')
+            with open(path, 'w') as txt_file:
+                txt_file.write(TXT)
+
+            returned = parse_cms_txt(path)
+
+        assert returned['signal_id'].tolist() == ['Bearing_0_specchannel0']
+        assert returned['turbine_id'].tolist() == ['T001']
+        assert returned['rpm'].tolist() == [1500.]
+        np.testing.assert_array_equal(returned['values'][0], [1.5, 2.5])
@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for cms_ml.parsers.compression."""
+import gzip
+import os
+import tempfile
+import zipfile
+from unittest import TestCase
+
+import pytest
+
+from cms_ml.parsers.compression import (
+    find_inputs, list_members, open_input, split_archive, strip_compression)
+
+
+class TestCompression(TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.path = self.tmp_dir.name
+        with open(os.path.join(self.path, 'a.txt'), 'w') as txt_file:
+            txt_file.write('plain')
+
+        with gzip.open(os.path.join(self.path, 'b.txt.gz'), 'wt') as gzip_file:
+            gzip_file.write('gzip')
+
+        with zipfile.ZipFile(os.path.join(self.path, 'c.zip'), 'w') as zip_file:
+            zip_file.writestr('folder/d.txt', 'zip d')
+            zip_file.writestr('c.txt', 'zip c')
+            zip_file.writestr('e.med', 'zip e')
+            zip_file.writestr('g.txt.gz', gzip.compress(b'zip gzip g'))
+
+        with zipfile.ZipFile(os.path.join(self.path, 'single.zip'), 'w') as zip_file:
+            zip_file.writestr('f.txt', 'zip f')
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_open_input(self):
+        for name, expected in [('a.txt', 'plain'), ('b.txt.gz', 'gzip'),
+                               ('c.zip/folder/d.txt', 'zip d'), ('single.zip', 'zip f'),
+                               ('c.zip/g.txt.gz', 'zip gzip g')]:
+            with open_input(os.path.join(self.path, name)) as input_file:
+                assert input_file.read() == expected
+
+    def test_open_input_binary(self):
+        with open_input(os.path.join(self.path, 'c.zip', 'c.txt'), 'rb') as input_file:
+            assert input_file.read() == b'zip c'
+
+    def test_open_input_many_members(self):
+        with pytest.raises(ValueError):
+            open_input(os.path.join(self.path, 'c.zip'))
+
+    def test_split_archive(self):
+        path = os.path.join(self.path, 'c.zip', 'folder', 'd.txt')
+
+        assert split_archive(path) == (os.path.join(self.path, 'c.zip'), 'folder/d.txt')
+        assert split_archive(os.path.join(self.path, 'a.txt'))[1] is None
+
+    def test_strip_compression(self):
+        assert strip_compression('b.txt.gz') == 'b.txt'
+        assert strip_compression('a.txt') == 'a.txt'
+
+    def test_list_members(self):
+        returned = list_members(os.path.join(self.path, 'c.zip'), '*.txt')
+
+        assert returned == [os.path.join(self.path, 'c.zip', name)
+                            for name in ('c.txt', 'folder/d.txt', 'g.txt.gz')]
+        assert list_members('a.txt', '*.med') == ['a.txt']
+
+    def test_find_inputs(self):
+        returned = find_inputs(self.path, '*.txt')
+
+        assert [os.path.basename(path) for path in returned] == [
+            'a.txt', 'b.txt.gz', 'c.zip', 'single.zip']
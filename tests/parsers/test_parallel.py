@@ -0,0 +1,133 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for cms_ml.parsers.parallel."""
+import json
+import os
+import tempfile
+import time
+from unittest import TestCase
+
+import pandas as pd
+import pytest
+
+from cms_ml.parsers.parallel import FileTimeoutError, iter_batches, parse_files, save_report
+
+
+def _parse(path, suffix=''):
+    with open(path) as input_file:
+        text = input_file.read()
+
+    if text == 'corrupt':
+        raise ValueError('Corrupt file')
+
+    if text == 'slow':
+        try:
+            time.sleep(5)
+        except Exception:
+            pass   # a parser that swallows the timeout
+
+        time.sleep(5)
+
+    return pd.DataFrame({'text': [text + suffix]})
+
+
+class TestParseFiles(TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.paths = list()
+        for name, text in [('a', 'a'), ('b', 'corrupt'), ('c', 'c')]:
+            path = os.path.join(self.tmp_dir.name, name)
+            with open(path, 'w') as input_file:
+                input_file.write(text)
+
+            self.paths.append(path)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_parse_files(self):
+        returned = list(parse_files(self.paths, _parse, suffix='!'))
+
+        assert [path for path, _, _ in returned] == self.paths
+        assert returned[0][1][0]['text'].tolist() == ['a!']
+        assert returned[1][1] is None
+        assert isinstance(returned[1][2], ValueError)
+
+    def test_parse_files_n_jobs(self):
+        returned = list(parse_files(self.paths, _parse, n_jobs=2))
+
+        expected = list(parse_files(self.paths, _parse))
+        assert [path for path, _, _ in returned] == self.paths
+        for (_, frames, error), (_, expected_frames, _) in zip(returned, expected):
+            if error is None:
+                pd.testing.assert_frame_equal(frames[0], expected_frames[0])
+
+    def test_parse_files_unordered(self):
+        returned = list(parse_files(self.paths, _parse, n_jobs=2, ordered=False))
+
+        assert sorted(path for path, _, _ in returned) == self.paths
+
+    def test_parse_files_timeout(self):
+        with open(self.paths[0], 'w') as input_file:
+            input_file.write('slow')
+
+        start = time.time()
+        returned = list(parse_files(self.paths[:1], _parse, timeout=0.2))
+
+        assert isinstance(returned[0][2], FileTimeoutError)
+        assert time.time() - start < 4
+
+
+class TestIterBatches(TestCase):
+    def setUp(self):
+        self.results = [
+            ('a', [pd.DataFrame({'text': ['a']})], None),
+            ('b', None, ValueError('Corrupt file')),
+            ('c', [pd.DataFrame({'text': ['c']}), pd.DataFrame({'text': ['d']})], None),
+        ]
+
+    def test_iter_batches(self):
+        (data, rows, failed), = iter_batches(self.results, errors='skip')
+
+        assert data['text'].tolist() == ['a', 'c', 'd']
+        assert rows == {'a': 1, 'c': 2}
+        assert failed == [{'path': 'b', 'error': "ValueError('Corrupt file')"}]
+        assert data.attrs['failed_files'] == failed
+
+    def test_iter_batches_batch_size(self):
+        returned = list(iter_batches(self.results, batch_size=2, errors='skip'))
+
+        assert [data['text'].tolist() for data, _, _ in returned] == [['a'], ['c', 'd']]
+        assert [rows for _, rows, _ in returned] == [{'a': 1}, {'c': 2}]
+
+    def test_iter_batches_raise(self):
+        with pytest.raises(ValueError):
+            list(iter_batches(self.results))
+
+    def test_iter_batches_empty(self):
+        (data, rows, failed), = iter_batches([], batch_size=2)
+
+        assert data.empty
+        assert rows == dict()
+
+
+class TestSaveReport(TestCase):
+    def test_save_report(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, 'report.json')
+            failed = [{'path': 'a.txt', 'error': "ValueError('Corrupt file')"}]
+
+            save_report(failed, path)
+            with open(path) as report_file:
+                assert json.load(report_file) == failed
+
+            save_report([], path)
+            assert not os.path.exists(path)
+
+
+def test_parse_files_timeout_unsupported(monkeypatch):
+    monkeypatch.delattr('signal.setitimer')
+
+    with pytest.raises(ValueError):
+        list(parse_files(['a'], _parse, timeout=1))
@@ -0,0 +1,173 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for cms_ml.parsers.streaming."""
+import io
+import json
+import os
+import tempfile
+from unittest import TestCase
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from cms_ml.parsers.streaming import (
+    ColumnBuffer, LazyReader, get_reference, iter_json_array, load_spectra)
+
+
+class TestIterJsonArray(TestCase):
+    entries = [
+        {'a': [1, 2, 3], 'b': 'text, with [brackets]'},
+        {'a': list(range(100)), 'b': None},
+        {},
+    ]
+
+    def test_iter_json_array(self):
+        json_file = io.StringIO(json.dumps(self.entries))
+
+        returned = list(iter_json_array(json_file))
+
+        assert returned == self.entries
+
+    def test_iter_json_array_small_blocks(self):
+        json_file = io.StringIO(json.dumps(self.entries, indent=2))
+
+        returned = list(iter_json_array(json_file, block_size=3))
+
+        assert returned == self.entries
+
+    def test_iter_json_array_numbers(self):
+        json_file = io.StringIO(' [12345, 6.75e2 ,-1]\n')
+
+        returned = list(iter_json_array(json_file, block_size=2))
+
+        assert returned == [12345, 675, -1]
+
+    def test_iter_json_array_empty(self):
+        assert list(iter_json_array(io.StringIO('[ ]'))) == []
+
+    def test_iter_json_array_not_array(self):
+        with pytest.raises(ValueError):
+            list(iter_json_array(io.StringIO('{"a": 1}')))
+
+    def test_iter_json_array_truncated(self):
+        with pytest.raises(ValueError):
+            list(iter_json_array(io.StringIO('[{"a": 1}, {"a": '), block_size=4))
+
+
+class TestColumnBuffer(TestCase):
+    def test_to_dataframe(self):
+        buffer = ColumnBuffer()
+        buffer.append({'signal_id': 'a', 'values': [1, 2]})
+        buffer.extend(pd.DataFrame([{'signal_id': 'b', 'rpm': 10., 'values': [3]}]))
+
+        returned = buffer.to_dataframe()
+
+        expected = pd.DataFrame({
+            'signal_id': ['a', 'b'],
+            'rpm': [np.nan, 10.],
+            'values': [[1., 2.], [3.]],
+        })
+        pd.testing.assert_frame_equal(expected, returned)
+
+    def test_to_dataframe_no_spectra(self):
+        buffer = ColumnBuffer()
+        buffer.extend([{'signal_id': 'a'}, {'signal_id': 'b', 'rpm': 10.}])
+
+        returned = buffer.to_dataframe()
+
+        expected = pd.DataFrame({'signal_id': ['a', 'b'], 'rpm': [np.nan, 10.]})
+        pd.testing.assert_frame_equal(expected, returned)
+
+    def test_to_batch(self):
+        buffer = ColumnBuffer()
+        buffer.extend([{'signal_id': 'a', 'values': [1, 2]}, {'signal_id': 'b', 'values': [3]}])
+
+        returned = buffer.to_batch()
+
+        np.testing.assert_array_equal(returned.values, [1., 2., 3.])
+        np.testing.assert_array_equal(returned.offsets, [0, 2, 3])
+        assert returned.metadata['signal_id'].tolist() == ['a', 'b']
+
+    def test_extend_buffer(self):
+        buffer = ColumnBuffer()
+        buffer.append({'signal_id': 'a', 'values': [1, 2]})
+        other = ColumnBuffer()
+        other.extend([{'rpm': 10., 'values': [3]}, {'rpm': 20., 'values': [4, 5]}])
+
+        buffer.extend(other)
+
+        returned = buffer.to_batch()
+        np.testing.assert_array_equal(returned.offsets, [0, 2, 3, 5])
+        assert returned.metadata['signal_id'].tolist()[0] == 'a'
+        assert returned.metadata['rpm'].tolist()[1:] == [10., 20.]
+        assert len(returned.metadata.dropna()) == 0
+
+
+class TestLazyReader(TestCase):
+    entries = [
+        {'name': 'caf\u00e9', 'yValues': [1, 2.5, 3e-3]},
+        {'nested': {'yValues': list(range(50))}, 'yValues': []},
+        {'yValues': None},
+    ]
+
+    def test_read(self):
+        raw = json.dumps(self.entries, indent=2).encode()
+        reader = LazyReader(io.BytesIO(raw))
+
+        returned = list(iter_json_array(reader))
+
+        assert returned == [
+            {'name': 'caf\u00e9', 'yValues': 0},
+            {'nested': {'yValues': 1}, 'yValues': 2},
+            {'yValues': None},
+        ]
+        ranges = [json.loads(raw[start:end]) for start, end in reader.ranges]
+        assert ranges == [[1, 2.5, 3e-3], list(range(50)), []]
+
+    def test_read_small_blocks(self):
+        raw = json.dumps(self.entries).encode()
+        expected = LazyReader(io.BytesIO(raw))
+        expected_entries = list(iter_json_array(expected))
+
+        for block_size in (1, 3, 7):
+            reader = LazyReader(io.BytesIO(raw), block_size=block_size)
+            assert list(iter_json_array(reader)) == expected_entries
+            assert reader.ranges == expected.ranges
+
+    def test_read_keep(self):
+        raw = json.dumps(self.entries).encode()
+        reader = LazyReader(io.BytesIO(raw), block_size=3, keep=True)
+
+        list(iter_json_array(reader))
+
+        assert [json.loads(reader.arrays[key]) for key in range(3)] == [
+            [1, 2.5, 3e-3], list(range(50)), []]
+        reader.release(1)
+        assert list(reader.arrays) == [2]
+
+
+class TestLoadSpectra(TestCase):
+    def test_load_spectra(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, 'a.json')
+            with open(path, 'w') as json_file:
+                json.dump([{'yValues': [1, 2]}, {'yValues': [3]}, {'yValues': None}], json_file)
+
+            with open(path, 'rb') as json_file:
+                reader = LazyReader(json_file)
+                rows = [
+                    get_reference({'signal_id': str(position), 'values': entry['yValues']},
+                                  path, position, reader.ranges)
+                    for position, entry in enumerate(iter_json_array(reader))
+                ]
+
+            data = pd.DataFrame(rows[::-1])
+
+            returned = load_spectra(data)
+
+        assert returned.metadata['signal_id'].tolist() == ['2', '1', '0']
+        assert list(returned.metadata.columns) == ['signal_id']
+        np.testing.assert_array_equal(returned.values, [3., 1., 2.])
+        np.testing.assert_array_equal(returned.offsets, [0, 0, 1, 3])
@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for cms_ml.parsers.txt_blocks."""
+from unittest import TestCase
+
+import numpy as np
+import pytest
+
+from cms_ml.index import RowFilter
+from cms_ml.parsers.txt_blocks import (
+    decode_column, decode_values, iter_spec_channels, read_spec_blocks)
+
+TXT = """[general]
+version=1
+[specchannel0]
+szlabel=Bearing
+[specdata0]
+1.5
+2.5
+#--finish--
+[specchannel1]
+szlabel=Gear
+[specdata1]
+-3e-2
+#--finish--
+[footer]
+end=1
+"""
+
+
+class TestDecodeValues(TestCase):
+    def test_decode_values(self):
+        np.testing.assert_array_equal(decode_values('1.5\n-2\n3e-1\n'), [1.5, -2., 0.3])
+
+    def test_decode_values_no_trailing_newline(self):
+        np.testing.assert_array_equal(decode_values('1.5\n2'), [1.5, 2.])
+
+    def test_decode_values_empty(self):
+        assert len(decode_values('')) == 0
+
+    def test_decode_values_invalid(self):
+        with pytest.raises(ValueError):
+            decode_values('1.5\nnot a number\n')
+
+        with pytest.raises(ValueError):
+            decode_values('1.5\n\n2.5\n')
+
+        with pytest.raises(ValueError):
+            decode_values('1.5\n1 2\n')
+
+
+class TestDecodeColumn(TestCase):
+    def test_decode_column(self):
+        lines = ['0 1.5\n', '1 -2\n', '2 3e-1\n']
+
+        np.testing.assert_array_equal(decode_column(lines), [1.5, -2., 0.3])
+        np.testing.assert_array_equal(decode_column(lines, 0), [0., 1., 2.])
+
+    def test_decode_column_uneven(self):
+        np.testing.assert_array_equal(decode_column(['0 1.5 x\n', '1 2.5\n']), [1.5, 2.5])
+
+    def test_decode_column_empty(self):
+        assert len(decode_column([])) == 0
+
+    def test_decode_column_invalid(self):
+        with pytest.raises(ValueError):
+            decode_column(['0 1.5\n', '1 not_a_number\n'])
+
+        with pytest.raises(ValueError):
+            decode_column(['0\n', '1\n'])
+
+
+class TestReadSpecBlocks(TestCase):
+    def test_read_spec_blocks(self):
+        config_parser, blocks = read_spec_blocks(TXT)
+
+        assert config_parser.sections() == ['general', 'specchannel0', 'specchannel1', 'footer']
+        assert config_parser['specchannel1']['szlabel'] == 'Gear'
+        assert blocks == {'specchannel0': '1.5\n2.5\n', 'specchannel1': '-3e-2\n'}
+
+    def test_read_spec_blocks_no_data(self):
+        config_parser, blocks = read_spec_blocks('[general]\nversion=1\n')
+
+        assert config_parser['general']['version'] == '1'
+        assert blocks == dict()
+
+
+class TestIterSpecChannels(TestCase):
+    def test_iter_spec_channels(self):
+        returned = list(iter_spec_channels(TXT))
+
+        assert [channel for channel, _, _ in returned] == ['specchannel0', 'specchannel1']
+        assert returned[1][1]['szlabel'] == 'Gear'
+        np.testing.assert_array_equal(returned[0][2], [1.5, 2.5])
+
+    def test_iter_spec_channels_filter(self):
+        text = TXT.replace('szlabel=Bearing', 'szlabel=Bearing\nianalysisid=0\nstarttime=0')
+
+        returned = list(iter_spec_channels(text, RowFilter(signals=['Gear'], match='contains')))
+
+        # the channels without an analysis id or start time are kept
+        assert [channel for channel, _, _ in returned] == ['specchannel1']
@@ -0,0 +1,68 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for cms_ml.parsers.waveforms."""
+import os
+import tempfile
+from unittest import TestCase
+
+import numpy as np
+import pytest
+
+from cms_ml.parsers.waveforms import RunningStats, WaveformWriter, load_waveform
+
+
+class TestRunningStats(TestCase):
+    def test_running_stats(self):
+        values = np.random.RandomState(0).normal(5, 2, 1000)
+        stats = RunningStats()
+
+        for chunk in np.array_split(values, 7):
+            stats.update(chunk)
+
+        assert stats.count == 1000
+        assert stats.mean == pytest.approx(values.mean())
+        assert stats.std == pytest.approx(values.std())
+        assert (stats.min, stats.max) == (values.min(), values.max())
+
+    def test_running_stats_empty(self):
+        stats = RunningStats()
+        stats.update([])
+
+        assert np.isnan(stats.mean)
+        assert np.isnan(stats.std)
+
+
+class TestWaveformWriter(TestCase):
+    def test_waveform_writer(self):
+        writer = WaveformWriter('float32')
+        writer.write([1.5, 2.5])
+        writer.write([3.5])
+
+        values = writer.close()
+
+        assert values.dtype == np.float32
+        np.testing.assert_array_equal(values, [1.5, 2.5, 3.5])
+
+    def test_waveform_writer_path(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            writer = WaveformWriter('float64', os.path.join(tmp_dir, 'waveform'))
+            writer.write([1.5, 2.5])
+            writer.write([3.5])
+
+            path = writer.close()
+
+            assert path == os.path.join(tmp_dir, 'waveform.f64')
+            loaded = load_waveform(path)
+            np.testing.assert_array_equal(loaded, [1.5, 2.5, 3.5])
+            del loaded
+
+    def test_waveform_writer_empty(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = WaveformWriter('float32', os.path.join(tmp_dir, 'waveform')).close()
+
+            assert len(load_waveform(path)) == 0
+
+    def test_waveform_writer_invalid_dtype(self):
+        with pytest.raises(ValueError):
+            WaveformWriter('int16')
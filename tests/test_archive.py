@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for cms_ml.archive."""
+import os
+import tempfile
+from unittest import TestCase
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from cms_ml.archive import is_archive, open_archive
+from cms_ml.spectra import SpectrumBatch
+
+
+class TestSpectrumArchive(TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp_dir.name, 'archive')
+        self.metadata = pd.DataFrame({
+            'turbine_id': ['T001', 'T002', 'T001'],
+            'signal_id': ['Signal_1', 'Signal_1', 'Signal_2'],
+            'timestamp': pd.to_datetime(['2020-01-01', '2020-01-02', '2020-01-03']),
+            'frequency_start': [0., 0., np.nan],
+            'frequency_step': [.5, .5, np.nan],
+        })
+        self.batch = SpectrumBatch.from_values([[1, 2], [3], [4, 5, 6]], self.metadata)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_open_archive_missing(self):
+        with pytest.raises(FileNotFoundError):
+            open_archive(self.path)
+
+    def test_open_archive_create(self):
+        archive = open_archive(self.path, mode='a')
+
+        assert is_archive(self.path)
+        assert len(archive) == 0
+        assert len(archive.select()) == 0
+
+    def test_append_select(self):
+        open_archive(self.path, mode='a').append(self.batch)
+
+        archive = open_archive(self.path)
+        returned = archive.select()
+
+        np.testing.assert_array_equal(returned.values, self.batch.values)
+        np.testing.assert_array_equal(returned.offsets, self.batch.offsets)
+        pd.testing.assert_frame_equal(returned.metadata, self.metadata)
+
+    def test_select(self):
+        archive = open_archive(self.path, mode='a')
+        archive.append(self.batch)
+        archive.append(pd.DataFrame({
+            'turbine_id': ['T001'],
+            'signal_id': ['Signal_1'],
+            'timestamp': pd.to_datetime(['2020-01-04']),
+            'values': [[7, 8]],
+        }))
+
+        returned = archive.select(turbines=['T001'], signals=['Signal_1'])
+
+        np.testing.assert_array_equal(returned.values, [1, 2, 7, 8])
+        np.testing.assert_array_equal(returned.offsets, [0, 2, 4])
+        assert returned.metadata['frequency_step'].isnull().tolist() == [False, True]
+
+    def test_select_contiguous_is_view(self):
+        open_archive(self.path, mode='a').append(self.batch)
+
+        returned = open_archive(self.path).select(start_time='2020-01-02')
+
+        assert isinstance(returned.values.base, np.memmap)
+        np.testing.assert_array_equal(returned.values, [3, 4, 5, 6])
+
+    def test_append_read_only(self):
+        open_archive(self.path, mode='a')
+
+        with pytest.raises(ValueError):
+            open_archive(self.path).append(self.batch)
+
+    def test_append_interrupted(self):
+        archive = open_archive(self.path, mode='a')
+        archive.append(self.batch)
+        with open(os.path.join(self.path, 'values.f64'), 'ab') as values_file:
+            values_file.write(np.zeros(10).tobytes())
+
+        archive.append(self.batch)
+
+        np.testing.assert_array_equal(open_archive(self.path).select().values,
+                                      np.tile(self.batch.values, 2))
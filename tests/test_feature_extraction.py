@@ -2,16 +2,25 @@
 # -*- coding: utf-8 -*-
 
 """Tests for cms_ml package."""
+import json
+import os
+import tempfile
 from unittest import TestCase
-from unittest.mock import call, patch
+from unittest.mock import patch
 
 import numpy as np
 import pandas as pd
 import pytest
 from pandas.util.testing import assert_frame_equal
 
+from cms_ml.archive import open_archive
 from cms_ml.demo import get_demo_data
-from cms_ml.feature_extraction import aggregate_values, extract_cms_features
+from cms_ml.feature_extraction import (
+    aggregate_features, aggregate_features_wide, aggregate_values, extract_cms_features)
+from cms_ml.parsers.streaming import LazyReader, get_reference, iter_json_array
+from cms_ml.spectra import SpectrumBatch
+from cms_ml.storage import read_partitioned, write_partitioned
+from cms_ml.utils import load_fft_csv
 
 
 class TestAggregateValues(TestCase):
@@ -55,6 +64,24 @@ class TestAggregateValues(TestCase):
         actual = aggregate_values(self.data, "mean", self.mean)
         assert_frame_equal(expected, actual)
 
+    def test_aggregate_values_batch(self):
+        batch = SpectrumBatch.from_dataframe(self.data, column='value')
+        expected = pd.DataFrame(
+            {
+                'timestamp': ['2019-10-19T13:27:18+00:00', '2019-11-19T13:27:18+00:00',
+                              '2019-12-19T13:27:18+00:00'],
+                'value': [2.160247, 5.066228, 8.041559],
+                'signal_id': ['Signal_1_rms', 'Signal_1_rms', 'Signal_2_rms'],
+            })
+        actual = aggregate_values(batch, "rms", "rms")
+        assert_frame_equal(expected, actual)
+
+    def test_aggregate_values_batch_callable(self):
+        batch = SpectrumBatch.from_dataframe(self.data, column='value')
+        expected = aggregate_values(self.data, "mean", self.mean)
+        actual = aggregate_values(batch, "mean", self.mean)
+        assert_frame_equal(expected, actual)
+
     def test_aggregate_values_error(self):
         with pytest.raises(KeyError):
             aggregate_values(pd.DataFrame({'name': [],
@@ -62,6 +89,125 @@ class TestAggregateValues(TestCase):
                                            'yValues': []}), "mean", self.mean)
 
 
+class TestAggregateFeatures(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.data = pd.DataFrame(
+            {
+                'turbine_id': ['T001', 'T001', 'T001'],
+                'signal_id': ['Signal_1', 'Signal_1', None],
+                'timestamp': pd.to_datetime(['2019-10-19', '2019-11-19', '2019-12-19']),
+                'values': [[1, 2, 3], [4, 5], [7, 8, 9]],
+                'context': ['a', 'b', 'c'],
+            })
+
+    @classmethod
+    def rms(self, data):
+        return np.sqrt((np.array(data) ** 2).mean())
+
+    def test_aggregate_features(self):
+        aggregations = {
+            'mean': np.mean,
+            'rms': self.rms,
+            'max': 'max',
+        }
+        expected = pd.concat([
+            aggregate_values(self.data, name, aggregation)
+            for name, aggregation in aggregations.items()
+        ], ignore_index=True)
+
+        actual = aggregate_features(self.data, aggregations)
+
+        assert_frame_equal(expected, actual)
+        assert actual['signal_id'].tolist()[-3:] == ['Signal_1_max', 'Signal_1_max', 'max']
+
+    def test_aggregate_features_batch(self):
+        batch = SpectrumBatch.from_dataframe(self.data)
+
+        actual = aggregate_features(batch, {'sum': np.sum}, context_fields=False)
+
+        expected = pd.DataFrame({
+            'turbine_id': ['T001', 'T001', 'T001'],
+            'signal_id': ['Signal_1_sum', 'Signal_1_sum', 'sum'],
+            'timestamp': pd.to_datetime(['2019-10-19', '2019-11-19', '2019-12-19']),
+            'value': [6., 9., 24.],
+        })
+        assert_frame_equal(expected, actual)
+
+    def test_aggregate_features_lazy(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, 'a.json')
+            with open(path, 'w') as json_file:
+                json.dump([{'yValues': values} for values in self.data['values']], json_file)
+
+            with open(path, 'rb') as json_file:
+                reader = LazyReader(json_file)
+                references = [
+                    get_reference({'values': entry['yValues']}, path, position, reader.ranges)
+                    for position, entry in enumerate(iter_json_array(reader))
+                ]
+
+            data = pd.concat([self.data.drop(columns='values'), pd.DataFrame(references)],
+                             axis=1)
+            actual = aggregate_features(data, {'sum': np.sum}, context_fields=False)
+
+        expected = aggregate_features(self.data, {'sum': np.sum}, context_fields=False)
+        assert_frame_equal(expected, actual)
+
+    def test_aggregate_features_raw(self):
+        actual = aggregate_features(self.data, {'raw': lambda values: values},
+                                    context_fields=['context'])
+
+        assert actual['value'].tolist() == [[1., 2., 3.], [4., 5.], [7., 8., 9.]]
+        assert actual.columns.tolist() == [
+            'turbine_id', 'signal_id', 'timestamp', 'value', 'context']
+
+    def test_aggregate_features_n_jobs(self):
+        data = pd.DataFrame({
+            'turbine_id': np.repeat(['T001', 'T002', 'T003'], 20),
+            'signal_id': np.tile(['Signal_1', 'Signal_2'], 30),
+            'timestamp': pd.date_range('2020-01-01', periods=60, freq='h'),
+            'values': [np.random.random(64 + 32 * (i % 3)).tolist() for i in range(60)],
+        })
+        aggregations = {
+            'mean': np.mean,
+            'std': 'std',
+            'ptp': np.ptp,
+        }
+
+        expected = aggregate_features(data, aggregations)
+        actual = aggregate_features(data, aggregations, n_jobs=2)
+
+        assert_frame_equal(expected, actual, check_exact=True)
+
+    def test_aggregate_features_wide(self):
+        data = pd.DataFrame({
+            'turbine_id': ['T002', 'T001', 'T001', 'T001'],
+            'signal_id': ['Signal_1', 'Signal_2', 'Signal_1', 'Signal_1'],
+            'timestamp': pd.to_datetime(['2020-01-01', '2020-01-01', '2020-01-01',
+                                         '2020-01-02']),
+            'values': [[1, 2], [3, 4, 5], [6, 7], [8]],
+        })
+        aggregations = {'max': 'max', 'mean': np.mean}
+
+        actual = aggregate_features_wide(data, aggregations)
+
+        long = aggregate_features(data, aggregations)
+        expected = long.pivot_table(index=['turbine_id', 'timestamp'], columns='signal_id',
+                                    values='value').reset_index()
+        expected.columns.name = None
+        expected = expected[actual.columns]
+        assert actual.columns.tolist() == [
+            'turbine_id', 'timestamp', 'Signal_1_max', 'Signal_1_mean', 'Signal_2_max',
+            'Signal_2_mean']
+        assert_frame_equal(expected, actual)
+        assert np.isnan(actual.loc[1, 'Signal_2_max'])
+
+    def test_aggregate_features_wide_raw(self):
+        with pytest.raises(ValueError):
+            aggregate_features_wide(self.data, {'raw': lambda values: values})
+
+
 class TestFeatureExtractCMSFeatures(TestCase):
 
     @classmethod
@@ -69,25 +215,18 @@ class TestFeatureExtractCMSFeatures(TestCase):
         cls.data = get_demo_data()
         cls.data = cls.data.head(5)
 
-    @patch('cms_ml.feature_extraction.aggregate_values')
+    @patch('cms_ml.feature_extraction.aggregate_features')
     @patch('cms_ml.feature_extraction.filter_values')
     def test_extract_cms_features(self, filter_mock, agg_mock):
 
         # setup
-        agg_mock.side_effect = [
-            pd.DataFrame({
-                'turbine_id': ['T001', 'T001'],
-                'signal_id': ['signal_1_mean', 'signal_2_mean'],
-                'timestamp': pd.to_datetime(['2000-01-10', '2000-01-10'], utc=True),
-                'values': [1, 2]
-            }),
-            pd.DataFrame({
-                'turbine_id': ['T001', 'T001'],
-                'signal_id': ['signal_1_std', 'signal_2_std'],
-                'timestamp': pd.to_datetime(['2000-01-10', '2000-01-10'], utc=True),
-                'values': [3, 4]
-            }),
-        ]
+        agg_mock.return_value = pd.DataFrame({
+            'turbine_id': ['T001', 'T001', 'T001', 'T001'],
+            'signal_id': ['signal_1_mean', 'signal_2_mean', 'signal_1_std', 'signal_2_std'],
+            'timestamp': pd.to_datetime(['2000-01-10', '2000-01-10', '2000-01-10', '2000-01-10'],
+                                        utc=True),
+            'values': [1, 2, 3, 4]
+        })
 
         aggregations = {
             'mean': np.mean,
@@ -117,34 +256,25 @@ class TestFeatureExtractCMSFeatures(TestCase):
             start_time='2000-01-01',
             end_time='2000-02-01',
             signals=['signal_1', 'signal_2'],
-            turbines=None
+            turbines=None,
+            match='exact',
         )
 
-        exp_agg_calls = [
-            call(filter_mock.return_value, 'mean', np.mean, context_fields=True),
-            call(filter_mock.return_value, 'std', np.std, context_fields=True),
-        ]
-        assert agg_mock.call_args_list == exp_agg_calls
+        agg_mock.assert_called_once_with(
+            filter_mock.return_value, aggregations, context_fields=True, n_jobs=None)
 
     @patch('pandas.DataFrame.to_csv')
-    @patch('cms_ml.feature_extraction.aggregate_values')
+    @patch('cms_ml.feature_extraction.aggregate_features')
     @patch('cms_ml.feature_extraction.filter_values')
     def test_extract_cms_context_output_path(self, filter_mock, agg_mock, to_csv_mock):
         # setup
-        agg_mock.side_effect = [
-            pd.DataFrame({
-                'turbine_id': ['T001', 'T001'],
-                'signal_id': ['signal_1_mean', 'signal_2_mean'],
-                'timestamp': pd.to_datetime(['2000-01-10', '2000-01-10'], utc=True),
-                'values': [1, 2]
-            }),
-            pd.DataFrame({
-                'turbine_id': ['T001', 'T001'],
-                'signal_id': ['signal_1_std', 'signal_2_std'],
-                'timestamp': pd.to_datetime(['2000-01-10', '2000-01-10'], utc=True),
-                'values': [3, 4]
-            }),
-        ]
+        agg_mock.return_value = pd.DataFrame({
+            'turbine_id': ['T001', 'T001', 'T001', 'T001'],
+            'signal_id': ['signal_1_mean', 'signal_2_mean', 'signal_1_std', 'signal_2_std'],
+            'timestamp': pd.to_datetime(['2000-01-10', '2000-01-10', '2000-01-10', '2000-01-10'],
+                                        utc=True),
+            'values': [1, 2, 3, 4]
+        })
 
         aggregations = {
             'mean': np.mean,
@@ -167,15 +297,132 @@ class TestFeatureExtractCMSFeatures(TestCase):
             start_time='2000-01-01',
             end_time='2000-02-01',
             signals=['signal_1', 'signal_2'],
-            turbines=None
+            turbines=None,
+            match='exact',
         )
 
-        exp_agg_calls = [
-            call(filter_mock.return_value, 'mean', np.mean, context_fields=True),
-            call(filter_mock.return_value, 'std', np.std, context_fields=True),
-        ]
-        assert agg_mock.call_args_list == exp_agg_calls
+        agg_mock.assert_called_once_with(
+            filter_mock.return_value, aggregations, context_fields=True, n_jobs=None)
 
         assert result is None
 
         to_csv_mock.assert_called_once_with('path/to/output.csv', index=False)
+
+
+class TestExtractCMSFeaturesFile(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp_dir = tempfile.TemporaryDirectory()
+        cls.path = os.path.join(cls.tmp_dir.name, 'fft.csv')
+        pd.DataFrame({
+            'turbine_id': ['T001'] * 5,
+            'signal_id': ['Signal_1', 'Signal_2'] * 2 + ['Signal_1'],
+            'timestamp': pd.date_range('2020-01-01', periods=5, freq='D'),
+            'values': ['[1, 2]', '[3, 4, 5]', '[6, 7]', '[8, 9]', '[10]'],
+        }).to_csv(cls.path, index=False)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.tmp_dir.cleanup()
+
+    def test_extract_cms_features_chunksize(self):
+        aggregations = {'mean': np.mean, 'max': 'max'}
+        expected = extract_cms_features(self.path, aggregations, start_time='2020-01-02')
+
+        returned = extract_cms_features(self.path, aggregations, start_time='2020-01-02',
+                                        chunksize=2)
+
+        sort = ['signal_id', 'timestamp']
+        assert_frame_equal(expected.sort_values(sort).reset_index(drop=True),
+                           returned.sort_values(sort).reset_index(drop=True))
+
+    def test_extract_cms_features_chunksize_output_path(self):
+        output_path = os.path.join(self.tmp_dir.name, 'output', 'features.csv')
+        aggregations = {'mean': np.mean}
+
+        extract_cms_features(self.path, aggregations, output_path=output_path, chunksize=2)
+
+        written = pd.read_csv(output_path, parse_dates=['timestamp'])
+        expected = extract_cms_features(self.path, aggregations, chunksize=2)
+        assert_frame_equal(expected, written)
+
+    def test_extract_cms_features_incremental(self):
+        output_path = os.path.join(self.tmp_dir.name, 'incremental', 'features.csv')
+        data = load_fft_csv(self.path)
+
+        extract_cms_features(data.head(3), {'mean': np.mean}, output_path=output_path,
+                             incremental=True)
+        extract_cms_features(data, {'mean': np.mean, 'max': 'max'}, output_path=output_path,
+                             incremental=True)
+
+        written = pd.read_csv(output_path, parse_dates=['timestamp'])
+        expected = extract_cms_features(data, {'mean': np.mean, 'max': 'max'})
+        sort = ['signal_id', 'timestamp']
+        assert_frame_equal(expected.sort_values(sort).reset_index(drop=True),
+                           written.sort_values(sort).reset_index(drop=True))
+
+    def test_extract_cms_features_incremental_rerun(self):
+        output_path = os.path.join(self.tmp_dir.name, 'rerun', 'features.csv')
+        aggregations = {'mean': np.mean}
+
+        extract_cms_features(self.path, aggregations, output_path=output_path, incremental=True)
+        expected = pd.read_csv(output_path)
+
+        # nothing is new in the second run, with and without chunks
+        extract_cms_features(self.path, aggregations, output_path=output_path, incremental=True)
+        extract_cms_features(self.path, aggregations, output_path=output_path, incremental=True,
+                             chunksize=2)
+
+        assert_frame_equal(expected, pd.read_csv(output_path))
+
+    def test_extract_cms_features_parquet_output(self):
+        pytest.importorskip('pyarrow')
+        output_path = os.path.join(self.tmp_dir.name, 'features')
+        aggregations = {'mean': np.mean, 'max': 'max'}
+
+        extract_cms_features(self.path, aggregations, output_path=output_path,
+                             output_format='parquet', chunksize=2)
+
+        written = read_partitioned(output_path)
+        expected = extract_cms_features(self.path, aggregations)
+        sort = ['signal_id', 'timestamp']
+        assert_frame_equal(expected.sort_values(sort).reset_index(drop=True),
+                           written.sort_values(sort).reset_index(drop=True))
+
+    def test_extract_cms_features_parquet_input(self):
+        pytest.importorskip('pyarrow')
+        dataset_path = os.path.join(self.tmp_dir.name, 'spectra')
+        write_partitioned(load_fft_csv(self.path, batch=True), dataset_path)
+
+        returned = extract_cms_features(dataset_path, {'mean': 'mean'},
+                                        start_time='2020-01-02')
+
+        expected = extract_cms_features(self.path, {'mean': 'mean'}, start_time='2020-01-02')
+        sort = ['signal_id', 'timestamp']
+        assert_frame_equal(expected.sort_values(sort).reset_index(drop=True),
+                           returned.sort_values(sort).reset_index(drop=True))
+
+    def test_extract_cms_features_archive(self):
+        archive_path = os.path.join(self.tmp_dir.name, 'archive')
+        open_archive(archive_path, mode='a').append(load_fft_csv(self.path, batch=True))
+
+        returned = extract_cms_features(archive_path, {'mean': 'mean'}, signals=['Signal_1'],
+                                        start_time='2020-01-02')
+
+        expected = extract_cms_features(self.path, {'mean': 'mean'}, signals=['Signal_1'],
+                                        start_time='2020-01-02')
+        assert_frame_equal(expected, returned[expected.columns])
+
+    def test_extract_cms_features_wide(self):
+        returned = extract_cms_features(self.path, {'mean': 'mean'}, wide=True)
+
+        assert returned.columns.tolist() == [
+            'turbine_id', 'timestamp', 'Signal_1_mean', 'Signal_2_mean']
+        assert len(returned) == 5
+
+        with pytest.raises(ValueError):
+            extract_cms_features(self.path, {'mean': 'mean'}, wide=True, chunksize=2)
+
+    def test_extract_cms_features_incremental_no_output_path(self):
+        with pytest.raises(ValueError):
+            extract_cms_features(self.path, {'mean': np.mean}, incremental=True)
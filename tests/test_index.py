@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for cms_ml.index."""
+from unittest import TestCase
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from cms_ml.index import MetadataIndex, RowFilter
+
+
+class TestMetadataIndex(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.metadata = pd.DataFrame({
+            'turbine_id': ['T1', 'T10', 'T1', None, 'T1', 'T10'],
+            'signal_id': ['Signal_1', 'Signal_1', 'Signal_11', 'Signal_1', 'Signal_1',
+                          'Signal_1'],
+            'timestamp': pd.to_datetime(['2020-01-04', '2020-01-01', '2020-01-02',
+                                         '2020-01-03', '2020-01-01', None]),
+        })
+        cls.index = MetadataIndex(cls.metadata)
+
+    def test_select_all(self):
+        np.testing.assert_array_equal(self.index.select(), np.arange(6))
+
+    def test_select_exact(self):
+        returned = self.index.select(signals=['Signal_1'], turbines=['T1'])
+
+        np.testing.assert_array_equal(returned, [0, 4])
+
+    def test_select_contains(self):
+        returned = self.index.select(signals=['signal_1'], turbines=['T1'], match='contains')
+
+        np.testing.assert_array_equal(returned, [0, 1, 2, 4, 5])
+
+    def test_select_time_range(self):
+        returned = self.index.select(start_time='2020-01-02', end_time='2020-01-04')
+
+        np.testing.assert_array_equal(returned, [2, 3])
+
+    def test_select_end_time_skips_missing(self):
+        returned = self.index.select(end_time='2020-01-02', turbines=['T10'])
+
+        np.testing.assert_array_equal(returned, [1])
+
+    def test_select_unknown(self):
+        assert len(self.index.select(signals=['Signal_2'])) == 0
+
+    def test_select_tz_aware(self):
+        returned = self.index.select(start_time='2020-01-02T01:00:00+02:00')
+
+        np.testing.assert_array_equal(returned, [0, 2, 3])
+
+    def test_select_invalid_match(self):
+        with pytest.raises(ValueError):
+            self.index.select(signals=['Signal_1'], match='prefix')
+
+    def test_mask(self):
+        returned = self.index.mask(turbines=['T10'])
+
+        np.testing.assert_array_equal(returned, [False, True, False, False, False, True])
+
+
+class TestRowFilter(TestCase):
+    def test_empty(self):
+        row_filter = RowFilter()
+
+        assert not row_filter
+        assert row_filter('Signal_1', None)
+
+    def test_time(self):
+        row_filter = RowFilter('2020-01-02', '2020-01-03')
+
+        assert row_filter('Signal_1', '2020-01-02T00:00:00+00:00')
+        assert row_filter('Signal_1', pd.Timestamp('2020-01-02 23:00'))
+        assert not row_filter('Signal_1', '2020-01-03')
+        assert not row_filter('Signal_1', '2020-01-02T00:00:00+01:00')
+        assert not row_filter('Signal_1', None)
+
+    def test_signals(self):
+        exact = RowFilter(signals=['Signal_1'])
+        contains = RowFilter(signals=['signal_1'], match='contains')
+
+        assert exact('Signal_1', None) and not exact('Signal_11', None)
+        assert contains('Signal_11', None) and not contains(None, None)
+
+    def test_select_equivalence(self):
+        index = MetadataIndex(TestMetadataIndex.metadata)
+        row_filter = RowFilter('2020-01-02', '2020-01-04', ['Signal_1'])
+
+        expected = index.select('2020-01-02', '2020-01-04', ['Signal_1'])
+        returned = [
+            position for position, row in TestMetadataIndex.metadata.iterrows()
+            if row_filter(row['signal_id'], row['timestamp'])
+        ]
+        np.testing.assert_array_equal(expected, returned)
+
+    def test_unknown_match(self):
+        with pytest.raises(ValueError):
+            RowFilter(match='regex')
@@ -0,0 +1,141 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for cms_ml.ingestion."""
+import os
+import tempfile
+from unittest import TestCase
+
+import pandas as pd
+
+from cms_ml.ingestion import (
+    append_output, find_changed, get_manifest_path, load_manifest, merge_output, save_manifest,
+    update_manifest)
+
+
+class TestManifest(TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.root = self.tmp_dir.name
+        self.paths = [os.path.join(self.root, name) for name in ('a.json', 'b.json')]
+        for path in self.paths:
+            with open(path, 'w') as raw_file:
+                raw_file.write('[1, 2, 3]')
+
+        self.manifest_path = get_manifest_path(os.path.join(self.root, 'output.csv'))
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def _ingest(self, manifest):
+        changed = find_changed(self.paths, manifest, self.root)
+        for path, signature in changed.items():
+            update_manifest(manifest, path, self.root, signature, 3)
+
+        return list(changed)
+
+    def test_save_load(self):
+        manifest = dict()
+        self._ingest(manifest)
+
+        save_manifest(manifest, self.manifest_path)
+
+        assert load_manifest(self.manifest_path) == manifest
+        assert sorted(manifest) == ['a.json', 'b.json']
+        assert manifest['a.json']['rows'] == 3
+        assert manifest['a.json']['size'] == 9
+        assert manifest['a.json']['hash']
+
+    def test_load_missing(self):
+        assert load_manifest(self.manifest_path) == dict()
+
+    def test_find_changed(self):
+        manifest = dict()
+        assert self._ingest(manifest) == self.paths
+
+        with open(self.paths[1], 'w') as raw_file:
+            raw_file.write('[1, 2, 3, 4]')
+
+        assert self._ingest(manifest) == self.paths[1:]
+        assert self._ingest(manifest) == []
+
+    def test_find_changed_touched(self):
+        manifest = dict()
+        self._ingest(manifest)
+        os.utime(self.paths[0], ns=(0, 0))
+
+        assert self._ingest(manifest) == []
+        assert manifest['a.json']['mtime_ns'] == 0
+
+    def test_find_changed_same_size(self):
+        manifest = dict()
+        self._ingest(manifest)
+        with open(self.paths[0], 'w') as raw_file:
+            raw_file.write('[3, 2, 1]')
+
+        os.utime(self.paths[0], ns=(1, 1))
+
+        assert self._ingest(manifest) == self.paths[:1]
+
+
+class TestMergeOutput(TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp_dir.name, 'output', 'data.csv')
+        self.data = pd.DataFrame({
+            'turbine_id': ['T001', 'T001'],
+            'signal_id': ['Signal_1', 'Signal_2'],
+            'timestamp': pd.to_datetime(['2020-01-01', '2020-01-01']),
+            'values': [[1, 2], [3]],
+        })
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_merge_output(self):
+        merge_output(self.data, self.path)
+        new = pd.DataFrame({
+            'turbine_id': ['T001', 'T002'],
+            'signal_id': ['Signal_2', 'Signal_1'],
+            'timestamp': pd.to_datetime(['2020-01-01', '2020-01-01']),
+            'values': [[4], [5]],
+        })
+
+        merge_output(new, self.path)
+
+        written = pd.read_csv(self.path)
+        assert written['turbine_id'].tolist() == ['T001', 'T001', 'T002']
+        assert written['values'].tolist() == ['[1, 2]', '[4]', '[5]']
+
+    def test_merge_output_numeric_ids(self):
+        data = self.data.assign(turbine_id=['1001', '1001'])
+        merge_output(data, self.path)
+
+        merged = merge_output(data.iloc[1:].assign(values=[[4]]), self.path)
+
+        assert merged['turbine_id'].tolist() == ['1001', '1001']
+        assert merged['values'].tolist() == ['[1, 2]', [4]]
+        written = pd.read_csv(self.path)
+        assert written['signal_id'].tolist() == ['Signal_1', 'Signal_2']
+
+    def test_merge_output_empty(self):
+        merge_output(self.data, self.path)
+
+        returned = merge_output(pd.DataFrame(), self.path)
+
+        assert returned['values'].tolist() == ['[1, 2]', '[3]']
+
+    def test_append_output(self):
+        append_output(self.data, self.path)
+        new = self.data.iloc[:1].assign(rpm=1500)
+
+        append_output(new, self.path)
+        append_output(pd.DataFrame(), self.path)
+
+        written = pd.read_csv(self.path)
+        assert written.columns.tolist() == [
+            'turbine_id', 'signal_id', 'timestamp', 'values', 'rpm']
+        assert written['signal_id'].tolist() == ['Signal_1', 'Signal_2', 'Signal_1']
+        assert written['values'].tolist() == self.data['values'].astype(str).tolist() + [
+            str(self.data['values'][0])]
+        assert written['rpm'].isnull().tolist() == [True, True, False]
@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for cms_ml.schema."""
+from unittest import TestCase
+
+import numpy as np
+import pandas as pd
+
+from cms_ml.schema import apply_schema, compact_context, concat_compact, infer_schema
+
+
+class TestSchema(TestCase):
+    def setUp(self):
+        self.data = pd.DataFrame({
+            'signal_id': ['S1', 'S1', 'S1', 'S1'],
+            'sensorName': ['Sensor_1', 'Sensor_1', 'Sensor_2', 'Sensor_1'],
+            'power': ['1733.3', '1900', None, '1657.5'],
+            'rpm': [1451, 1200, 1300, 1500],
+            'count': ['1', '2', '3', '4'],
+            'comment': ['a', 'b', 'c', 'd'],
+            'mixed': ['1', 'a', None, None],
+            'empty': [None] * 4,
+        })
+
+    def test_infer_schema(self):
+        returned = infer_schema(self.data)
+
+        assert returned == {
+            'sensorName': 'category',
+            'power': 'float32',
+            'rpm': 'int32',
+            'count': 'int32',
+            'mixed': 'category',
+        }
+
+    def test_infer_schema_padded_ids(self):
+        data = pd.DataFrame({
+            'sensor_id': ['007', '0012', '0012', '007'],
+            'channel': ['1', '2', '2', '1'],
+            'gain': ['1.50', '2', '2', '1.50'],
+        })
+
+        returned = infer_schema(data)
+
+        assert returned == {'sensor_id': 'category', 'channel': 'int32', 'gain': 'category'}
+
+    def test_apply_schema(self):
+        returned = apply_schema(self.data, {'power': 'int32', 'comment': 'float32'})
+
+        assert returned['power'].dtype == np.float32
+        np.testing.assert_allclose(returned['power'], [1733.3, 1900, np.nan, 1657.5])
+        assert returned['comment'].isnull().all()
+        assert self.data['power'].dtype == object
+
+    def test_compact_context(self):
+        returned = compact_context(self.data, schema={'count': 'object'})
+
+        assert returned['signal_id'].dtype == object
+        assert returned['sensorName'].dtype == 'category'
+        assert returned['count'].tolist() == ['1', '2', '3', '4']
+        assert returned['rpm'].dtype == np.int32
+        assert returned.memory_usage(deep=True).sum() < self.data.memory_usage(deep=True).sum()
+
+    def test_concat_compact(self):
+        schema = {'sensorName': 'category'}
+        first = compact_context(self.data.iloc[:2], schema)
+        second = compact_context(self.data.iloc[2:], schema)
+
+        returned = concat_compact([first, second])
+
+        assert returned['sensorName'].dtype == 'category'
+        assert returned['sensorName'].tolist() == self.data['sensorName'].tolist()
+        assert returned['rpm'].tolist() == self.data['rpm'].tolist()
@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for cms_ml.sidecar."""
+import os
+import tempfile
+from unittest import TestCase
+from unittest.mock import patch
+
+import numpy as np
+import pandas as pd
+
+from cms_ml.sidecar import get_sidecar_path, read_sidecar, write_sidecar
+from cms_ml.spectra import SpectrumBatch
+from cms_ml.utils import load_fft_csv
+
+
+class SidecarTestCase(TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp_dir.name, 'fft.csv')
+        self.sidecar_path = get_sidecar_path(self.path)
+        pd.DataFrame({
+            'turbine_id': ['T001', None, 'T002'],
+            'signal_id': ['Signal_1', 'Signal_2', 'Signal_1'],
+            'timestamp': ['2020-01-01T00:00:00+01:00', '2020-01-02T00:00:00+01:00',
+                          '2020-01-03T00:00:00+01:00'],
+            'rpm': [1500, 1600, 1700],
+            'values': ['[1, 2]', '[3, 4, 5]', '[6]'],
+        }).to_csv(self.path, index=False)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+
+class TestSidecar(SidecarTestCase):
+    def test_write_read(self):
+        batch = load_fft_csv(self.path, batch=True, cache=False)
+
+        write_sidecar(batch, self.sidecar_path, self.path)
+        returned = read_sidecar(self.sidecar_path, self.path)
+
+        assert isinstance(returned.values.base, np.memmap)
+        np.testing.assert_array_equal(returned.values, batch.values)
+        np.testing.assert_array_equal(returned.offsets, batch.offsets)
+        pd.testing.assert_frame_equal(returned.metadata, batch.metadata)
+
+    def test_read_missing(self):
+        assert read_sidecar(self.sidecar_path, self.path) is None
+
+    def test_read_outdated(self):
+        write_sidecar(load_fft_csv(self.path, batch=True, cache=False),
+                      self.sidecar_path, self.path)
+
+        with open(self.path, 'a') as csv_file:
+            csv_file.write('T003,Signal_1,2020-01-04T00:00:00+01:00,1800,"[7]"\n')
+
+        assert read_sidecar(self.sidecar_path, self.path) is None
+
+    def test_read_touched(self):
+        write_sidecar(load_fft_csv(self.path, batch=True, cache=False),
+                      self.sidecar_path, self.path)
+        os.utime(self.path, ns=(0, 0))
+
+        assert read_sidecar(self.sidecar_path, self.path) is not None
+        with patch('cms_ml.sidecar.hashlib') as hashlib_mock:
+            assert read_sidecar(self.sidecar_path, self.path) is not None
+
+        hashlib_mock.blake2b.assert_not_called()
+
+    def test_read_invalid(self):
+        with open(self.sidecar_path, 'wb') as sidecar_file:
+            sidecar_file.write(b'not a sidecar')
+
+        assert read_sidecar(self.sidecar_path, self.path) is None
+
+    def test_empty(self):
+        batch = SpectrumBatch.from_values([], pd.DataFrame({'signal_id': []}))
+
+        write_sidecar(batch, self.sidecar_path, self.path)
+        returned = read_sidecar(self.sidecar_path, self.path)
+
+        assert len(returned) == 0
+
+
+class TestLoadFFTCSVCache(SidecarTestCase):
+    def test_load_fft_csv_cache(self):
+        expected = load_fft_csv(self.path, cache=False)
+
+        first = load_fft_csv(self.path)
+        with patch('cms_ml.utils.pd.read_csv') as read_csv_mock:
+            second = load_fft_csv(self.path)
+
+        read_csv_mock.assert_not_called()
+        assert os.path.isfile(self.sidecar_path)
+        pd.testing.assert_frame_equal(expected, first)
+        pd.testing.assert_frame_equal(expected, second)
+
+    def test_load_fft_csv_no_cache(self):
+        load_fft_csv(self.path, cache=False)
+
+        assert not os.path.isfile(self.sidecar_path)
+
+    def test_load_fft_csv_chunksize(self):
+        load_fft_csv(self.path)
+
+        chunks = list(load_fft_csv(self.path, batch=True, chunksize=2))
+
+        assert [len(chunk) for chunk in chunks] == [2, 1]
+        np.testing.assert_array_equal(chunks[1].values, [6])
@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for cms_ml.spectra."""
+from unittest import TestCase
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from cms_ml.spectra import SpectrumBatch, get_vectorized
+
+
+class TestSpectrumBatch(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.metadata = pd.DataFrame({
+            'signal_id': ['Signal_1', 'Signal_2', 'Signal_1', 'Signal_2'],
+            'timestamp': pd.to_datetime(['2020-01-01', '2020-01-01', '2020-01-02', '2020-01-02']),
+        })
+        cls.ragged = [[1, 2, 3], [4, 5], [6, 7, 8], [9, 10]]
+        cls.uniform = [[1, 2, 3], [4, 5, 6], [7, 8, 9], [10, 11, 12]]
+
+    def test_from_values(self):
+        batch = SpectrumBatch.from_values(self.ragged, self.metadata)
+
+        np.testing.assert_array_equal(batch.values, np.arange(1, 11))
+        np.testing.assert_array_equal(batch.offsets, [0, 3, 5, 8, 10])
+        np.testing.assert_array_equal(batch[1], [4, 5])
+        assert len(batch) == 4
+        assert not batch.is_uniform
+
+    def test_from_values_empty(self):
+        batch = SpectrumBatch.from_values([])
+
+        assert len(batch) == 0
+        assert len(batch.reduce('mean')) == 0
+
+    def test_invalid_offsets(self):
+        with pytest.raises(ValueError):
+            SpectrumBatch(np.arange(5), [0, 2, 4])
+
+    def test_as_matrix(self):
+        batch = SpectrumBatch.from_values(self.uniform)
+
+        matrix = batch.as_matrix()
+
+        assert matrix.shape == (4, 3)
+        assert matrix.base is batch.values
+
+    def test_as_matrix_ragged(self):
+        batch = SpectrumBatch.from_values(self.ragged)
+
+        with pytest.raises(ValueError):
+            batch.as_matrix()
+
+    def test_take(self):
+        batch = SpectrumBatch.from_values(self.ragged, self.metadata)
+
+        taken = batch.take([False, True, True, False])
+
+        np.testing.assert_array_equal(taken.values, [4, 5, 6, 7, 8])
+        np.testing.assert_array_equal(taken.offsets, [0, 2, 5])
+        assert taken.metadata['signal_id'].tolist() == ['Signal_2', 'Signal_1']
+
+    def test_to_dataframe(self):
+        batch = SpectrumBatch.from_values(self.ragged, self.metadata)
+
+        returned = batch.to_dataframe()
+
+        expected = self.metadata.copy()
+        expected['values'] = [[1., 2., 3.], [4., 5.], [6., 7., 8.], [9., 10.]]
+        pd.testing.assert_frame_equal(expected, returned)
+
+    def test_reduce_matches_numpy(self):
+        for values in (self.ragged, self.uniform):
+            batch = SpectrumBatch.from_values(values)
+            for name, function in (('mean', np.mean), ('std', np.std), ('max', np.max)):
+                expected = [function(np.array(row, dtype=float)) for row in values]
+                np.testing.assert_array_equal(batch.reduce(name), expected)
+                np.testing.assert_array_equal(batch.reduce(function), expected)
+
+    def test_reduce_rms(self):
+        batch = SpectrumBatch.from_values(self.ragged)
+
+        expected = [np.sqrt(np.mean(np.square(row))) for row in self.ragged]
+        np.testing.assert_allclose(batch.reduce('rms'), expected)
+
+    def test_reduce_callable(self):
+        batch = SpectrumBatch.from_values(self.ragged)
+
+        returned = batch.reduce(lambda values: values[0])
+
+        assert returned.dtype == float
+        np.testing.assert_array_equal(returned, [1, 4, 6, 9])
+
+    def test_reduce_raw(self):
+        batch = SpectrumBatch.from_values(self.ragged)
+
+        returned = batch.reduce(lambda values: values)
+
+        assert returned.dtype == object
+        assert returned[1] == [4., 5.]
+
+
+def test_get_vectorized():
+    assert get_vectorized(np.mean) is get_vectorized('mean')
+    assert get_vectorized(len) is None
+
+    with pytest.raises(ValueError):
+        get_vectorized('unknown')
@@ -0,0 +1,164 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for cms_ml.storage."""
+import os
+import tempfile
+from unittest import TestCase
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from cms_ml.spectra import SpectrumBatch
+from cms_ml.storage import (
+    check_output_format, clear_partitioned, merge_partitioned, read_partitioned, write_partitioned)
+
+pytest.importorskip('pyarrow')
+
+
+class TestPartitioned(TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp_dir.name, 'dataset')
+        self.data = pd.DataFrame({
+            'turbine_id': ['T001', 'T001', 'T002', '003'],
+            'signal_id': ['Signal_1', 'Signal_2', 'Signal_1', 'Signal_1'],
+            'timestamp': pd.to_datetime(
+                ['2020-01-05', '2020-02-01', '2020-01-03', '2020-03-01']),
+            'rpm': [1.5, 2., 3., 4.],
+            'values': [[1, 2], [3, 4, 5], [6], [7, 8]],
+        })
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def _read_sorted(self, **kwargs):
+        data = read_partitioned(self.path, **kwargs)
+        return data.sort_values('timestamp').reset_index(drop=True)
+
+    def test_write_read(self):
+        write_partitioned(self.data, self.path)
+
+        returned = self._read_sorted()
+
+        expected = self.data.sort_values('timestamp').reset_index(drop=True)
+        assert returned.columns.tolist() == expected.columns.tolist()
+        assert returned['turbine_id'].tolist() == expected['turbine_id'].tolist()
+        assert returned['rpm'].dtype == float
+        for values, expected_values in zip(returned['values'], expected['values']):
+            np.testing.assert_array_equal(values, expected_values)
+
+        partitions = sorted(os.listdir(os.path.join(self.path, 'turbine_id=T001')))
+        assert partitions == ['month=2020-01', 'month=2020-02']
+
+    def test_read_pruning(self):
+        write_partitioned(self.data, self.path)
+
+        returned = read_partitioned(self.path, columns=['signal_id', 'timestamp'],
+                                    turbines=['T001'], start_time='2020-01-10')
+
+        assert returned.columns.tolist() == ['signal_id', 'timestamp']
+        assert returned['signal_id'].tolist() == ['Signal_2']
+
+    def test_read_time_range_utc(self):
+        data = self.data.assign(timestamp=pd.to_datetime(
+            ['2020-01-05 12:00', '2020-02-01', '2020-01-03', '2020-03-01'], utc=True))
+        write_partitioned(data, self.path)
+
+        returned = self._read_sorted(start_time='2020-01-04', end_time='2020-03-01')
+
+        assert returned['signal_id'].tolist() == ['Signal_1', 'Signal_2']
+        assert returned['timestamp'].tolist() == [
+            pd.Timestamp('2020-01-05 12:00'), pd.Timestamp('2020-02-01')]
+
+    def test_read_batch(self):
+        batch = SpectrumBatch.from_dataframe(self.data)
+        write_partitioned(batch, self.path)
+
+        returned = read_partitioned(self.path, signals=['Signal_1'], end_time='2020-02-01',
+                                    batch=True)
+
+        assert isinstance(returned, SpectrumBatch)
+        assert sorted(returned.metadata['turbine_id']) == ['T001', 'T002']
+        assert sorted(map(list, returned)) == [[1., 2.], [6.]]
+
+    def test_fixed_size(self):
+        batch = SpectrumBatch.from_values([[1, 2], [3, 4]], self.data.iloc[:2])
+        write_partitioned(batch, self.path, fixed_size=True)
+
+        returned = read_partitioned(self.path, batch=True)
+
+        np.testing.assert_array_equal(returned.as_matrix(), [[1, 2], [3, 4]])
+
+    def test_append_and_replace(self):
+        write_partitioned(self.data, self.path)
+        write_partitioned(self.data, self.path, append=True)
+        assert len(read_partitioned(self.path)) == 8
+
+        write_partitioned(self.data[self.data['turbine_id'] == 'T002'], self.path)
+        counts = read_partitioned(self.path)['turbine_id'].value_counts()
+        assert counts.to_dict() == {'T001': 4, '003': 2, 'T002': 1}
+
+    def test_clear_partitioned(self):
+        write_partitioned(self.data, self.path)
+        other = os.path.join(self.path, 'notes.txt')
+        open(other, 'w').close()
+
+        clear_partitioned(self.path)
+
+        assert os.listdir(self.path) == ['notes.txt']
+
+    def test_categorical(self):
+        first = self.data.iloc[:2].astype({'signal_id': 'category'})
+        second = self.data.iloc[2:].astype({'signal_id': 'category'})
+        second['signal_id'] = second['signal_id'].cat.add_categories(
+            ['Other_{}'.format(index) for index in range(200)])
+        write_partitioned(first, self.path)
+        write_partitioned(second, self.path, append=True)
+
+        returned = self._read_sorted()
+
+        assert returned['signal_id'].dtype == 'category'
+        assert returned['signal_id'].tolist() == ['Signal_1', 'Signal_1', 'Signal_2', 'Signal_1']
+
+    def test_merge_partitioned(self):
+        write_partitioned(self.data, self.path)
+        new = pd.DataFrame({
+            'turbine_id': ['T001', 'T001'],
+            'signal_id': ['Signal_1', 'Signal_3'],
+            'timestamp': pd.to_datetime(['2020-01-05', '2020-01-06']),
+            'rpm': [9., 10.],
+            'values': [[9], [10]],
+        })
+
+        merge_partitioned(new, self.path, ['turbine_id', 'signal_id', 'timestamp'])
+
+        returned = self._read_sorted()
+        assert returned['turbine_id'].tolist() == ['T002', 'T001', 'T001', 'T001', '003']
+        assert returned['rpm'].tolist() == [3., 9., 10., 2., 4.]
+
+    def test_merge_partitioned_untouched_months(self):
+        write_partitioned(self.data, self.path)
+        month = os.path.join(self.path, 'turbine_id=T001', 'month=2020-02')
+        files = {name: os.path.getmtime(os.path.join(month, name)) for name in os.listdir(month)}
+        new = self.data.iloc[[0]].assign(
+            timestamp=pd.to_datetime(['2020-01-05']).tz_localize('Europe/Madrid'), rpm=9.)
+
+        merge_partitioned(new, self.path, ['turbine_id', 'signal_id', 'timestamp'])
+
+        returned = self._read_sorted()
+        assert {
+            name: os.path.getmtime(os.path.join(month, name)) for name in os.listdir(month)
+        } == files
+        assert returned['timestamp'].tolist() == pd.to_datetime(
+            ['2020-01-03', '2020-01-04 23:00', '2020-01-05', '2020-02-01', '2020-03-01']).tolist()
+        assert returned['rpm'].tolist() == [3., 9., 1.5, 2., 4.]
+
+
+def test_check_output_format():
+    check_output_format('csv')
+    check_output_format('parquet')
+
+    with pytest.raises(ValueError):
+        check_output_format('xlsx')
@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for cms_ml.utils."""
+import os
+import tempfile
+from unittest import TestCase
+
+import numpy as np
+import pandas as pd
+
+from cms_ml.spectra import SpectrumBatch
+from cms_ml.utils import filter_values, load_fft_csv
+
+
+class TestLoadFFTCSV(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp_dir = tempfile.TemporaryDirectory()
+        cls.path = os.path.join(cls.tmp_dir.name, 'fft.csv')
+        pd.DataFrame({
+            'turbine_id': ['T001', 'T001', 'T002'],
+            'signal_id': ['Signal_1', 'Signal_2', 'Signal_1'],
+            'timestamp': ['2020-01-01', '2020-01-02', '2020-01-03'],
+            'values': ['[1, 2]', '[3, 4, 5]', '[6]'],
+        }).to_csv(cls.path, index=False)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.tmp_dir.cleanup()
+
+    def test_load_fft_csv(self):
+        returned = load_fft_csv(self.path)
+
+        assert returned['values'].tolist() == [[1, 2], [3, 4, 5], [6]]
+        assert returned['timestamp'].dtype == 'datetime64[ns]'
+
+    def test_load_fft_csv_batch(self):
+        returned = load_fft_csv(self.path, batch=True)
+
+        assert isinstance(returned, SpectrumBatch)
+        np.testing.assert_array_equal(returned.offsets, [0, 2, 5, 6])
+        assert returned.metadata.columns.tolist() == ['turbine_id', 'signal_id', 'timestamp']
+
+    def test_load_fft_csv_chunksize(self):
+        returned = list(load_fft_csv(self.path, batch=True, chunksize=2))
+
+        assert [len(chunk) for chunk in returned] == [2, 1]
+        np.testing.assert_array_equal(returned[1].values, [6])
+        assert returned[1].metadata.index.tolist() == [0]
+
+
+class TestFilterValues(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.data = pd.DataFrame({
+            'turbine_id': ['T001', 'T001', 'T002', 'T002'],
+            'signal_id': ['Signal_1', 'Signal_2', 'Signal_1', 'Signal_2'],
+            'timestamp': pd.to_datetime(['2020-01-01', '2020-01-02', '2020-01-03', '2020-01-04']),
+            'values': [[1, 2], [3, 4, 5], [6], [7, 8]],
+        })
+
+    def test_filter_values(self):
+        returned = filter_values(self.data, start_time='2020-01-02', signals=['Signal_1'])
+
+        assert returned.index.tolist() == [2]
+
+    def test_filter_values_batch(self):
+        batch = SpectrumBatch.from_dataframe(self.data)
+
+        returned = filter_values(batch, end_time='2020-01-04', turbines=['T002'])
+
+        assert isinstance(returned, SpectrumBatch)
+        assert returned.metadata['signal_id'].tolist() == ['Signal_1']
+        np.testing.assert_array_equal(returned.values, [6])
+
+    def test_filter_values_exact(self):
+        data = self.data.assign(signal_id=['Signal_1', 'Signal_11', 'Signal_1', 'Signal_11'])
+
+        exact = filter_values(data, signals=['Signal_1'])
+        contains = filter_values(data, signals=['signal_1'], match='contains')
+
+        assert exact.index.tolist() == [0, 2]
+        assert contains.index.tolist() == [0, 1, 2, 3]
+
+    def test_filter_values_reuses_index(self):
+        batch = SpectrumBatch.from_dataframe(self.data)
+
+        filter_values(batch, turbines=['T001'])
+        index = batch.get_index()
+        filter_values(batch, turbines=['T002'])
+
+        assert batch.get_index() is index
@@ -0,0 +1,54 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for cms_ml.watermarks."""
+import os
+import tempfile
+from unittest import TestCase
+
+import numpy as np
+import pandas as pd
+
+from cms_ml.watermarks import find_new, load_watermarks, save_watermarks, update_watermarks
+
+
+class TestWatermarks(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.metadata = pd.DataFrame({
+            'turbine_id': ['T001', 'T001', 'T001', 'T002'],
+            'signal_id': ['Signal_1', 'Signal_1', 'Signal_2', 'Signal_1'],
+            'timestamp': pd.to_datetime(['2020-01-01', '2020-01-02', '2020-01-03',
+                                         '2020-01-04']),
+        })
+
+    def test_find_new(self):
+        watermarks = {('T001', 'Signal_1', 'mean'): pd.Timestamp('2020-01-01')}
+
+        returned = find_new(self.metadata, ['mean', 'std'], watermarks)
+
+        np.testing.assert_array_equal(returned['mean'], [False, True, True, True])
+        np.testing.assert_array_equal(returned['std'], [True, True, True, True])
+
+    def test_update_watermarks(self):
+        watermarks = {('T002', 'Signal_1', 'mean'): pd.Timestamp('2020-02-01')}
+        masks = {'mean': np.array([True, True, False, True])}
+
+        update_watermarks(watermarks, self.metadata, masks)
+
+        assert watermarks == {
+            ('T001', 'Signal_1', 'mean'): pd.Timestamp('2020-01-02'),
+            ('T002', 'Signal_1', 'mean'): pd.Timestamp('2020-02-01'),
+        }
+
+    def test_save_load_watermarks(self):
+        watermarks = {('T001', 'Signal_1', 'mean'): pd.Timestamp('2020-01-02 10:00:00')}
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, 'output.csv.watermarks.json')
+            assert load_watermarks(path) == dict()
+
+            save_watermarks(watermarks, path)
+
+            assert load_watermarks(path) == watermarks
+            assert os.listdir(tmp_dir) == ['output.csv.watermarks.json']